@@ -4,6 +4,10 @@ import os
 import sys
 import json
 
+# Share the preprocessing spec implementation with the backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'ml'))
+from preprocessing import load_image, load_spec
+
 # Define class names from the model
 class_names = [
     'Anthracnose',
@@ -16,11 +20,12 @@ class_names = [
     'white spot'
 ]
 
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'trained_model.keras')
+
 def load_model():
     """Load the trained Keras model"""
     try:
-        model_path = os.path.join(os.path.dirname(__file__), 'trained_model.keras')
-        model = tf.keras.models.load_model(model_path)
+        model = tf.keras.models.load_model(MODEL_PATH)
         return model
     except Exception as e:
         print(json.dumps({
@@ -34,10 +39,9 @@ def predict_disease(image_path):
     try:
         model = load_model()
         
-        # Preprocess the image
-        image = tf.keras.preprocessing.image.load_img(image_path, target_size=(128, 128))
-        input_arr = tf.keras.preprocessing.image.img_to_array(image)
-        input_arr = np.array([input_arr])  # Convert single image to a batch
+        # Preprocess the image with the spec stored next to the model
+        spec = load_spec(MODEL_PATH, input_shape=model.input_shape)
+        input_arr, _ = load_image(image_path, spec)
         
         # Make prediction
         prediction = model.predict(input_arr)
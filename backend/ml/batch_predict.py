@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Set
+
+import numpy as np
+
+from disease_classes import CLASS_LABELS, build_response
+from model_registry import ModelRegistry
+from preprocessing import DECODE_THREADS, allocate_batch, decode_into
+from response_codec import ERROR, RESULT, decode_frame, encode_hello, encode_response, iter_frames
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+# One probability column per class; 'is_healthy' avoids clashing with the 'healthy' class column
+CSV_FIELDS = ['image_path', 'success', 'prediction', 'confidence', 'is_healthy', 'error'] + CLASS_LABELS
+
+
+def iter_image_paths(target: str) -> Iterator[str]:
+    """
+    Stream image paths from a directory (recursively, in sorted order) or a glob pattern
+    """
+    if os.path.isdir(target):
+        for root, dirs, files in os.walk(target):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    yield os.path.join(root, name)
+    else:
+        for path in glob.iglob(target, recursive=True):
+            if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS):
+                yield path
+
+
+def _truncate_partial_line(path: str) -> None:
+    # A crash can leave half a line at the end of the file; drop it before appending
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+
+def _truncate_partial_frame(path: str) -> None:
+    # Binary output: drop a frame that was cut off mid-write
+    with open(path, 'rb+') as f:
+        data = f.read()
+        offset = 0
+        while offset < len(data):
+            try:
+                offset = decode_frame(data, offset)[3]
+            except ValueError:
+                f.truncate(offset)
+                break
+
+
+def read_completed(output_path: str, fmt: str) -> Set[str]:
+    """Paths already written to a previous (possibly interrupted) run's output"""
+    if not os.path.exists(output_path):
+        return set()
+
+    if fmt == 'binary':
+        _truncate_partial_frame(output_path)
+        with open(output_path, 'rb') as f:
+            return {key for kind, key, _ in iter_frames(f) if kind in (RESULT, ERROR)}
+
+    _truncate_partial_line(output_path)
+    completed = set()
+    with open(output_path, newline='') as f:
+        if fmt == 'csv':
+            for row in csv.DictReader(f):
+                completed.add(row['image_path'])
+        else:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)['image_path'])
+                except (ValueError, KeyError):
+                    continue
+    return completed
+
+
+class ResultWriter:
+    """
+    Appends one result per image and flushes after every batch so a crash loses at most one batch.
+
+    The binary format (response_codec.py) starts with a HELLO frame holding
+    the label and treatment tables, followed by one frame per image keyed by
+    its path.
+    """
+
+    def __init__(self, output_path: str, fmt: str):
+        self.fmt = fmt
+        new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+        self._file = open(output_path, 'ab') if fmt == 'binary' else open(output_path, 'a', newline='')
+        self._csv = None
+        if fmt == 'binary' and new_file:
+            self._file.write(encode_hello())
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(self._file, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            if new_file:
+                self._csv.writeheader()
+
+    def write(self, image_path: str, result: dict) -> None:
+        if self.fmt == 'binary':
+            self._file.write(encode_response(result, key=image_path))
+        elif self._csv is not None:
+            row = {
+                'image_path': image_path,
+                'success': result.get('success', False),
+                'prediction': result.get('prediction', ''),
+                'confidence': result.get('confidence', ''),
+                'is_healthy': result.get('is_healthy', ''),
+                'error': result.get('error', '')
+            }
+            for item in result.get('all_predictions', []):
+                row[item['disease']] = item['confidence']
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(dict(image_path=image_path, **result)) + '\n')
+
+    def flush(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _chunks(paths: Iterator[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(target: str, output_path: str, fmt: str = 'jsonl', batch_size: int = 32,
+              decode_threads: int = DECODE_THREADS, prefetch: int = 2, resume: bool = True,
+              registry: ModelRegistry = None) -> dict:
+    """
+    Score every image under target and append the results to output_path.
+
+    Decoding runs in a thread pool up to `prefetch` batches ahead of the
+    forward pass, so the model is kept busy while the next batch is read.
+    With resume enabled, images already present in the output are skipped.
+    """
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    registry = registry or ModelRegistry()
+    loaded = registry.get()
+    spec = loaded.spec
+    logger.info(f"Batch scoring {target} with model {loaded.version} (batch size {batch_size}, {decode_threads} decode threads)")
+
+    completed = read_completed(output_path, fmt) if resume else set()
+    if completed:
+        logger.info(f"Resuming: {len(completed)} images already scored in {output_path}")
+    elif not resume and os.path.exists(output_path):
+        os.remove(output_path)
+
+    writer = ResultWriter(output_path, fmt)
+    skipped = 0
+
+    def unscored():
+        # Only images under target count as skipped, not everything in the old output
+        nonlocal skipped
+        for path in iter_image_paths(target):
+            if path in completed:
+                skipped += 1
+            else:
+                yield path
+
+    paths = unscored()
+    processed = failed = 0
+    inference_seconds = 0.0
+    start = time.perf_counter()
+    pending = deque()
+
+    def submit(chunk):
+        buffer = allocate_batch(len(chunk), spec)
+        futures = [executor.submit(decode_into, path, buffer[i], spec) for i, path in enumerate(chunk)]
+        pending.append((chunk, buffer, futures))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(decode_threads, 1)) as executor:
+            chunks = _chunks(paths, batch_size)
+            for chunk in chunks:
+                submit(chunk)
+                if len(pending) > prefetch:
+                    break
+
+            while pending:
+                chunk, buffer, futures = pending.popleft()
+
+                # Keep the decoder busy on the next batch while this one runs
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    submit(next_chunk)
+
+                ok_rows, errors = [], {}
+                for i, future in enumerate(futures):
+                    try:
+                        future.result()
+                        ok_rows.append(i)
+                    except Exception as e:
+                        errors[i] = str(e)
+
+                probabilities = None
+                if ok_rows:
+                    batch = buffer if len(ok_rows) == len(chunk) else buffer[ok_rows]
+                    inference_start = time.perf_counter()
+                    probabilities = np.asarray(loaded.predict_fn(batch))
+                    inference_seconds += time.perf_counter() - inference_start
+
+                row_of = {index: position for position, index in enumerate(ok_rows)}
+                for i, path in enumerate(chunk):
+                    if i in errors:
+                        result = {"success": False, "error": f"Failed to process image: {errors[i]}"}
+                        failed += 1
+                    else:
+                        result = build_response(probabilities[row_of[i]])
+                    writer.write(path, result)
+                writer.flush()
+
+                processed += len(chunk)
+                elapsed = time.perf_counter() - start
+                logger.info(f"Scored {processed} images ({processed / elapsed:.1f} images/sec)")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "success": True,
+        "output": os.path.abspath(output_path),
+        "format": fmt,
+        "model_version": loaded.version,
+        "processed": processed,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "images_per_second": (processed / elapsed) if elapsed > 0 else 0.0,
+        "inference_seconds": inference_seconds
+    }
+    logger.info(f"Batch complete: {processed} images in {elapsed:.1f}s ({summary['images_per_second']:.1f} images/sec)")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a directory or glob of tea leaf images")
+    parser.add_argument("target", help="Directory (scanned recursively) or glob pattern, e.g. 'survey/**/*.jpg'")
+    parser.add_argument("--output", default="batch_predictions.jsonl", help="Results file (appended to incrementally)")
+    parser.add_argument("--format", choices=["jsonl", "csv", "binary"],
+                        help="Output format (default: from the output extension, .csv or .bin)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass (at least 1)")
+    parser.add_argument("--decode-threads", type=int, default=DECODE_THREADS)
+    parser.add_argument("--no-resume", action="store_true", help="Start over instead of skipping images already in the output")
+    args = parser.parse_args(argv)
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+
+    extension = os.path.splitext(args.output.lower())[1]
+    fmt = args.format or {'.csv': 'csv', '.bin': 'binary'}.get(extension, 'jsonl')
+
+    try:
+        summary = run_batch(args.target, args.output, fmt, args.batch_size,
+                            args.decode_threads, resume=not args.no_resume)
+    except Exception as e:
+        logger.error(f"Batch scoring failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    print(json.dumps(summary))
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(main())
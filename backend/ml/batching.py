@@ -0,0 +1,184 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden per deployment without code changes
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get('TEA_MAX_BATCH_SIZE', '8'))
+DEFAULT_MAX_WAIT_MS = float(os.environ.get('TEA_MAX_BATCH_WAIT_MS', '5'))
+
+
+class _PendingRequest:
+    def __init__(self, inputs: np.ndarray, predict_fn: Optional[Callable] = None):
+        self.inputs = inputs
+        self.predict_fn = predict_fn
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent prediction requests into a single forward pass.
+
+    A background thread takes the first queued request, then keeps collecting
+    until either max_batch_size rows are queued or max_wait_ms has passed
+    since that first request arrived. The batch is run through predict_fn
+    once and each caller receives its own slice of the output.
+
+    A request may name its own predict_fn (e.g. the model version it was
+    preprocessed for). A batch only ever holds requests for the same
+    function; the first request for another one starts the next batch.
+    """
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], np.ndarray],
+                 max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms: float = DEFAULT_MAX_WAIT_MS,
+                 name: str = 'model'):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(max_wait_ms, 0.0) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        # Request taken from the queue that belongs to the next batch (different predict_fn)
+        self._carry = None
+        self._closed = False
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}
+        self._requests = 0
+        self._batches = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+        self._thread = threading.Thread(target=self._run, name=f"{name}-batcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Micro-batcher '{name}' started (max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+
+    def submit(self, inputs: np.ndarray, predict_fn: Optional[Callable] = None) -> Future:
+        """
+        Queue an input batch (usually of size 1) and return a Future for its
+        predictions, computed by predict_fn (default: the batcher's own)
+        """
+        if self._closed:
+            raise RuntimeError(f"Micro-batcher '{self.name}' is closed")
+        request = _PendingRequest(inputs, predict_fn or self.predict_fn)
+        self._queue.put(request)
+        return request.future
+
+    def predict(self, inputs: np.ndarray, predict_fn: Optional[Callable] = None) -> np.ndarray:
+        """Blocking helper: queue the inputs and wait for their predictions"""
+        return self.submit(inputs, predict_fn).result()
+
+    def close(self) -> None:
+        """Stop accepting requests and let the worker drain the queue"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def _collect(self, first: _PendingRequest) -> List[_PendingRequest]:
+        batch = [first]
+        rows = len(first.inputs)
+        deadline = first.enqueued_at + self.max_wait
+
+        while rows < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                # Re-queue the shutdown marker so the run loop sees it
+                self._queue.put(None)
+                break
+            if request.predict_fn is not first.predict_fn:
+                self._carry = request
+                break
+            batch.append(request)
+            rows += len(request.inputs)
+
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            first, self._carry = self._carry, None
+            if first is None:
+                first = self._queue.get()
+            if first is None:
+                break
+
+            batch = self._collect(first)
+            started = time.monotonic()
+            self._record(batch, started)
+
+            try:
+                predict_fn = first.predict_fn
+                if len(batch) == 1:
+                    outputs = np.asarray(predict_fn(batch[0].inputs))
+                else:
+                    outputs = np.asarray(predict_fn(np.concatenate([r.inputs for r in batch], axis=0)))
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                rows = len(request.inputs)
+                request.future.set_result(outputs[offset:offset + rows])
+                offset += rows
+
+    def _record(self, batch: List[_PendingRequest], started: float) -> None:
+        rows = sum(len(r.inputs) for r in batch)
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[rows] = self._batch_sizes.get(rows, 0) + 1
+            for request in batch:
+                wait = started - request.enqueued_at
+                self._wait_total += wait
+                if wait > self._wait_max:
+                    self._wait_max = wait
+
+    def get_stats(self) -> Dict:
+        """Batch-size histogram and queue wait times, in milliseconds"""
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "requests": self._requests,
+                "batches": self._batches,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "mean_batch_size": (sum(size * count for size, count in self._batch_sizes.items()) / self._batches) if self._batches else 0.0,
+                "queue_wait_ms": {
+                    "mean": (self._wait_total / self._requests * 1000.0) if self._requests else 0.0,
+                    "max": self._wait_max * 1000.0
+                }
+            }
+
+
+def create_batcher(predict_fn: Callable[[np.ndarray], np.ndarray],
+                   max_batch_size: Optional[int] = None,
+                   max_wait_ms: Optional[float] = None,
+                   name: str = 'model') -> Optional[MicroBatcher]:
+    """
+    Build a MicroBatcher from explicit settings or the TEA_MAX_BATCH_* environment.
+
+    Returns None when batching is disabled (max batch size of 1), so callers
+    can fall back to calling the model directly.
+    """
+    max_batch_size = DEFAULT_MAX_BATCH_SIZE if max_batch_size is None else max_batch_size
+    max_wait_ms = DEFAULT_MAX_WAIT_MS if max_wait_ms is None else max_wait_ms
+    if max_batch_size <= 1:
+        return None
+    return MicroBatcher(predict_fn, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name=name)
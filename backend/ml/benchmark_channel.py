@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import subprocess
+import logging
+
+from benchmark_suite import ML_DIR, latency_stats, make_leaf_images, build_standin_model
+from image_channel import DEFAULT_SPOOL_PATH, SpoolReader, SpoolWriter
+from preprocessing import NOTEBOOK_SPEC, load_image
+
+logger = logging.getLogger('benchmark_channel')
+
+UPLOADS_DIR = os.path.join(ML_DIR, '..', 'uploads')
+
+
+def path_handoff(data, uploads_dir, decode):
+    """Today's flow: multer writes the upload, Python reads it back, Node deletes it"""
+    path = os.path.join(uploads_dir, f"bench-{uuid.uuid4().hex}.jpg")
+    with open(path, 'wb') as f:
+        f.write(data)
+    with open(path, 'rb') as f:
+        image_bytes = f.read()
+    if decode:
+        load_image(image_bytes, NOTEBOOK_SPEC)
+    os.unlink(path)
+
+
+def spool_handoff(data, writer, reader, decode):
+    """Spool flow: the client copies the upload into shared memory, the worker decodes in place"""
+    record = writer.write(data)
+    view = reader.read(record["spool"], record["offset"], record["sequence"])
+    try:
+        if decode:
+            load_image(view, NOTEBOOK_SPEC)
+    finally:
+        view.release()
+        writer.release(record["offset"])
+
+
+def run_handoff(images, uploads_dir, writer, iterations):
+    """Hand-off cost alone and with decode + preprocessing, per image size"""
+    reader = SpoolReader()
+    results = {}
+    for label, paths in images.items():
+        payloads = [open(p, 'rb').read() for p in paths]
+        results[label] = {"mean_file_bytes": sum(map(len, payloads)) // len(payloads)}
+        for decode in (False, True):
+            for name, fn in (("path", lambda d: path_handoff(d, uploads_dir, decode)),
+                             ("spool", lambda d: spool_handoff(d, writer, reader, decode))):
+                samples = []
+                for i in range(iterations):
+                    start = time.perf_counter()
+                    fn(payloads[i % len(payloads)])
+                    samples.append(time.perf_counter() - start)
+                key = f"{name}_with_decode" if decode else name
+                results[label][key] = latency_stats(samples)
+                logger.info(f"{label} {key}: p50 {results[label][key]['p50_ms']:.3f} ms")
+    reader.close()
+    return results
+
+
+class Worker:
+    """test_model.py --serve in a child process, driven one request at a time"""
+
+    def __init__(self, env):
+        self.process = subprocess.Popen([sys.executable, 'test_model.py', '--serve'], cwd=ML_DIR, env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        ready = json.loads(self.process.stdout.readline())
+        if not ready.get("ready"):
+            raise RuntimeError(f"Worker failed to start: {ready.get('error')}")
+        self._next_id = 0
+
+    def request(self, fields):
+        self._next_id += 1
+        self.process.stdin.write(json.dumps(dict(fields, id=self._next_id)) + "\n")
+        response = json.loads(self.process.stdout.readline())
+        if not response.get("success"):
+            raise RuntimeError(f"Worker request failed: {response.get('error')}")
+        return response
+
+    def close(self):
+        self.process.stdin.close()
+        self.process.wait()
+
+
+def run_end_to_end(images, uploads_dir, writer, manifest_path, iterations):
+    """
+    Round trips through a resident worker: write upload + send path + delete,
+    against copy into the spool + send offset + release the slot
+    """
+    env = dict(os.environ, TEA_MODEL_MANIFEST=manifest_path, TEA_CACHE_MAX_ENTRIES='0', TEA_LOG_LEVEL='WARNING')
+    env.pop('TEA_CACHE_DB', None)
+    worker = Worker(env)
+
+    def via_path(data):
+        path = os.path.join(uploads_dir, f"bench-{uuid.uuid4().hex}.jpg")
+        with open(path, 'wb') as f:
+            f.write(data)
+        try:
+            worker.request({"image_path": path})
+        finally:
+            os.unlink(path)
+
+    def via_spool(data):
+        record = writer.write(data)
+        try:
+            worker.request(record)
+        finally:
+            writer.release(record["offset"])
+
+    results = {}
+    try:
+        for label, paths in images.items():
+            payloads = [open(p, 'rb').read() for p in paths]
+            results[label] = {}
+            for name, fn in (("path", via_path), ("spool", via_spool)):
+                fn(payloads[0])
+                samples = []
+                for i in range(iterations):
+                    start = time.perf_counter()
+                    fn(payloads[i % len(payloads)])
+                    samples.append(time.perf_counter() - start)
+                results[label][name] = latency_stats(samples)
+                logger.info(f"{label} end-to-end {name}: p50 {results[label][name]['p50_ms']:.1f} ms")
+    finally:
+        worker.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the shared-memory spool input channel with the path-based upload flow")
+    parser.add_argument("--model", help="Model file for the end-to-end run (default: an untrained stand-in)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--uploads-dir", help="Where path-based uploads are written (default: backend/uploads)")
+    parser.add_argument("--spool", help="Spool file to create; must not exist (default: TEA_SPOOL_PATH, "
+                                        "else a new tea_spool_* file in TEA_SPOOL_DIR or /dev/shm)")
+    parser.add_argument("--skip-end-to-end", action="store_true", help="Only measure the hand-off itself")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    with tempfile.TemporaryDirectory(prefix='tea_channel_') as workdir:
+        uploads_dir = args.uploads_dir or (UPLOADS_DIR if os.path.isdir(UPLOADS_DIR) else workdir)
+        large_dir = os.path.join(workdir, 'large')
+        os.makedirs(large_dir)
+        images = {
+            "phone_1024x768": make_leaf_images(workdir, 4),
+            "camera_4000x3000": make_leaf_images(large_dir, 2, size=(4000, 3000))
+        }
+
+        writer = SpoolWriter(args.spool or DEFAULT_SPOOL_PATH)
+        try:
+            report = {
+                "generated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+                "uploads_dir": os.path.abspath(uploads_dir),
+                "spool": writer.path,
+                "handoff": run_handoff(images, uploads_dir, writer, args.iterations)
+            }
+            if not args.skip_end_to_end:
+                if args.model:
+                    manifest_path = os.path.join(workdir, 'manifest.json')
+                    with open(manifest_path, 'w') as f:
+                        json.dump({"active": "model", "models": {"model": {"path": os.path.abspath(args.model)}}}, f)
+                else:
+                    _, manifest_path = build_standin_model(workdir)
+                report["end_to_end"] = run_end_to_end(images, uploads_dir, writer, manifest_path, args.iterations)
+        finally:
+            writer.close()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        logger.info(f"Report written to {os.path.abspath(args.output)}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
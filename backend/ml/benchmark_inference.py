@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+from fast_inference import compile_model
+from model_architecture import build_sequential_model
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def summarize(samples):
+    """Latency summary in milliseconds"""
+    samples_ms = np.array(samples) * 1000.0
+    return {
+        "mean_ms": float(samples_ms.mean()),
+        "p50_ms": float(np.percentile(samples_ms, 50)),
+        "p95_ms": float(np.percentile(samples_ms, 95)),
+        "min_ms": float(samples_ms.min())
+    }
+
+
+def time_calls(fn, batch, iterations, warmup):
+    """Time fn(batch) over several iterations after a few untimed warmup calls"""
+    for _ in range(warmup):
+        fn(batch)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(batch)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_benchmark(model_path=None, iterations=50, warmup=5, batch_sizes=(1,)):
+    """
+    Compare per-image latency of model.predict against the compiled direct-call path
+    """
+    if model_path:
+        logger.info(f"Loading model from {model_path}")
+        model = tf.keras.models.load_model(model_path)
+    else:
+        logger.info("No model given, using an untrained stand-in with the notebook architecture")
+        model = build_sequential_model()
+
+    start = time.perf_counter()
+    compiled = compile_model(model, warmup_batch_sizes=batch_sizes)
+    compile_seconds = time.perf_counter() - start
+
+    input_shape = compiled.warmup_shape
+    rng = np.random.default_rng(0)
+    results = {
+        "model": model_path or "stand-in",
+        "tensorflow_version": tf.__version__,
+        "iterations": iterations,
+        "compile_and_warmup_ms": compile_seconds * 1000.0,
+        "batches": []
+    }
+
+    for batch_size in batch_sizes:
+        batch = rng.uniform(0, 255, size=(batch_size,) + input_shape).astype('float32')
+
+        predict_samples = time_calls(lambda x: model.predict(x, verbose=0), batch, iterations, warmup)
+        compiled_samples = time_calls(compiled, batch, iterations, warmup)
+
+        # Both paths must agree before their timings mean anything
+        max_abs_diff = float(np.abs(model.predict(batch, verbose=0) - compiled(batch)).max())
+
+        predict_summary = summarize(np.array(predict_samples) / batch_size)
+        compiled_summary = summarize(np.array(compiled_samples) / batch_size)
+        results["batches"].append({
+            "batch_size": batch_size,
+            "model_predict_per_image": predict_summary,
+            "compiled_per_image": compiled_summary,
+            "speedup_p50": predict_summary["p50_ms"] / compiled_summary["p50_ms"],
+            "max_abs_diff": max_abs_diff
+        })
+        logger.info(f"Batch size {batch_size}: model.predict p50 {predict_summary['p50_ms']:.2f} ms/image, "
+                    f"compiled p50 {compiled_summary['p50_ms']:.2f} ms/image")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model.predict with the compiled inference path")
+    parser.add_argument("--model", help="Path to a .keras/.h5 model (default: untrained stand-in)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--batch-sizes", default="1", help="Comma-separated batch sizes, e.g. 1,8")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    batch_sizes = tuple(int(size) for size in args.batch_sizes.split(","))
+    results = run_benchmark(args.model, args.iterations, args.warmup, batch_sizes)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+        logger.info(f"Report written to {os.path.abspath(args.output)}")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import importlib.util
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+TEASIKCNES_PREDICT = os.path.join(ML_DIR, '..', '..', 'Teasikcnesmodel', 'predict.py')
+
+logger = logging.getLogger('benchmark_suite')
+
+ENTRY_POINTS = ('test_model', 'prediction_api', 'disease_detection_api', 'teasikcnes_predict')
+
+
+def latency_stats(samples, images_per_sample=1):
+    """p50/p95/p99 latency in milliseconds and throughput in images/sec"""
+    samples = np.asarray(samples, dtype=np.float64)
+    total = samples.sum()
+    return {
+        "count": int(len(samples)),
+        "mean_ms": float(samples.mean() * 1000.0),
+        "p50_ms": float(np.percentile(samples, 50) * 1000.0),
+        "p95_ms": float(np.percentile(samples, 95) * 1000.0),
+        "p99_ms": float(np.percentile(samples, 99) * 1000.0),
+        "max_ms": float(samples.max() * 1000.0),
+        "throughput_per_sec": float(len(samples) * images_per_sample / total) if total > 0 else 0.0
+    }
+
+
+def time_stage(fn, inputs, iterations, warmup=2, images_per_call=1):
+    """Call fn over inputs (cycling) and summarize per-call latency"""
+    for i in range(min(warmup, iterations)):
+        fn(inputs[i % len(inputs)])
+    samples = []
+    for i in range(iterations):
+        item = inputs[i % len(inputs)]
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return latency_stats(samples, images_per_call)
+
+
+def make_leaf_images(directory, count, size=(1024, 768), seed=0):
+    """
+    Write synthetic leaf photos: a green leaf on a soil-coloured background
+    with a few brown lesions, saved as JPEG like phone uploads
+    """
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(count):
+        width, height = size
+        background = tuple(int(c) for c in rng.integers(60, 140, size=3))
+        img = Image.new('RGB', size, background)
+        draw = ImageDraw.Draw(img)
+        leaf_color = (int(rng.integers(30, 90)), int(rng.integers(110, 190)), int(rng.integers(20, 70)))
+        draw.ellipse([width * 0.15, height * 0.2, width * 0.85, height * 0.8], fill=leaf_color)
+        for _ in range(int(rng.integers(2, 8))):
+            x, y = rng.uniform(0.3, 0.7) * width, rng.uniform(0.35, 0.65) * height
+            r = rng.uniform(0.01, 0.05) * width
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=(int(rng.integers(90, 140)), int(rng.integers(50, 80)), 20))
+        # Sensor noise so JPEG decode cost is realistic
+        pixels = np.asarray(img, dtype=np.int16) + rng.integers(-12, 12, size=(height, width, 3))
+        path = os.path.join(directory, f"leaf_{i:03d}.jpg")
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def build_standin_model(directory):
+    """Save an untrained model with the notebook architecture and a manifest pointing at it"""
+    from model_architecture import build_sequential_model
+
+    model_path = os.path.join(directory, 'standin_model.keras')
+    build_sequential_model().save(model_path)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    with open(manifest_path, 'w') as f:
+        json.dump({"active": "standin", "models": {"standin": {"path": model_path}}}, f)
+    return model_path, manifest_path
+
+
+def configure_environment(manifest_path):
+    # Must be set before the entry point modules are imported
+    os.environ['TEA_MODEL_MANIFEST'] = manifest_path
+    os.environ['TEA_CACHE_MAX_ENTRIES'] = '0'
+    os.environ.pop('TEA_CACHE_DB', None)
+    if ML_DIR not in sys.path:
+        sys.path.insert(0, ML_DIR)
+
+
+def load_teasikcnes_predict(model_path):
+    spec = importlib.util.spec_from_file_location('teasikcnes_predict', TEASIKCNES_PREDICT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.MODEL_PATH = model_path
+    return module
+
+
+def build_stages(model_path):
+    """
+    For each entry point, the functions that make up one request, split into stages.
+
+    Every stage takes an image path. Stages an entry point does not expose
+    separately are left out; end_to_end is always measured.
+    """
+    import test_model
+    import prediction_api
+    import disease_detection_api
+    from disease_classes import build_response
+
+    loaded = test_model.get_model()
+
+    prediction_api.MODEL_CONFIG['model_filename'] = model_path
+    prediction_api.predictor.load_model()
+
+    disease_detection_api.MODEL_PATH = model_path
+    disease_detection_api.model = None
+    disease_detection_api.load_model()
+
+    teasikcnes = load_teasikcnes_predict(model_path)
+
+    def read(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    tm_batch = lambda path: test_model.load_and_preprocess_image(path, loaded.spec)[0]
+    tm_probs = lambda path: test_model.run_inference(tm_batch(path), loaded)
+    pa_batch = lambda path: prediction_api.predictor.preprocess_image(read(path))
+    dd_batch = lambda path: disease_detection_api.preprocess_image(read(path))
+
+    return {
+        "test_model": {
+            "preprocess": tm_batch,
+            "inference": ("prepared", tm_batch, lambda batch: test_model.run_inference(batch, loaded)),
+            "postprocess": ("prepared", tm_probs, lambda probs: build_response(probs[0])),
+            "serialize": ("prepared", lambda path: test_model.predict_disease(path), json.dumps),
+            "end_to_end": lambda path: json.dumps(test_model.predict_disease(path))
+        },
+        "prediction_api": {
+            "preprocess": pa_batch,
+            "inference": ("prepared", pa_batch, prediction_api.predictor.predict_fn),
+            "serialize": ("prepared", lambda path: prediction_api.predictor.predict(read(path)), json.dumps),
+            "end_to_end": lambda path: json.dumps(prediction_api.predictor.predict(read(path)))
+        },
+        "disease_detection_api": {
+            "preprocess": dd_batch,
+            "inference": ("prepared", dd_batch, disease_detection_api.predict_fn),
+            "serialize": ("prepared", lambda path: disease_detection_api.predict_disease(read(path)), json.dumps),
+            "end_to_end": lambda path: json.dumps(disease_detection_api.predict_disease(read(path)))
+        },
+        "teasikcnes_predict": {
+            # Loads the model on every call, which is what this script does today
+            "end_to_end": lambda path: json.dumps(teasikcnes.predict_disease(path))
+        }
+    }
+
+
+def run_stage_benchmarks(stages, images, iterations, slow_iterations):
+    results = {}
+    for entry_point, entry_stages in stages.items():
+        results[entry_point] = {}
+        count = slow_iterations if entry_point == 'teasikcnes_predict' else iterations
+        for stage, fn in entry_stages.items():
+            if isinstance(fn, tuple):
+                # Time only the stage itself on inputs prepared by the earlier stages
+                _, prepare, stage_fn = fn
+                prepared = [prepare(path) for path in images]
+                results[entry_point][stage] = time_stage(stage_fn, prepared, count)
+            else:
+                results[entry_point][stage] = time_stage(fn, images, count)
+            logger.info(f"{entry_point}/{stage}: p50 {results[entry_point][stage]['p50_ms']:.2f} ms")
+    return results
+
+
+def run_batch_size_sweep(images, batch_sizes, decode_threads, iterations):
+    """Shared preprocessing and forward pass at several batch sizes and decode thread counts"""
+    import test_model
+    from preprocessing import load_batch
+
+    loaded = test_model.get_model()
+    results = []
+    for batch_size in batch_sizes:
+        paths = [images[i % len(images)] for i in range(batch_size)]
+        entry = {"batch_size": batch_size, "preprocess": {}}
+        for threads in decode_threads:
+            entry["preprocess"][str(threads)] = time_stage(
+                lambda p: load_batch(p, loaded.spec, num_threads=threads), [paths], iterations, images_per_call=batch_size
+            )
+        batch, _ = load_batch(paths, loaded.spec)
+        entry["inference"] = time_stage(loaded.predict_fn, [batch], iterations, images_per_call=batch_size)
+        results.append(entry)
+        logger.info(f"Batch size {batch_size}: inference {entry['inference']['throughput_per_sec']:.1f} images/sec")
+    return results
+
+
+def run_concurrency_sweep(stages, images, thread_counts, requests_per_run):
+    """End-to-end throughput of the resident entry points under concurrent callers"""
+    results = {}
+    for entry_point in ('test_model', 'prediction_api', 'disease_detection_api'):
+        fn = stages[entry_point]["end_to_end"]
+        results[entry_point] = {}
+        for threads in thread_counts:
+            def timed(i):
+                start = time.perf_counter()
+                fn(images[i % len(images)])
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                samples = list(executor.map(timed, range(requests_per_run)))
+            wall = time.perf_counter() - start
+
+            stats = latency_stats(samples)
+            stats["throughput_per_sec"] = requests_per_run / wall
+            results[entry_point][str(threads)] = stats
+            logger.info(f"{entry_point} with {threads} threads: {stats['throughput_per_sec']:.1f} requests/sec")
+    return results
+
+
+COLD_START_DRIVERS = {
+    "import_tensorflow": "import tensorflow",
+    "test_model": "import sys; sys.argv = ['test_model.py', {image!r}]; import test_model; sys.exit(test_model.main())",
+    "prediction_api": (
+        "import prediction_api as m; m.MODEL_CONFIG['model_filename'] = {model!r}; "
+        "assert m.predict_from_file({image!r})['success']"
+    ),
+    "disease_detection_api": (
+        "import disease_detection_api as m; m.MODEL_PATH = {model!r}; m.model = None; "
+        "m.predict_disease(open({image!r}, 'rb').read())"
+    ),
+    "teasikcnes_predict": (
+        "import importlib.util; s = importlib.util.spec_from_file_location('p', {script!r}); "
+        "m = importlib.util.module_from_spec(s); s.loader.exec_module(m); m.MODEL_PATH = {model!r}; "
+        "assert m.predict_disease({image!r})['success']"
+    )
+}
+
+
+def run_cold_start(model_path, image, runs):
+    """Wall time of a fresh process doing one prediction, per entry point"""
+    results = {}
+    for name, template in COLD_START_DRIVERS.items():
+        code = template.format(image=image, model=model_path, script=TEASIKCNES_PREDICT)
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            completed = subprocess.run([sys.executable, '-c', code], cwd=ML_DIR, env=os.environ.copy(),
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            samples.append(time.perf_counter() - start)
+            if completed.returncode != 0:
+                logger.warning(f"Cold start run for {name} failed: {completed.stderr.decode(errors='replace')[-300:]}")
+        results[name] = latency_stats(samples)
+        logger.info(f"Cold start {name}: p50 {results[name]['p50_ms']:.0f} ms")
+    return results
+
+
+def environment_info():
+    import tensorflow as tf
+    return {
+        "python": sys.version.split()[0],
+        "tensorflow": tf.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": {k: v for k, v in os.environ.items() if k.startswith('TEA_')}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmarks for every inference entry point")
+    parser.add_argument("--iterations", type=int, default=30, help="Timed calls per stage")
+    parser.add_argument("--slow-iterations", type=int, default=3, help="Timed calls for entry points that reload the model per call")
+    parser.add_argument("--images", type=int, default=8, help="Synthetic leaf images to generate")
+    parser.add_argument("--batch-sizes", default="1,8,32")
+    parser.add_argument("--decode-threads", default="1,4")
+    parser.add_argument("--threads", default="1,4,8", help="Concurrent callers for the throughput sweep")
+    parser.add_argument("--cold-start-runs", type=int, default=2, help="Fresh processes per entry point (0 skips)")
+    parser.add_argument("--entry-points", default=",".join(ENTRY_POINTS))
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parse_ints = lambda value: [int(v) for v in value.split(',') if v]
+    selected = set(args.entry_points.split(','))
+
+    with tempfile.TemporaryDirectory(prefix='tea_bench_') as workdir:
+        configure_environment(os.path.join(workdir, 'manifest.json'))
+        model_path, _ = build_standin_model(workdir)
+        images = make_leaf_images(workdir, args.images)
+
+        report = {"generated_at": time.strftime('%Y-%m-%dT%H:%M:%S'), "environment": environment_info()}
+
+        if args.cold_start_runs > 0:
+            report["cold_start"] = run_cold_start(model_path, images[0], args.cold_start_runs)
+
+        stages = {name: s for name, s in build_stages(model_path).items() if name in selected}
+        report["stages"] = run_stage_benchmarks(stages, images, args.iterations, args.slow_iterations)
+        report["batch_sizes"] = run_batch_size_sweep(images, parse_ints(args.batch_sizes),
+                                                     parse_ints(args.decode_threads), args.iterations)
+        if {'test_model', 'prediction_api', 'disease_detection_api'} <= selected:
+            report["concurrency"] = run_concurrency_sweep(stages, images, parse_ints(args.threads), args.iterations)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+        logger.info(f"Report written to {os.path.abspath(args.output)}")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import zlib
+import struct
+import shutil
+import tempfile
+import subprocess
+import logging
+
+from PIL import Image
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Decodes one file in a fresh interpreter so peak RSS belongs to that image alone.
+# Peak RSS is read from VmHWM because ru_maxrss is inherited from the parent across fork/exec
+DRIVER = (
+    "import sys, json, time\n"
+    "from preprocessing import NOTEBOOK_SPEC, load_image, validate_image\n"
+    "def peak_kb():\n"
+    "    with open('/proc/self/status') as f:\n"
+    "        return next(int(line.split()[1]) for line in f if line.startswith('VmHWM'))\n"
+    "baseline = peak_kb()\n"
+    "result = {}\n"
+    "start = time.perf_counter()\n"
+    "try:\n"
+    "    validate_image(sys.argv[1])\n"
+    "    result['validate_ms'] = (time.perf_counter() - start) * 1000.0\n"
+    "    start = time.perf_counter()\n"
+    "    _, info = load_image(sys.argv[1], NOTEBOOK_SPEC)\n"
+    "    result['decode_ms'] = (time.perf_counter() - start) * 1000.0\n"
+    "    result['draft_size'] = info.get('draft_size')\n"
+    "    result['accepted'] = True\n"
+    "except ValueError as e:\n"
+    "    result['accepted'] = False\n"
+    "    result['rejected_ms'] = (time.perf_counter() - start) * 1000.0\n"
+    "    result['error'] = str(e)\n"
+    "result['decode_rss_mb'] = (peak_kb() - baseline) / 1024.0\n"
+    "print(json.dumps(result))\n"
+)
+
+# Limits switched off, to show what the same file costs without the guards
+UNGUARDED = {
+    'TEA_JPEG_DRAFT_MIN_MEGAPIXELS': '0',
+    'TEA_JPEG_DRAFT': '0',
+    'TEA_MAX_IMAGE_MEGAPIXELS': '100000',
+    'TEA_MAX_IMAGE_SIDE': '1000000'
+}
+
+
+def write_photo(path, size):
+    """Smooth gradients plus sensor-like noise, so the JPEG has realistic entropy"""
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 24)
+    Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT))).save(path, quality=90)
+
+
+def write_png_bomb(path, width, height):
+    """A few hundred bytes of PNG whose header claims width x height pixels"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(b'\x00' * (width + 1))))
+        f.write(chunk(b'IEND', b''))
+
+
+def measure(path, overrides=None):
+    env = dict(os.environ, **(overrides or {}))
+    completed = subprocess.run([sys.executable, '-c', DRIVER, path], cwd=ML_DIR, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        return {"accepted": False, "error": completed.stderr.decode(errors='replace').strip().splitlines()[-1]}
+    return json.loads(completed.stdout)
+
+
+def check_image_limits():
+    """
+    Decode large and hostile inputs with the default guards and, where it is
+    safe to do so, without them. Large JPEGs must decode at reduced scale,
+    and oversized or unsupported files must be rejected from the header.
+    """
+    workdir = tempfile.mkdtemp(prefix='tea_limits_')
+    try:
+        cases = []
+        # (name, path, should be accepted, should use draft decoding, also measure unguarded)
+        for name, size in (("jpeg_12mp", (4000, 3000)), ("jpeg_48mp", (8000, 6000))):
+            path = os.path.join(workdir, name + '.jpg')
+            write_photo(path, size)
+            cases.append((name, path, True, size[0] * size[1] >= 16000000, True))
+
+        bomb = os.path.join(workdir, 'bomb.png')
+        write_png_bomb(bomb, 30000, 30000)
+        # Never decoded unguarded: that would try to allocate 900 MP
+        cases.append(("png_bomb_30000x30000", bomb, False, False, False))
+
+        tiff = os.path.join(workdir, 'scan.tiff')
+        Image.new('RGB', (64, 64)).save(tiff)
+        cases.append(("tiff", tiff, False, False, False))
+
+        results = []
+        for name, path, expect_accepted, expect_draft, compare_unguarded in cases:
+            guarded = measure(path)
+            result = {"image": name, "file_bytes": os.path.getsize(path), "guarded": guarded}
+            if compare_unguarded:
+                result["unguarded"] = measure(path, UNGUARDED)
+            result["ok"] = guarded["accepted"] == expect_accepted and bool(guarded.get("draft_size")) == expect_draft
+            results.append(result)
+            logger.info(f"{name}: {json.dumps(guarded)}")
+            if "unguarded" in result:
+                logger.info(f"{name} without guards: {json.dumps(result['unguarded'])}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {"passed": all(r["ok"] for r in results), "results": results}
+    print("\nSummary:")
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(check_image_limits())
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import io
+import os
+import sys
+import json
+import logging
+
+import numpy as np
+from PIL import Image
+
+from preprocessing import TARGET_SIZE, NOTEBOOK_SPEC, load_image, load_batch, reference_preprocess
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')
+
+
+def synthetic_images():
+    """
+    In-memory images covering the modes and formats farmers upload:
+    phone JPEGs of different sizes, PNGs with alpha, grayscale and palette images
+    """
+    rng = np.random.default_rng(42)
+    cases = []
+
+    def encode(img, fmt, **kwargs):
+        buffer = io.BytesIO()
+        img.save(buffer, format=fmt, **kwargs)
+        return buffer.getvalue()
+
+    rgb = Image.fromarray(rng.integers(0, 256, size=(480, 640, 3), dtype=np.uint8))
+    cases.append(("jpeg_640x480", encode(rgb, 'JPEG', quality=90)))
+    large = Image.fromarray(rng.integers(0, 256, size=(3000, 4000, 3), dtype=np.uint8))
+    cases.append(("jpeg_4000x3000", encode(large, 'JPEG', quality=85)))
+    exact = Image.fromarray(rng.integers(0, 256, size=(TARGET_SIZE[1], TARGET_SIZE[0], 3), dtype=np.uint8))
+    cases.append(("png_exact_size", encode(exact, 'PNG')))
+    rgba = Image.fromarray(rng.integers(0, 256, size=(300, 200, 4), dtype=np.uint8), mode='RGBA')
+    cases.append(("png_rgba", encode(rgba, 'PNG')))
+    gray = Image.fromarray(rng.integers(0, 256, size=(90, 160), dtype=np.uint8), mode='L')
+    cases.append(("jpeg_grayscale", encode(gray, 'JPEG')))
+    cases.append(("gif_palette", encode(rgb.convert('P'), 'GIF')))
+    return cases
+
+
+def collect_files(paths):
+    cases = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(IMAGE_EXTENSIONS):
+                        cases.append((os.path.join(root, name), os.path.join(root, name)))
+        else:
+            cases.append((path, path))
+    return cases
+
+
+def check_preprocessing(paths):
+    """
+    Compare the shared preprocessing module with the original test_model.py
+    transform under the notebook spec. Single-image and batched output must
+    be byte-for-byte equal; draft-mode deviation is reported for information only.
+    """
+    cases = collect_files(paths) if paths else synthetic_images()
+    if not cases:
+        logger.error("No images to check")
+        return 1
+
+    results = []
+    batch, errors = load_batch([source for _, source in cases], NOTEBOOK_SPEC, use_draft=False)
+
+    for index, (name, source) in enumerate(cases):
+        expected = reference_preprocess(source)
+        single, info = load_image(source, NOTEBOOK_SPEC, use_draft=False)
+        drafted, _ = load_image(source, NOTEBOOK_SPEC, use_draft=True)
+
+        result = {
+            "image": name,
+            "format": info["format"],
+            "mode": info["mode"],
+            "size": list(info["size"]),
+            "single_identical": single.dtype == expected.dtype and single.tobytes() == expected.tobytes(),
+            "batch_identical": errors[index] is None and batch[index:index + 1].tobytes() == expected.tobytes(),
+            "draft_max_abs_diff": float(np.abs(drafted - expected).max())
+        }
+        results.append(result)
+
+        if result["single_identical"] and result["batch_identical"]:
+            logger.info(f"{name}: identical")
+        else:
+            logger.error(f"{name}: output differs from the reference transform")
+
+    summary = {
+        "target_size": list(TARGET_SIZE),
+        "checked": len(results),
+        "identical": all(r["single_identical"] and r["batch_identical"] for r in results),
+        "results": results
+    }
+
+    print("\nSummary:")
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["identical"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(check_preprocessing(sys.argv[1:]))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import logging
+import statistics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+MARKER = '__STARTUP__'
+
+# Runs test_model.py's CLI in a fresh interpreter and reports what it cost
+DRIVER = (
+    "import sys, json, resource\n"
+    "sys.argv = {argv!r}\n"
+    "import test_model\n"
+    "code = test_model.main()\n"
+    "sys.stderr.write('\\n{marker}' + json.dumps({{"
+    "'exit_code': code, "
+    "'tensorflow_imported': 'tensorflow' in sys.modules, "
+    "'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}}) + '\\n')\n"
+)
+
+
+def run_once(argv, env):
+    code = DRIVER.format(argv=['test_model.py'] + argv, marker=MARKER)
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', code], cwd=ML_DIR, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    elapsed = time.perf_counter() - start
+
+    stats = {"exit_code": completed.returncode}
+    for line in completed.stderr.decode(errors='replace').splitlines():
+        if line.startswith(MARKER):
+            stats = json.loads(line[len(MARKER):])
+    try:
+        response = json.loads(completed.stdout.decode().strip().splitlines()[-1])
+    except (ValueError, IndexError):
+        response = None
+    stats["seconds"] = elapsed
+    stats["success"] = bool(response and response.get("success"))
+    return stats
+
+
+def measure(name, argv, env, runs):
+    samples = [run_once(argv, env) for _ in range(runs)]
+    seconds = [s["seconds"] for s in samples]
+    result = {
+        "median_seconds": statistics.median(seconds),
+        "min_seconds": min(seconds),
+        "peak_rss_mb": max(s.get("peak_rss_mb", 0.0) for s in samples),
+        "tensorflow_imported": any(s.get("tensorflow_imported") for s in samples),
+        "success": samples[-1]["success"]
+    }
+    logger.info(f"{name}: {result['median_seconds']:.2f}s, {result['peak_rss_mb']:.0f} MB, "
+                f"tensorflow imported: {result['tensorflow_imported']}")
+    return result
+
+
+def check_startup(image, model=None, runs=3):
+    """
+    Time one-shot test_model.py runs in fresh processes. The fast-fail paths
+    (usage error, missing file, non-image upload, cache hit) must not import
+    TensorFlow; the full prediction path is measured for comparison.
+    """
+    workdir = tempfile.mkdtemp(prefix='tea_startup_')
+    try:
+        env = os.environ.copy()
+        env['TEA_CACHE_MAX_ENTRIES'] = '0'
+        env.pop('TEA_CACHE_DB', None)
+        if model:
+            manifest = os.path.join(workdir, 'manifest.json')
+            with open(manifest, 'w') as f:
+                json.dump({"active": "model", "models": {"model": {"path": os.path.abspath(model)}}}, f)
+            env['TEA_MODEL_MANIFEST'] = manifest
+
+        not_an_image = os.path.join(workdir, 'upload.jpg')
+        with open(not_an_image, 'wb') as f:
+            f.write(b'<html>not an image</html>')
+
+        # The on-disk cache lets a one-shot run answer a repeat upload
+        cache_env = dict(env, TEA_CACHE_DB=os.path.join(workdir, 'cache.db'))
+        run_once([image], cache_env)
+
+        fast_fail_paths = {
+            "usage_error": ([], env),
+            "missing_file": ([os.path.join(workdir, 'missing.jpg')], env),
+            "invalid_image": ([not_an_image], env),
+            "cache_hit": ([image], cache_env)
+        }
+        results = {name: measure(name, argv, run_env, runs) for name, (argv, run_env) in fast_fail_paths.items()}
+        results["full_prediction"] = measure("full_prediction", [image], env, runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = {
+        "runs_per_path": runs,
+        "fast_fail_without_tensorflow": all(not results[name]["tensorflow_imported"] for name in fast_fail_paths),
+        "paths": results
+    }
+    print("\nSummary:")
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["fast_fail_without_tensorflow"] and results["full_prediction"]["success"] else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure test_model.py startup time on the fast-fail and full prediction paths")
+    parser.add_argument("image", help="A valid leaf image")
+    parser.add_argument("--model", help="Model file (default: active model in model_manifest.json)")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    sys.exit(check_startup(args.image, args.model, args.runs))
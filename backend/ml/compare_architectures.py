@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import logging
+
+import numpy as np
+
+from benchmark_suite import latency_stats
+from evaluate_models import EvaluatedModel, evaluate, open_batches, resolve_models
+from model_registry import DEFAULT_MANIFEST_PATH
+
+logger = logging.getLogger('compare_architectures')
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Untrained builds measured when no --model or --build is given
+DEFAULT_BUILDS = ('sequential', 'compact:1.0', 'compact:0.5')
+
+
+def build_untrained(spec, directory):
+    """Save an untrained 'architecture[:width_multiplier]' model; returns (name, path)"""
+    from model_architecture import build_model
+
+    architecture, _, width = spec.partition(':')
+    width_multiplier = float(width) if width else 1.0
+    name = architecture if architecture == 'sequential' else f"{architecture}_w{width_multiplier:g}"
+    path = os.path.join(directory, f"{name}.keras")
+    build_model(architecture, width_multiplier=width_multiplier).save(path)
+    return name, path
+
+
+def measure(path, iterations, batch_sizes):
+    """
+    Footprint and speed of one model in this (fresh) process: runtime import
+    and model load time, RSS growth from loading, parameter count and
+    latency per batch size
+    """
+    # Import the runtime first so load_seconds is the model alone
+    import_start = time.perf_counter()
+    if path.lower().endswith(('.keras', '.h5')):
+        import tensorflow as tf
+        tf.config.list_logical_devices()
+    import_seconds = time.perf_counter() - import_start
+
+    from inference_backends import create_backend
+    backend = create_backend(path, 'auto')
+    model = getattr(backend, 'model', None)
+    height, width, channels = (d or 128 for d in backend.input_shape[1:])
+    rng = np.random.default_rng(0)
+
+    latency = {}
+    for batch_size in batch_sizes:
+        inputs = [rng.uniform(0, 255, (batch_size, height, width, channels)).astype(np.float32) for _ in range(4)]
+        for batch in inputs[:2]:
+            backend(batch)
+        samples = []
+        for i in range(iterations):
+            start = time.perf_counter()
+            backend(inputs[i % len(inputs)])
+            samples.append(time.perf_counter() - start)
+        stats = latency_stats(samples, batch_size)
+        stats["per_image_ms"] = stats["mean_ms"] / batch_size
+        latency[str(batch_size)] = stats
+
+    return {
+        "backend": backend.name,
+        "file_bytes": os.path.getsize(path),
+        "parameters": int(model.count_params()) if model is not None else None,
+        "runtime_import_seconds": import_seconds,
+        "load_seconds": backend.load_seconds,
+        "load_rss_mb": backend.load_rss_bytes / (1024 * 1024) if backend.load_rss_bytes is not None else None,
+        "latency": latency
+    }
+
+
+def measure_in_subprocess(path, iterations, batch_sizes):
+    """Run measure() in a fresh interpreter so load time and memory are not flattered by earlier models"""
+    command = [sys.executable, os.path.abspath(__file__), '--measure', path,
+               '--iterations', str(iterations), '--batch-sizes', ','.join(str(b) for b in batch_sizes)]
+    env = dict(os.environ, TEA_LOG_LEVEL='WARNING')
+    completed = subprocess.run(command, cwd=ML_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Measuring {path} failed: {completed.stderr.decode(errors='replace')[-500:]}")
+    return json.loads(completed.stdout)
+
+
+def summarize(rows, baseline):
+    """Ratios of each model against the baseline row (the notebook architecture when present)"""
+    base = rows[baseline]
+    base_latency = base["latency"]["1"]["per_image_ms"]
+    for row in rows.values():
+        relative = {
+            "file_size": row["file_bytes"] / base["file_bytes"],
+            "load_time": row["load_seconds"] / base["load_seconds"] if base["load_seconds"] else None,
+            "latency_speedup": base_latency / row["latency"]["1"]["per_image_ms"]
+        }
+        if row["parameters"] and base["parameters"]:
+            relative["parameters"] = row["parameters"] / base["parameters"]
+        if row.get("accuracy") is not None and base.get("accuracy") is not None:
+            relative["accuracy_delta"] = row["accuracy"] - base["accuracy"]
+        row["relative_to_baseline"] = relative
+
+
+def format_table(rows):
+    header = f"{'model':<40} {'params':>10} {'size MB':>8} {'load s':>7} {'ms/img':>7} {'img/s@max':>10} {'accuracy':>8}"
+    lines = [header, '-' * len(header)]
+    for name, row in rows.items():
+        largest = row["latency"][max(row["latency"], key=int)]
+        accuracy = f"{row['accuracy']:.4f}" if row.get("accuracy") is not None else '-'
+        parameters = f"{row['parameters']:,}" if row["parameters"] else '-'
+        lines.append(f"{name[:40]:<40} {parameters:>10} {row['file_bytes'] / 1e6:>8.2f} {row['load_seconds']:>7.2f} "
+                     f"{row['latency']['1']['per_image_ms']:>7.2f} {largest['throughput_per_sec']:>10.1f} {accuracy:>8}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model architectures: parameters, size, load time, latency and accuracy")
+    parser.add_argument("target", nargs="?", help="Labelled image folder for accuracy (e.g. Teasikcnesmodel/valid)")
+    parser.add_argument("--dataset", help="Compiled dataset to measure accuracy on instead of an image folder")
+    parser.add_argument("--split", default="valid")
+    parser.add_argument("--model", action="append", default=[], help="Trained model file or manifest version (repeatable)")
+    parser.add_argument("--build", action="append", default=[], metavar="ARCH[:WIDTH]",
+                        help="Also measure an untrained build, e.g. compact:0.5 (no accuracy; repeatable)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--iterations", type=int, default=50, help="Timed forward passes per batch size")
+    parser.add_argument("--batch-sizes", default="1,32")
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    batch_sizes = sorted({int(b) for b in args.batch_sizes.split(',') if b} | {1})
+
+    if args.measure:
+        logging.basicConfig(level=logging.WARNING)
+        print(json.dumps(measure(args.measure, args.iterations, batch_sizes)))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        with tempfile.TemporaryDirectory(prefix='tea_arch_') as workdir:
+            trained = resolve_models(args.model, args.manifest) if args.model else []
+            builds = args.build or ([] if trained else list(DEFAULT_BUILDS))
+            untrained = [build_untrained(spec, workdir) for spec in builds]
+
+            rows = {}
+            for name, path in trained + untrained:
+                if name in rows:
+                    raise ValueError(f"Two models are named '{name}'")
+                logger.info(f"Measuring {name} ({path})")
+                rows[name] = dict(path=os.path.abspath(path), trained=(name, path) in trained,
+                                  **measure_in_subprocess(path, args.iterations, batch_sizes))
+
+            evaluation = None
+            if trained and (args.target or args.dataset):
+                models = [EvaluatedModel(name, path) for name, path in trained]
+                _, batches = open_batches(models, args.target, args.dataset, args.split)
+                evaluation = evaluate(models, batches)
+                for result in evaluation["models"]:
+                    rows[result["name"]].update(accuracy=result["accuracy"], loss=result["loss"],
+                                                macro_f1=result["macro_f1"])
+
+        # The largest model (the notebook architecture when it is in the set) is the reference
+        baseline = max(rows, key=lambda name: rows[name]["parameters"] or 0)
+        summarize(rows, baseline)
+    except Exception as e:
+        logger.error(f"Comparison failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    logger.info("\n" + format_table(rows))
+    report = {
+        "success": True,
+        "generated_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "cpu_count": os.cpu_count(),
+        "baseline": baseline,
+        "evaluated_images": evaluation["images"] if evaluation else None,
+        "models": rows,
+        "comparison": evaluation["comparison"] if evaluation else []
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
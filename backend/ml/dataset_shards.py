@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from batch_predict import IMAGE_EXTENSIONS
+from disease_classes import CLASS_LABELS
+from preprocessing import DECODE_THREADS, NOTEBOOK_SPEC, PreprocessSpec, apply_scale, decode_into
+
+logger = logging.getLogger(__name__)
+
+INDEX_NAME = 'index.json'
+FORMAT_VERSION = 1
+
+# Images per shard file (128x128 RGB uint8 is 48 KB per image, so ~96 MB per shard)
+DEFAULT_SHARD_IMAGES = int(os.environ.get('TEA_SHARD_IMAGES', '2048'))
+
+
+def list_images(directory: str) -> Tuple[List[str], List[int], List[str]]:
+    """
+    Image paths and integer labels from class-named subfolders, with classes
+    in sorted order like image_dataset_from_directory
+    """
+    class_names = sorted(name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name)))
+    if not class_names:
+        raise ValueError(f"No class folders found in {directory}")
+    if class_names != CLASS_LABELS:
+        logger.warning(f"Class folders {class_names} differ from the labels the API reports {CLASS_LABELS}")
+
+    paths, labels = [], []
+    for index, name in enumerate(class_names):
+        for path in sorted(glob.glob(os.path.join(glob.escape(directory), glob.escape(name), '**', '*'), recursive=True)):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(path)
+                labels.append(index)
+    if not paths:
+        raise ValueError(f"No images found in {directory}")
+    return paths, labels, class_names
+
+
+def load_index(directory: str) -> Dict:
+    path = os.path.join(directory, INDEX_NAME)
+    if not os.path.exists(path):
+        return {"version": FORMAT_VERSION, "splits": {}}
+    with open(path) as f:
+        index = json.load(f)
+    if index.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has format version {index.get('version')}, expected {FORMAT_VERSION}")
+    return index
+
+
+def _save_index(directory: str, index: Dict) -> None:
+    path = os.path.join(directory, INDEX_NAME)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def _shard_number(name: str) -> int:
+    return int(os.path.splitext(name)[0].rsplit('-', 1)[1])
+
+
+def compile_split(source_dir: str, output_dir: str, split: str, spec: PreprocessSpec = NOTEBOOK_SPEC,
+                  shard_images: int = DEFAULT_SHARD_IMAGES, num_threads: int = DECODE_THREADS,
+                  rebuild: bool = False) -> Dict:
+    """
+    Decode one class-folder tree into uint8 shards under output_dir.
+
+    Images whose size and mtime match the index are kept as they are; the
+    others are hashed, and only content the index has never seen is decoded,
+    so renamed, moved or relabelled files cost a read but no decode. New
+    images go into new shard files; shards no longer referenced are deleted.
+    Pixels are stored before value scaling; readers apply spec.scale.
+    """
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    index = load_index(output_dir)
+    previous = None if rebuild else index["splits"].get(split)
+    if previous is not None and PreprocessSpec.from_dict(previous["spec"]) != spec:
+        logger.info(f"Preprocessing changed for '{split}', decoding every image again")
+        previous = None
+    old_images = previous["images"] if previous is not None else []
+    by_path = {entry["path"]: entry for entry in old_images}
+    by_hash = {entry["sha256"]: entry for entry in old_images}
+    old_failed = {entry["path"]: entry for entry in previous["failed"]} if previous is not None else {}
+
+    paths, labels, class_names = list_images(source_dir)
+    images, new, failed = [], [], []
+    new_by_hash = {}
+    unchanged = reused = 0
+    for path, label in zip(paths, labels):
+        relative = os.path.relpath(path, source_dir)
+        stat = os.stat(path)
+        old = by_path.get(relative)
+        if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            images.append(dict(old, label=label))
+            unchanged += 1
+            continue
+        old = old_failed.get(relative)
+        if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+            # Still the file that could not be decoded last time
+            failed.append(old)
+            continue
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        entry = {"path": relative, "label": label, "sha256": digest, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        old = by_hash.get(digest)
+        if old is not None:
+            entry.update(shard=old["shard"], row=old["row"])
+            images.append(entry)
+            reused += 1
+        elif digest in new_by_hash:
+            # Same content twice in this batch of new files: decode it once
+            new_by_hash[digest].append(entry)
+        else:
+            new_by_hash[digest] = [entry]
+            new.append((path, entry))
+
+    # Pixels only; the scale is applied when the shards are read
+    raw_spec = PreprocessSpec(spec.image_size, spec.color_mode, spec.interpolation, 'none')
+    shard_names = glob.glob(os.path.join(glob.escape(output_dir), f"{glob.escape(split)}-*.npy"))
+    next_number = max((_shard_number(name) for name in shard_names), default=-1) + 1
+
+    def decode(item):
+        shard, row, (path, _) = item
+        try:
+            decode_into(path, shard[row], raw_spec, use_draft=False)
+            return None
+        except Exception as e:
+            shard[row].fill(0)
+            logger.warning(f"Failed to decode {path}: {str(e)}")
+            return str(e)
+
+    failed_before = len(failed)
+    with ThreadPoolExecutor(max_workers=max(num_threads, 1)) as executor:
+        for chunk_start in range(0, len(new), shard_images):
+            chunk = new[chunk_start:chunk_start + shard_images]
+            name = f"{split}-{next_number:05d}.npy"
+            next_number += 1
+            tmp_path = os.path.join(output_dir, name + '.tmp')
+            # Decoded straight into the memory-mapped file, one row per image
+            shard = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8,
+                                              shape=(len(chunk),) + spec.input_shape)
+            errors = list(executor.map(decode, [(shard, row, item) for row, item in enumerate(chunk)]))
+            shard.flush()
+            del shard
+            os.replace(tmp_path, os.path.join(output_dir, name))
+
+            for row, ((_, entry), error) in enumerate(zip(chunk, errors)):
+                duplicates = new_by_hash[entry["sha256"]]
+                if error is not None:
+                    failed.extend({"path": d["path"], "size": d["size"], "mtime_ns": d["mtime_ns"], "error": error}
+                                  for d in duplicates)
+                    continue
+                for duplicate in duplicates:
+                    images.append(dict(duplicate, shard=name, row=row))
+            logger.info(f"{split}: decoded {min(chunk_start + len(chunk), len(new))}/{len(new)} new images into {name}")
+
+    images.sort(key=lambda entry: entry["path"])
+    live = {entry["shard"] for entry in images}
+    index["splits"][split] = {
+        "source": os.path.abspath(source_dir),
+        "spec": spec.to_dict(),
+        "class_names": class_names,
+        "images": images,
+        "failed": failed
+    }
+    _save_index(output_dir, index)
+
+    # Only once the new index is in place: drop shards nothing refers to any more
+    removed = 0
+    for path in glob.glob(os.path.join(glob.escape(output_dir), f"{glob.escape(split)}-*.npy*")):
+        if os.path.basename(path) not in live:
+            os.remove(path)
+            removed += 1
+    total_rows = sum(np.load(os.path.join(output_dir, name), mmap_mode='r').shape[0] for name in live)
+
+    summary = {
+        "split": split,
+        "images": len(images),
+        "decoded": sum(len(new_by_hash[entry["sha256"]]) for _, entry in new) - (len(failed) - failed_before),
+        "unchanged": unchanged,
+        "reused": reused,
+        "failed": len(failed),
+        "shards": len(live),
+        "shards_removed": removed,
+        # Rows left behind by deleted or changed images; --rebuild reclaims them
+        "dead_rows": total_rows - len({(entry["shard"], entry["row"]) for entry in images}),
+        "seconds": time.perf_counter() - start
+    }
+    logger.info(f"{split}: {summary['images']} images ({summary['decoded']} decoded, {unchanged} unchanged, "
+                f"{reused} reused, {summary['failed']} failed) in {summary['seconds']:.1f}s")
+    return summary
+
+
+class ShardedDataset:
+    """
+    Read side of one compiled split. Shards are memory-mapped, so opening a
+    dataset reads only the index, and sequential batches are views into the
+    shard files rather than copies.
+    """
+
+    def __init__(self, directory: str, split: str):
+        index = load_index(directory)
+        if split not in index["splits"]:
+            raise ValueError(f"No split '{split}' in {os.path.join(directory, INDEX_NAME)}")
+        info = index["splits"][split]
+        self.directory = directory
+        self.split = split
+        self.spec = PreprocessSpec.from_dict(info["spec"])
+        self.class_names = info["class_names"]
+
+        # Storage order, so neighbouring images are neighbouring rows
+        entries = sorted(info["images"], key=lambda entry: (entry["shard"], entry["row"]))
+        shard_names = sorted({entry["shard"] for entry in entries})
+        self._shards = [np.load(os.path.join(directory, name), mmap_mode='r') for name in shard_names]
+        shard_of = {name: i for i, name in enumerate(shard_names)}
+        self.paths = [os.path.join(info["source"], entry["path"]) for entry in entries]
+        # Content hashes, to key anything computed per image (e.g. cached teacher outputs)
+        self.hashes = [entry["sha256"] for entry in entries]
+        self.labels = np.array([entry["label"] for entry in entries], dtype=np.int64)
+        self._shard = np.array([shard_of[entry["shard"]] for entry in entries], dtype=np.int64)
+        self._row = np.array([entry["row"] for entry in entries], dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def image(self, position: int) -> np.ndarray:
+        """(H, W, C) uint8 view of one image"""
+        return self._shards[self._shard[position]][self._row[position]]
+
+    def to_float(self, images: np.ndarray) -> np.ndarray:
+        """float32 model input for a uint8 batch, with the spec's scaling"""
+        return apply_scale(images.astype(np.float32), self.spec.scale)
+
+    def _runs(self) -> Iterator[Tuple[int, int]]:
+        """(start, stop) positions of images stored in consecutive rows of one shard"""
+        start = 0
+        for i in range(1, len(self) + 1):
+            if i == len(self) or self._shard[i] != self._shard[start] or self._row[i] != self._row[start] + (i - start):
+                yield start, i
+                start = i
+
+    def iter_batches(self, batch_size: int, shuffle: bool = False,
+                     seed: Optional[int] = None) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        (uint8 images, labels, positions) batches. In storage order each batch
+        is a slice of a shard file (a run of rows can end early, giving a
+        short batch); shuffled batches are gathered shard by shard into a
+        new array.
+        """
+        if not shuffle:
+            for start, stop in self._runs():
+                shard = self._shards[self._shard[start]]
+                for first in range(start, stop, batch_size):
+                    last = min(first + batch_size, stop)
+                    row = self._row[first]
+                    yield shard[row:row + last - first], self.labels[first:last], np.arange(first, last)
+            return
+
+        order = np.random.default_rng(seed).permutation(len(self))
+        for first in range(0, len(order), batch_size):
+            positions = order[first:first + batch_size]
+            out = np.empty((len(positions),) + self.spec.input_shape, dtype=np.uint8)
+            for shard_index in np.unique(self._shard[positions]):
+                slots = np.nonzero(self._shard[positions] == shard_index)[0]
+                # Ascending rows keep the reads within a shard sequential
+                slots = slots[np.argsort(self._row[positions[slots]])]
+                out[slots] = self._shards[shard_index][self._row[positions[slots]]]
+            yield out, self.labels[positions], positions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile class-folder image trees into pre-decoded uint8 shards")
+    parser.add_argument("output", help="Dataset directory (index.json and <split>-NNNNN.npy shards)")
+    parser.add_argument("--split", action="append", required=True, metavar="NAME=DIR",
+                        help="Split name and its image folder, e.g. train=../../Teasikcnesmodel/train (repeatable)")
+    parser.add_argument("--shard-images", type=int, default=DEFAULT_SHARD_IMAGES, help="Images per shard file")
+    parser.add_argument("--threads", type=int, default=DECODE_THREADS, help="Decode threads")
+    parser.add_argument("--spec", help="Preprocessing spec JSON (default: the notebook's 128x128 bilinear RGB)")
+    parser.add_argument("--rebuild", action="store_true", help="Decode everything again and drop dead rows")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    spec = NOTEBOOK_SPEC
+    if args.spec:
+        with open(args.spec) as f:
+            spec = PreprocessSpec.from_dict(json.load(f))
+
+    try:
+        results = []
+        for item in args.split:
+            name, sep, directory = item.partition('=')
+            if not sep or not name or not directory:
+                raise ValueError(f"Expected NAME=DIR, got '{item}'")
+            results.append(compile_split(directory, args.output, name, spec, max(args.shard_images, 1),
+                                         args.threads, args.rebuild))
+    except Exception as e:
+        logger.error(f"Dataset compile failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    print(json.dumps({"success": True, "output": os.path.abspath(args.output), "splits": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
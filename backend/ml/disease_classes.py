@@ -0,0 +1,89 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Define class labels - MUST match the ones in Teasikcnesmodel/predict.py
+CLASS_LABELS = [
+    'Anthracnose',
+    'algal leaf',
+    'bird eye spot', 
+    'brown blight',
+    'gray light',
+    'healthy',
+    'red leaf spot',
+    'white spot'
+]
+
+# Treatment recommendations
+TREATMENTS = {
+    "Anthracnose": "Prune affected branches and apply fungicides containing copper or mancozeb. Ensure proper spacing between plants for good air circulation.",
+    "algal leaf": "Remove affected leaves and apply copper oxychloride. Improve drainage and reduce humidity around plants.",
+    "bird eye spot": "Apply fungicides containing carbendazim or copper. Enhance soil nutrition with balanced fertilizers.",
+    "brown blight": "Prune affected areas and apply triazole fungicides. Avoid overhead irrigation.",
+    "gray light": "Apply sulfur-based fungicides and ensure good air circulation by proper spacing and pruning.",
+    "healthy": "Continue with regular maintenance and preventive practices to keep plants healthy.",
+    "red leaf spot": "Remove infected leaves and apply fungicides containing chlorothalonil. Improve soil drainage.",
+    "white spot": "Use copper-based fungicides and maintain proper spacing. Avoid excessive nitrogen fertilization."
+}
+
+
+# Response messages; sent once in the binary handshake so clients can rebuild them
+MESSAGE_TEMPLATE = "The analysis detected {disease} with {confidence_percent:.1f}% confidence."
+HEALTHY_MESSAGE = "Good news! The tea leaves appear to be healthy."
+DEFAULT_TREATMENT = "No specific treatment recommendation available."
+
+
+def build_response(probabilities):
+    """
+    Build the predict_disease response for one image from its class probabilities
+    """
+    probabilities = np.asarray(probabilities)
+
+    # Get the predicted class index
+    result_index = int(np.argmax(probabilities))
+
+    # Format results
+    all_predictions = []
+    for i, confidence in enumerate(probabilities):
+        all_predictions.append({
+            "disease": CLASS_LABELS[i],
+            "confidence": float(confidence)
+        })
+
+    # Per-class lines are skipped entirely unless DEBUG is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        for item in all_predictions:
+            logger.debug("Class %s: %.4f", item["disease"], item["confidence"])
+
+    # Sort by confidence
+    all_predictions.sort(key=lambda x: x["confidence"], reverse=True)
+
+    # Get top prediction
+    top_disease = CLASS_LABELS[result_index]
+    top_confidence = float(probabilities[result_index])
+
+    # Get treatment recommendation
+    treatment = TREATMENTS.get(top_disease, DEFAULT_TREATMENT)
+
+    # Determine if healthy
+    is_healthy = top_disease.lower() == "healthy"
+
+    # Prepare response
+    response = {
+        "success": True,
+        "prediction": top_disease,
+        "disease": top_disease,
+        "confidence": top_confidence,
+        "treatment": treatment,
+        "all_predictions": all_predictions,
+        "healthy": is_healthy,
+        "is_healthy": is_healthy,
+        "message": MESSAGE_TEMPLATE.format(disease=top_disease, confidence_percent=top_confidence * 100)
+    }
+
+    if is_healthy:
+        response["message"] = HEALTHY_MESSAGE
+
+    return response
@@ -1,16 +1,15 @@
 import os
-import tensorflow as tf
-import numpy as np
-from PIL import Image
-import io
 from datetime import datetime
 import logging
+import threading
+from batching import create_batcher
+from inference_backends import create_backend
+from preprocessing import FALLBACK_SPEC, load_image, load_spec, validate_image
+from metrics import span
+from log_config import configure_logging
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued, see log_config.py)
+configure_logging(logging.INFO, fmt='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('tea_disease_detection')
 
 # Class labels for tea diseases
@@ -28,37 +27,46 @@ CLASS_LABELS = {
 # Path to the model file - adjust as needed
 MODEL_PATH = os.path.join(os.path.dirname(__file__), 'models/tea_disease_model.keras')
 
-# Global model instance
+# Global model instance (an inference backend, loaded on first prediction)
 model = None
 
+# Input transform for the loaded model, read from the spec file next to it
+spec = FALLBACK_SPEC
+
+# Compiled direct-call predict function for the loaded model
+predict_fn = None
+
+# Micro-batcher shared by concurrent callers (None when TEA_MAX_BATCH_SIZE is 1)
+batcher = None
+_model_lock = threading.Lock()
+
 def load_model():
     """Load the pre-trained model"""
-    global model
+    global model, spec, predict_fn, batcher
     try:
         if model is None:
-            logger.info(f"Loading model from {MODEL_PATH}")
-            model = tf.keras.models.load_model(MODEL_PATH)
-            logger.info("Model loaded successfully")
+            with _model_lock:
+                if model is None:
+                    logger.info(f"Loading model from {MODEL_PATH}")
+                    # TensorFlow is only imported here, so bad uploads are rejected without it
+                    loaded = create_backend(MODEL_PATH)
+                    spec = load_spec(loaded.path, input_shape=loaded.input_shape)
+                    predict_fn = loaded.predict_batch
+                    batcher = create_batcher(
+                        predict_fn,
+                        name='disease_detection_api'
+                    )
+                    model = loaded
+                    logger.info("Model loaded successfully")
         return model
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise Exception(f"Failed to load model: {str(e)}")
 
 def preprocess_image(image_data):
-    """Preprocess the image for prediction"""
+    """Preprocess the image for prediction using the model's preprocessing spec"""
     try:
-        # Open image from binary data
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Resize to expected input size (224x224)
-        img = img.resize((224, 224))
-        
-        # Convert to numpy array and normalize
-        img_array = np.array(img) / 255.0
-        
-        # Add batch dimension
-        img_array = np.expand_dims(img_array, axis=0)
-        
+        img_array, _ = load_image(image_data, spec)
         return img_array
     except Exception as e:
         logger.error(f"Image preprocessing failed: {str(e)}")
@@ -75,8 +83,12 @@ def predict_disease(image_data):
         dict: Prediction results with disease classification and confidences
     """
     try:
+        # Reject files that are not images before paying for the model load
+        validate_image(image_data)
+        
         # Ensure model is loaded
-        model = load_model()
+        with span('model_resolve'):
+            load_model()
         
         # Preprocess the image
         logger.info("Preprocessing image")
@@ -85,7 +97,11 @@ def predict_disease(image_data):
         # Make prediction
         logger.info("Running prediction")
         start_time = datetime.now()
-        predictions = model.predict(processed_image)
+        with span('forward'):
+            if batcher is not None:
+                predictions = batcher.predict(processed_image)
+            else:
+                predictions = predict_fn(processed_image)
         elapsed = (datetime.now() - start_time).total_seconds()
         logger.info(f"Prediction completed in {elapsed:.2f} seconds")
         
@@ -116,8 +132,6 @@ def predict_disease(image_data):
         logger.error(f"Prediction failed: {str(e)}")
         raise Exception(f"Disease detection failed: {str(e)}")
 
-# Initialize model on module import
-try:
-    load_model()
-except Exception as e:
-    logger.warning(f"Model loading deferred: {str(e)}") 
\ No newline at end of file
+def get_batching_stats():
+    """Micro-batching statistics, or None when batching is disabled"""
+    return batcher.get_stats() if batcher is not None else None
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import datetime
+import argparse
+import itertools
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+from compare_architectures import measure_in_subprocess, summarize
+from dataset_shards import compile_split
+from disease_classes import CLASS_LABELS
+from evaluate_models import EvaluatedModel, evaluate, open_batches, resolve_models
+from inference_backends import create_backend
+from model_architecture import ARCHITECTURES, build_model
+from model_registry import DEFAULT_MANIFEST_PATH, file_checksum, register_version
+from preprocessing import apply_scale, load_spec
+from train_model import (AUTOTUNE, DEFAULT_OUTPUT_DIR, build_shard_dataset, export_model, latest_checkpoint,
+                         load_shards, make_steps, run_epoch, save_checkpoint)
+
+logger = logging.getLogger(__name__)
+
+
+def teacher_log_probs(teacher_path, shards, cache_dir, batch_size=64):
+    """
+    Teacher log-probabilities for every image of a compiled split, in the
+    split's order. They are cached in cache_dir keyed by the teacher file's
+    checksum and each image's content hash, so the teacher only runs on
+    images it has not scored before (once in total, not once per epoch).
+    """
+    checksum = file_checksum(teacher_path)
+    cache_path = os.path.join(cache_dir, f"teacher_{checksum[:16]}.npz")
+    keys, values = [], np.zeros((0, len(CLASS_LABELS)), dtype=np.float32)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            keys, values = data["keys"].tolist(), data["log_probs"]
+    row_of = {key: row for row, key in enumerate(keys)}
+
+    missing = [position for position, key in enumerate(shards.hashes) if key not in row_of]
+    logger.info(f"Teacher outputs for {shards.split}: {len(shards) - len(missing)} cached, {len(missing)} to compute")
+    if missing:
+        teacher = create_backend(teacher_path)
+        spec = load_spec(teacher_path, input_shape=teacher.input_shape)
+        if spec.input_shape != shards.spec.input_shape or spec.interpolation != shards.spec.interpolation:
+            raise ValueError(f"Teacher expects {spec}, the dataset was compiled with {shards.spec}")
+        computed = np.empty((len(missing), len(CLASS_LABELS)), dtype=np.float32)
+        for start in range(0, len(missing), batch_size):
+            chunk = missing[start:start + batch_size]
+            pixels = np.stack([shards.image(position) for position in chunk]).astype(np.float32)
+            probabilities = np.asarray(teacher(apply_scale(pixels, spec.scale)))
+            computed[start:start + len(chunk)] = np.log(np.clip(probabilities, 1e-7, 1.0))
+
+        for position in missing:
+            row_of[shards.hashes[position]] = len(keys)
+            keys.append(shards.hashes[position])
+        values = np.concatenate([values, computed])
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, keys=np.array(keys), log_probs=values)
+        os.replace(tmp_path, cache_path)
+        logger.info(f"Teacher outputs cached in {cache_path}")
+
+    return values[[row_of[key] for key in shards.hashes]]
+
+
+def build_distill_dataset(shards, teacher_outputs, num_classes, batch_size, seed=None):
+    """Shuffled shard batches as ((images, teacher log-probabilities), one-hot labels)"""
+    epochs = itertools.count()
+
+    def batches():
+        epoch_seed = None if seed is None else seed + next(epochs)
+        for images, labels, positions in shards.iter_batches(batch_size, shuffle=True, seed=epoch_seed):
+            yield (images, teacher_outputs[positions]), labels
+
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(
+        (tf.TensorSpec((None,) + shards.spec.input_shape, tf.uint8), tf.TensorSpec((None, num_classes), tf.float32)),
+        tf.TensorSpec((None,), tf.int64)
+    ))
+    dataset = dataset.map(lambda inputs, labels: ((tf.cast(inputs[0], tf.float32), inputs[1]),
+                                                  tf.one_hot(labels, num_classes)),
+                          num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+
+def make_distill_step(model, temperature, alpha):
+    """
+    Compiled step minimizing alpha * cross-entropy with the labels plus
+    (1 - alpha) * T^2 * KL divergence from the teacher's to the student's
+    distribution, both softened by temperature T. Both models end in
+    softmax, so their log-probabilities stand in for logits.
+    """
+    def correct(labels, probabilities):
+        return tf.reduce_sum(tf.cast(tf.equal(tf.argmax(probabilities, 1), tf.argmax(labels, 1)), tf.float32))
+
+    @tf.function
+    def train_step(inputs, labels):
+        images, teacher_outputs = inputs
+        with tf.GradientTape() as tape:
+            probabilities = model(images, training=True)
+            student_outputs = tf.math.log(tf.clip_by_value(probabilities, 1e-7, 1.0))
+            hard = tf.reduce_mean(tf.keras.losses.categorical_crossentropy(labels, probabilities))
+            teacher_soft = tf.nn.log_softmax(teacher_outputs / temperature)
+            student_soft = tf.nn.log_softmax(student_outputs / temperature)
+            soft = tf.reduce_mean(tf.reduce_sum(tf.exp(teacher_soft) * (teacher_soft - student_soft), axis=1))
+            loss = alpha * hard + (1.0 - alpha) * temperature ** 2 * soft
+        gradients = tape.gradient(loss, model.trainable_variables)
+        model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss, correct(labels, probabilities)
+
+    return train_step
+
+
+def comparison_report(teacher_name, teacher_path, student_name, student_path, dataset_dir, valid_split, iterations):
+    """Teacher and student side by side: size, load time, latency and, with a validation split, accuracy"""
+    rows = {}
+    for name, path in ((teacher_name, teacher_path), (student_name, student_path)):
+        logger.info(f"Measuring {name}")
+        rows[name] = dict(path=os.path.abspath(path), **measure_in_subprocess(path, iterations, [1, 32]))
+
+    comparison = []
+    if valid_split:
+        models = [EvaluatedModel(teacher_name, teacher_path), EvaluatedModel(student_name, student_path)]
+        _, batches = open_batches(models, dataset=dataset_dir, split=valid_split)
+        evaluation = evaluate(models, batches)
+        for result in evaluation["models"]:
+            rows[result["name"]].update(accuracy=result["accuracy"], loss=result["loss"], macro_f1=result["macro_f1"])
+        comparison = evaluation["comparison"]
+    summarize(rows, teacher_name)
+    return {"teacher": teacher_name, "student": student_name, "models": rows, "comparison": comparison}
+
+
+def distill(args):
+    teacher_name, teacher_path = resolve_models([args.teacher] if args.teacher else [], args.manifest)[0]
+    logger.info(f"Teacher: {teacher_name} ({teacher_path})")
+
+    dataset_dir = args.dataset
+    if not dataset_dir:
+        # Decode the folders once; later runs only decode new or changed images
+        dataset_dir = os.path.join(args.output_dir, 'compiled')
+        compile_split(args.train_dir, dataset_dir, 'train')
+        if args.valid_dir:
+            compile_split(args.valid_dir, dataset_dir, 'valid')
+        args.valid_split = 'valid' if args.valid_dir else ''
+
+    train_shards = load_shards(dataset_dir, 'train')
+    if train_shards.class_names != CLASS_LABELS:
+        raise ValueError(f"Class folders {train_shards.class_names} must match the teacher's classes {CLASS_LABELS}")
+    num_classes = len(CLASS_LABELS)
+    teacher_outputs = teacher_log_probs(teacher_path, train_shards, args.teacher_cache)
+    agreement = float(np.mean(teacher_outputs.argmax(axis=1) == train_shards.labels))
+    logger.info(f"Teacher matches the training labels on {agreement:.1%} of {len(train_shards)} images")
+
+    train_set = build_distill_dataset(train_shards, teacher_outputs, num_classes, args.batch_size, args.seed)
+    valid_set = None
+    if args.valid_split:
+        valid_set = build_shard_dataset(load_shards(dataset_dir, args.valid_split), num_classes, args.batch_size,
+                                        training=False)
+
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    state, checkpoint = latest_checkpoint(args.checkpoint_dir) if args.resume else (None, None)
+    if state is not None:
+        logger.info(f"Resuming from {checkpoint} (epoch {state['epoch']} of {args.epochs})")
+        model = tf.keras.models.load_model(checkpoint)
+        history = state["history"]
+        initial_epoch = state["epoch"]
+        architecture = state["architecture"]
+        args.architecture, args.width_multiplier = architecture["name"], architecture["width_multiplier"]
+    else:
+        model = build_model(args.architecture, num_classes=num_classes, learning_rate=args.learning_rate,
+                            width_multiplier=args.width_multiplier)
+        logger.info(f"Built {args.architecture} student with {model.count_params():,} parameters")
+        history = []
+        initial_epoch = 0
+
+    train_step = make_distill_step(model, args.temperature, args.alpha)
+    _, eval_step = make_steps(model)
+    for epoch in range(initial_epoch + 1, args.epochs + 1):
+        record = {"epoch": epoch, "train": run_epoch(train_step, train_set)}
+        if valid_set is not None:
+            record["validation"] = run_epoch(eval_step, valid_set)
+        history.append(record)
+        stats = record["train"]
+        message = (f"Epoch {epoch}/{args.epochs}: {stats['wall_seconds']:.1f}s, {stats['images_per_second']:.1f} img/s, "
+                   f"distillation loss {stats['loss']:.4f}, accuracy {stats['accuracy']:.4f}")
+        if valid_set is not None:
+            message += f", val_loss {record['validation']['loss']:.4f}, val_accuracy {record['validation']['accuracy']:.4f}"
+        logger.info(message)
+        save_checkpoint(model, args.checkpoint_dir, epoch, history, args.keep_checkpoints,
+                        {"name": args.architecture, "width_multiplier": args.width_multiplier})
+
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    version = f"{args.architecture}_w{args.width_multiplier:g}_distilled_v{timestamp}"
+    model_path = os.path.join(args.output_dir, f"trained_model_{version}.keras")
+    history_path = export_model(model, model_path, {
+        "class_names": CLASS_LABELS, "architecture": args.architecture, "width_multiplier": args.width_multiplier,
+        "distillation": {"teacher": teacher_name, "teacher_path": os.path.abspath(teacher_path),
+                         "temperature": args.temperature, "alpha": args.alpha},
+        "epochs": history
+    })
+    if args.register or args.activate:
+        register_version(version, model_path, activate=args.activate, manifest_path=args.manifest)
+
+    result = {"success": True, "model": os.path.abspath(model_path), "history": os.path.abspath(history_path),
+              "epochs_trained": max(args.epochs - initial_epoch, 0), "final": history[-1] if history else None}
+    if not args.skip_report:
+        report = comparison_report(teacher_name, teacher_path, os.path.basename(model_path), model_path,
+                                   dataset_dir, args.valid_split, args.report_iterations)
+        report_path = os.path.splitext(model_path)[0] + '.distill.json'
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        student = report["models"][os.path.basename(model_path)]
+        teacher = report["models"][teacher_name]
+        logger.info(f"Student: {student['latency']['1']['per_image_ms']:.2f} ms/image vs teacher "
+                    f"{teacher['latency']['1']['per_image_ms']:.2f} ms/image "
+                    f"({student['relative_to_baseline']['latency_speedup']:.1f}x faster)"
+                    + (f", accuracy {student['accuracy']:.4f} vs {teacher['accuracy']:.4f}"
+                       if student.get("accuracy") is not None else ""))
+        result["report"] = os.path.abspath(report_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill the current model into a smaller student with soft targets")
+    parser.add_argument("--teacher", help="Teacher model file or manifest version (default: the active model)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--dataset", help="Compiled dataset from dataset_shards.py (its 'train' split is distilled on)")
+    parser.add_argument("--train-dir", help="Training images in one subfolder per class, compiled into <output-dir>/compiled")
+    parser.add_argument("--valid-dir", help="Validation images for --train-dir")
+    parser.add_argument("--valid-split", default="valid", help="Split of --dataset to validate and report on ('' to skip)")
+    parser.add_argument("--architecture", choices=ARCHITECTURES, default="compact")
+    parser.add_argument("--width-multiplier", type=float, default=0.5)
+    parser.add_argument("--temperature", type=float, default=4.0, help="Softening temperature for teacher and student")
+    parser.add_argument("--alpha", type=float, default=0.5, help="Weight of the hard-label loss (the rest is the soft-target loss)")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--teacher-cache", help="Cached teacher outputs (default: <output-dir>/teacher_cache)")
+    parser.add_argument("--checkpoint-dir", help="Per-epoch checkpoints (default: <output-dir>/distill_checkpoints)")
+    parser.add_argument("--keep-checkpoints", type=int, default=2)
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument("--register", action="store_true", help="Add the student to the manifest")
+    parser.add_argument("--activate", action="store_true", help="Register the student and make it active")
+    parser.add_argument("--skip-report", action="store_true", help="Do not measure and compare teacher and student")
+    parser.add_argument("--report-iterations", type=int, default=30, help="Timed forward passes per batch size in the report")
+    args = parser.parse_args()
+    if not args.train_dir and not args.dataset:
+        parser.error("one of --train-dir or --dataset is required")
+    args.teacher_cache = args.teacher_cache or os.path.join(args.output_dir, 'teacher_cache')
+    args.checkpoint_dir = args.checkpoint_dir or os.path.join(args.output_dir, 'distill_checkpoints')
+    args.keep_checkpoints = max(args.keep_checkpoints, 1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        result = distill(args)
+    except Exception as e:
+        logger.error(f"Distillation failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from dataset_shards import ShardedDataset, list_images
+from disease_classes import CLASS_LABELS
+from inference_backends import create_backend
+from metrics import Histogram
+from model_registry import DEFAULT_MANIFEST_PATH, ModelRegistry, file_checksum
+from preprocessing import DECODE_THREADS, PreprocessSpec, allocate_batch, apply_scale, decode_into, load_spec
+
+logger = logging.getLogger(__name__)
+
+
+class EvaluationStats:
+    """
+    Running totals for one model: confusion matrix, log loss and forward
+    pass latency. Memory use does not grow with the number of images.
+    """
+
+    def __init__(self, num_classes: int = len(CLASS_LABELS)):
+        self.confusion = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.loss_sum = 0.0
+        self.images = 0
+        self.seconds = 0.0
+        self.batch_latency = Histogram()
+
+    def update(self, labels: np.ndarray, probabilities: np.ndarray, seconds: float) -> np.ndarray:
+        """Add one batch; returns the predicted class of each image"""
+        predicted = probabilities.argmax(axis=1)
+        np.add.at(self.confusion, (labels, predicted), 1)
+        true_probability = probabilities[np.arange(len(labels)), labels]
+        self.loss_sum += float(-np.log(np.clip(true_probability, 1e-7, 1.0)).sum())
+        self.images += len(labels)
+        self.seconds += seconds
+        self.batch_latency.observe(seconds)
+        return predicted
+
+    def report(self, class_names: Sequence[str] = CLASS_LABELS) -> Dict:
+        confusion = self.confusion
+        true_positives = np.diag(confusion).astype(np.float64)
+        predicted_totals = confusion.sum(axis=0)
+        support = confusion.sum(axis=1)
+        per_class = {}
+        for i, name in enumerate(class_names):
+            precision = true_positives[i] / predicted_totals[i] if predicted_totals[i] else None
+            recall = true_positives[i] / support[i] if support[i] else None
+            f1 = (2 * precision * recall / (precision + recall)
+                  if precision is not None and recall is not None and precision + recall > 0 else None)
+            per_class[name] = {"precision": precision, "recall": recall, "f1": f1, "support": int(support[i])}
+
+        # Macro averages over the classes present in the evaluation set
+        present = [per_class[name] for i, name in enumerate(class_names) if support[i]]
+
+        def macro(key):
+            return float(np.mean([c[key] or 0.0 for c in present])) if present else None
+
+        batch_latency = self.batch_latency.to_dict()
+        return {
+            "images": self.images,
+            "accuracy": float(true_positives.sum() / self.images) if self.images else None,
+            "loss": self.loss_sum / self.images if self.images else None,
+            "macro_precision": macro("precision"),
+            "macro_recall": macro("recall"),
+            "macro_f1": macro("f1"),
+            "per_class": per_class,
+            "confusion_matrix": {"labels": list(class_names), "rows": "true", "columns": "predicted",
+                                 "matrix": confusion.tolist()},
+            "latency": {
+                "per_image_ms": self.seconds / self.images * 1000.0 if self.images else None,
+                "images_per_second": self.images / self.seconds if self.seconds > 0 else 0.0,
+                "per_batch": batch_latency
+            }
+        }
+
+
+class PairwiseStats:
+    """Running agreement between two models' top-1 predictions"""
+
+    def __init__(self, first: str, second: str):
+        self.first = first
+        self.second = second
+        self.counts = {"agree": 0, "both_correct": 0, "only_first_correct": 0,
+                       "only_second_correct": 0, "both_wrong": 0}
+
+    def update(self, labels: np.ndarray, first: np.ndarray, second: np.ndarray) -> None:
+        first_correct = first == labels
+        second_correct = second == labels
+        self.counts["agree"] += int((first == second).sum())
+        self.counts["both_correct"] += int((first_correct & second_correct).sum())
+        self.counts["only_first_correct"] += int((first_correct & ~second_correct).sum())
+        self.counts["only_second_correct"] += int((~first_correct & second_correct).sum())
+        self.counts["both_wrong"] += int((~first_correct & ~second_correct).sum())
+
+    def report(self) -> Dict:
+        total = sum(self.counts[k] for k in ("both_correct", "only_first_correct", "only_second_correct", "both_wrong"))
+        return dict(self.counts, first=self.first, second=self.second,
+                    agreement=self.counts["agree"] / total if total else None)
+
+
+class EvaluatedModel:
+    """A loaded model with its preprocessing spec and running stats"""
+
+    def __init__(self, name: str, path: str, backend: str = 'auto'):
+        self.name = name
+        self.path = path
+        self.predict_fn = create_backend(path, backend)
+        self.spec = load_spec(path, input_shape=getattr(self.predict_fn, 'input_shape', None))
+        self.stats = EvaluationStats()
+
+    def describe(self) -> Dict:
+        info = {"name": self.name, "path": os.path.abspath(self.path), "checksum": file_checksum(self.path),
+                "preprocessing": self.spec.to_dict()}
+        if hasattr(self.predict_fn, 'describe'):
+            info["backend"] = self.predict_fn.describe()
+        return info
+
+
+def resolve_models(names: Sequence[str], manifest_path: str = DEFAULT_MANIFEST_PATH,
+                   backend: str = 'auto') -> List[Tuple[str, str]]:
+    """(name, path) for each model file or manifest version name; the active version if none given"""
+    registry = ModelRegistry(manifest_path, backend=backend)
+    active, versions = registry.read_manifest() if os.path.exists(manifest_path) else (None, {})
+    resolved = []
+    for name in names or [active]:
+        if name in versions:
+            resolved.append((name, versions[name]))
+        elif name and os.path.exists(name):
+            resolved.append((os.path.basename(name), name))
+        else:
+            raise ValueError(f"'{name}' is neither a model file nor a version in {manifest_path}")
+    return resolved
+
+
+def _raw_key(spec: PreprocessSpec) -> Tuple:
+    """Everything about a spec that changes the decoded pixels (not the value scaling)"""
+    return (spec.image_size, spec.color_mode, spec.interpolation)
+
+
+def _label_map(class_names: Sequence[str]) -> np.ndarray:
+    """Dataset class index -> index in CLASS_LABELS (the models' output order)"""
+    missing = [name for name in class_names if name not in CLASS_LABELS]
+    if missing:
+        raise ValueError(f"Class folders {missing} are not model classes {CLASS_LABELS}")
+    return np.array([CLASS_LABELS.index(name) for name in class_names], dtype=np.int64)
+
+
+def directory_batches(directory: str, specs: Dict[Tuple, PreprocessSpec], batch_size: int,
+                      decode_threads: int = DECODE_THREADS, prefetch: int = 2) -> Iterator[Tuple]:
+    """
+    (paths, labels, {raw key: uint8-valued batch}, errors) for a class-folder
+    tree. Each image is decoded once per distinct pixel spec, in a thread
+    pool running up to `prefetch` batches ahead of the caller.
+    """
+    paths, labels, class_names = list_images(directory)
+    labels = _label_map(class_names)[np.asarray(labels)]
+    # Value scaling is applied per model later, so decode raw pixels only
+    raw_specs = {key: PreprocessSpec(spec.image_size, spec.color_mode, spec.interpolation, 'none')
+                 for key, spec in specs.items()}
+    pending = deque()
+
+    def decode(path, buffers, row):
+        for key, spec in raw_specs.items():
+            decode_into(path, buffers[key][row], spec)
+
+    def submit(start):
+        chunk = paths[start:start + batch_size]
+        buffers = {key: allocate_batch(len(chunk), spec) for key, spec in raw_specs.items()}
+        futures = [executor.submit(decode, path, buffers, row) for row, path in enumerate(chunk)]
+        pending.append((chunk, labels[start:start + batch_size], buffers, futures))
+
+    with ThreadPoolExecutor(max_workers=max(decode_threads, 1)) as executor:
+        starts = iter(range(0, len(paths), batch_size))
+        for start in starts:
+            submit(start)
+            if len(pending) > prefetch:
+                break
+        while pending:
+            chunk, batch_labels, buffers, futures = pending.popleft()
+            following = next(starts, None)
+            if following is not None:
+                submit(following)
+            errors = {}
+            for row, future in enumerate(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    errors[row] = str(e)
+            yield chunk, batch_labels, buffers, errors
+
+
+def shard_batches(dataset: ShardedDataset, specs: Dict[Tuple, PreprocessSpec], batch_size: int) -> Iterator[Tuple]:
+    """The same batches from a compiled split, as views into its shards (no decoding)"""
+    stored = _raw_key(dataset.spec)
+    for key in specs:
+        if key != stored:
+            raise ValueError(f"Split '{dataset.split}' was compiled as {dataset.spec}, a model needs {specs[key]}; "
+                             f"evaluate the image folder instead")
+    label_map = _label_map(dataset.class_names)
+    for images, labels, positions in dataset.iter_batches(batch_size):
+        yield [dataset.paths[p] for p in positions], label_map[labels], {stored: images}, {}
+
+
+def open_batches(models: List[EvaluatedModel], target: Optional[str] = None, dataset: Optional[str] = None,
+                 split: str = 'valid', batch_size: int = 32, decode_threads: int = DECODE_THREADS) -> Tuple[str, Iterator]:
+    """(description, batches) for an image folder or a compiled dataset split, decoded as the models need"""
+    specs = {_raw_key(model.spec): model.spec for model in models}
+    batch_size = max(batch_size, 1)
+    if dataset:
+        return f"{os.path.abspath(dataset)} ({split})", shard_batches(ShardedDataset(dataset, split), specs, batch_size)
+    return os.path.abspath(target), directory_batches(target, specs, batch_size, decode_threads)
+
+
+def evaluate(models: List[EvaluatedModel], batches: Iterator[Tuple], predictions_path: Optional[str] = None,
+             log_every: int = 20) -> Dict:
+    """
+    Score every batch with every model and accumulate the stats. Decoded
+    batches are shared between models; per-image predictions are only
+    streamed to predictions_path, never kept.
+    """
+    pairs = [(i, j, PairwiseStats(models[i].name, models[j].name))
+             for i in range(len(models)) for j in range(i + 1, len(models))]
+    predictions_file = open(predictions_path, 'w') if predictions_path else None
+    processed = failed = 0
+    start = time.perf_counter()
+    try:
+        for batch_number, (paths, labels, buffers, errors) in enumerate(batches, 1):
+            ok_rows = [row for row in range(len(paths)) if row not in errors]
+            failed += len(errors)
+            for row, error in errors.items():
+                logger.warning(f"Skipping {paths[row]}: {error}")
+            if not ok_rows:
+                continue
+            ok_labels = labels[ok_rows]
+
+            predicted = []
+            for model in models:
+                pixels = buffers[_raw_key(model.spec)]
+                pixels = pixels if len(ok_rows) == len(paths) else pixels[ok_rows]
+                # Float pixels are only copied when this model scales them in place
+                inputs = apply_scale(pixels.astype(np.float32, copy=model.spec.scale != 'none'), model.spec.scale)
+                forward_start = time.perf_counter()
+                probabilities = np.asarray(model.predict_fn(inputs))
+                predicted.append(model.stats.update(ok_labels, probabilities, time.perf_counter() - forward_start))
+
+            for i, j, pair in pairs:
+                pair.update(ok_labels, predicted[i], predicted[j])
+
+            if predictions_file is not None:
+                for position, row in enumerate(ok_rows):
+                    predictions_file.write(json.dumps({
+                        "image_path": paths[row],
+                        "label": CLASS_LABELS[ok_labels[position]],
+                        "predictions": {model.name: CLASS_LABELS[predicted[m][position]] for m, model in enumerate(models)}
+                    }) + '\n')
+
+            processed += len(ok_rows)
+            if batch_number % log_every == 0:
+                elapsed = time.perf_counter() - start
+                logger.info(f"Evaluated {processed} images ({processed / elapsed:.1f} images/sec)")
+    finally:
+        if predictions_file is not None:
+            predictions_file.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        "images": processed,
+        "failed": failed,
+        "seconds": elapsed,
+        "images_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "models": [dict(model.describe(), **model.stats.report()) for model in models],
+        "comparison": [pair.report() for _, _, pair in pairs]
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate one or more models on a labelled image set in a single pass")
+    parser.add_argument("target", nargs="?", help="Image folder with one subfolder per class (e.g. Teasikcnesmodel/valid)")
+    parser.add_argument("--dataset", help="Compiled dataset from dataset_shards.py, instead of an image folder")
+    parser.add_argument("--split", default="valid", help="Split of --dataset to evaluate")
+    parser.add_argument("--model", action="append", default=[],
+                        help="Model file or manifest version, e.g. v20250412_035536 (repeatable; default: the active model)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH)
+    parser.add_argument("--backend", default="auto", help="Inference backend for every model (default: by file extension)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--decode-threads", type=int, default=DECODE_THREADS)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    parser.add_argument("--predictions", help="Stream per-image predictions to this JSONL file")
+    args = parser.parse_args()
+    if not args.target and not args.dataset:
+        parser.error("an image folder or --dataset is required")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        models = []
+        for name, path in resolve_models(args.model, args.manifest, args.backend):
+            logger.info(f"Loading {name} from {path}")
+            models.append(EvaluatedModel(name, path, args.backend))
+        if len({model.name for model in models}) != len(models):
+            raise ValueError("Models must have distinct names")
+        source, batches = open_batches(models, args.target, args.dataset, args.split, args.batch_size, args.decode_threads)
+        report = dict(success=True, source=source, **evaluate(models, batches, args.predictions))
+    except Exception as e:
+        logger.error(f"Evaluation failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    for model in report["models"]:
+        if not model["images"]:
+            continue
+        logger.info(f"{model['name']}: accuracy {model['accuracy']:.4f}, loss {model['loss']:.4f}, "
+                    f"macro F1 {model['macro_f1']:.4f}, {model['latency']['images_per_second']:.1f} img/s")
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
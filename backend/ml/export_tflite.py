@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from contextlib import redirect_stdout
+from itertools import islice
+
+import numpy as np
+import tensorflow as tf
+
+from batch_predict import iter_image_paths
+from benchmark_suite import latency_stats
+from disease_classes import CLASS_LABELS
+from fast_inference import compile_model
+from model_registry import ModelRegistry
+from preprocessing import load_image, load_spec, save_spec
+from tflite_inference import TFLitePredictor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MODES = ('dynamic', 'float16', 'int8')
+
+
+def default_model_path():
+    """Active model from model_manifest.json"""
+    active, versions = ModelRegistry().read_manifest()
+    return versions[active]
+
+
+def representative_dataset(calibration_dir, spec, limit):
+    """Calibration batches for int8 quantization, preprocessed exactly like inference input"""
+    paths = list(islice(iter_image_paths(calibration_dir), limit))
+    if not paths:
+        raise ValueError(f"No calibration images found in {calibration_dir}")
+    logger.info(f"Calibrating with {len(paths)} images from {calibration_dir}")
+
+    def generate():
+        for path in paths:
+            try:
+                batch, _ = load_image(path, spec)
+            except Exception as e:
+                logger.warning(f"Skipping calibration image {path}: {str(e)}")
+                continue
+            yield [batch]
+    return generate
+
+
+def convert(model, mode, spec, calibration_dir=None, calibration_limit=200):
+    """
+    Convert a Keras model to TFLite bytes.
+
+    dynamic: int8 weights, float activations (no calibration needed)
+    float16: float16 weights
+    int8:    int8 weights and activations calibrated on calibration_dir,
+             with float32 input and output so callers are unchanged
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        if not calibration_dir:
+            raise ValueError("int8 export needs --calibration-dir")
+        converter.representative_dataset = representative_dataset(calibration_dir, spec, calibration_limit)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Keras prints the intermediate SavedModel signature; keep stdout for the JSON report
+    with redirect_stdout(sys.stderr):
+        return converter.convert()
+
+
+def label_for(path):
+    """Class label from the parent directory name, or None if it is not a known class"""
+    folder = os.path.basename(os.path.dirname(path)).lower()
+    for label in CLASS_LABELS:
+        if label.lower() == folder:
+            return label
+    return None
+
+
+def compare(keras_fn, tflite_fn, spec, eval_dir, limit=None):
+    """
+    Run both models image by image over eval_dir and report accuracy
+    (when images sit in class-named folders), top-1 agreement, probability
+    drift and batch-size-1 latency
+    """
+    paths = list(islice(iter_image_paths(eval_dir), limit))
+    if not paths:
+        raise ValueError(f"No evaluation images found in {eval_dir}")
+
+    latencies = {"keras": [], "tflite": []}
+    correct = {"keras": 0, "tflite": 0}
+    labelled = agree = compared = 0
+    max_diff = total_diff = 0.0
+
+    for path in paths:
+        try:
+            batch, _ = load_image(path, spec)
+        except Exception as e:
+            logger.warning(f"Skipping evaluation image {path}: {str(e)}")
+            continue
+        compared += 1
+        outputs = {}
+        for name, fn in (("keras", keras_fn), ("tflite", tflite_fn)):
+            start = time.perf_counter()
+            outputs[name] = np.asarray(fn(batch))[0]
+            latencies[name].append(time.perf_counter() - start)
+
+        top = {name: int(np.argmax(probs)) for name, probs in outputs.items()}
+        agree += top["keras"] == top["tflite"]
+        diff = float(np.abs(outputs["keras"] - outputs["tflite"]).max())
+        max_diff = max(max_diff, diff)
+        total_diff += diff
+
+        label = label_for(path)
+        if label is not None:
+            labelled += 1
+            for name in correct:
+                correct[name] += CLASS_LABELS[top[name]] == label
+
+    if not compared:
+        raise ValueError(f"None of the images in {eval_dir} could be decoded")
+
+    report = {
+        "images": compared,
+        "skipped_images": len(paths) - compared,
+        "labelled_images": labelled,
+        "top1_agreement": agree / compared,
+        "max_abs_probability_diff": max_diff,
+        "mean_max_abs_probability_diff": total_diff / compared,
+    }
+    for name in ("keras", "tflite"):
+        report[name] = {
+            "accuracy": (correct[name] / labelled) if labelled else None,
+            "latency": latency_stats(latencies[name])
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the tea disease model to quantized TFLite and compare it with the original")
+    parser.add_argument("--model", help="Keras model to export (default: active model in model_manifest.json)")
+    parser.add_argument("--mode", choices=MODES, default="dynamic")
+    parser.add_argument("--calibration-dir", help="Images used to calibrate int8 activations")
+    parser.add_argument("--calibration-limit", type=int, default=200)
+    parser.add_argument("--output", help="Output .tflite path (default: <model>.<mode>.tflite)")
+    parser.add_argument("--eval-dir", help="Held-out images (class-named subfolders give accuracy) for the comparison report")
+    parser.add_argument("--eval-limit", type=int)
+    parser.add_argument("--report", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    try:
+        model_path = args.model or default_model_path()
+        output_path = args.output or f"{os.path.splitext(model_path)[0]}.{args.mode}.tflite"
+
+        logger.info(f"Loading {model_path}")
+        model = tf.keras.models.load_model(model_path)
+        spec = load_spec(model_path, input_shape=model.input_shape)
+
+        start = time.perf_counter()
+        data = convert(model, args.mode, spec, args.calibration_dir, args.calibration_limit)
+        export_seconds = time.perf_counter() - start
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        # The quantized model must be fed exactly what the original was trained on
+        save_spec(output_path, spec)
+        logger.info(f"Wrote {output_path} ({len(data) / 1e6:.1f} MB) in {export_seconds:.1f}s")
+
+        report = {
+            "success": True,
+            "model": os.path.abspath(model_path),
+            "output": os.path.abspath(output_path),
+            "mode": args.mode,
+            "export_seconds": export_seconds,
+            "keras_bytes": os.path.getsize(model_path),
+            "tflite_bytes": len(data)
+        }
+        if args.eval_dir:
+            report["comparison"] = compare(compile_model(model), TFLitePredictor(output_path), spec,
+                                           args.eval_dir, args.eval_limit)
+    except Exception as e:
+        logger.error(f"Export failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+import os
+import logging
+from typing import Sequence
+
+import numpy as np
+import tensorflow as tf
+
+logger = logging.getLogger(__name__)
+
+# Set TEA_XLA=1 to let XLA compile the traced graph (helps on some CPUs)
+USE_XLA = os.environ.get('TEA_XLA', '0') == '1'
+
+# Spatial size used for warmup when the model accepts any input size
+DEFAULT_WARMUP_SIZE = (128, 128)
+
+
+class CompiledPredictor:
+    """
+    Direct-call inference path for a Keras model.
+
+    model.predict builds a tf.data pipeline and runs the callback machinery
+    on every call, which costs more than the forward pass itself for a single
+    small image. This traces model(x, training=False) once into a tf.function
+    with a fixed input signature and calls it directly.
+    """
+
+    def __init__(self, model, warmup_batch_sizes: Sequence[int] = (1,)):
+        self.model = model
+
+        input_shape = tuple(model.input_shape)
+        # Only the batch dimension is left open so every batch size reuses one trace
+        self.input_spec = tf.TensorSpec(shape=(None,) + input_shape[1:], dtype=tf.float32)
+        self._fn = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[self.input_spec],
+            jit_compile=USE_XLA
+        )
+
+        height = input_shape[1] or DEFAULT_WARMUP_SIZE[0]
+        width = input_shape[2] or DEFAULT_WARMUP_SIZE[1]
+        self.warmup_shape = (height, width, input_shape[3] or 3)
+        self.warmup(warmup_batch_sizes)
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        """Trace the graph and run it once per batch size so the first request is not slow"""
+        for batch_size in batch_sizes:
+            self._fn(tf.zeros((batch_size,) + self.warmup_shape, dtype=tf.float32))
+        logger.info(f"Compiled inference path warmed up for batch sizes {list(batch_sizes)} (xla={USE_XLA})")
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self._fn(tf.convert_to_tensor(batch, dtype=tf.float32)).numpy()
+
+
+def compile_model(model, warmup_batch_sizes: Sequence[int] = (1,)) -> CompiledPredictor:
+    """Wrap a loaded Keras model in a warmed, directly callable predict function"""
+    return CompiledPredictor(model, warmup_batch_sizes=warmup_batch_sizes)
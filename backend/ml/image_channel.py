@@ -0,0 +1,148 @@
+import os
+import mmap
+import struct
+import logging
+import tempfile
+import threading
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Record header: magic, sequence number, payload length (little-endian)
+HEADER = struct.Struct('<4sIQ')
+MAGIC = b'TEAI'
+# Records start on 64-byte boundaries so headers never straddle a cache line
+ALIGNMENT = 64
+
+# Each writer gets its own spool file in this directory; /dev/shm is RAM-backed
+# on Linux, so nothing touches the disk
+DEFAULT_SPOOL_DIR = os.environ.get('TEA_SPOOL_DIR', '/dev/shm' if os.path.isdir('/dev/shm') else None)
+# Fixed spool file instead; created exclusively, so two writers can never share it
+DEFAULT_SPOOL_PATH = os.environ.get('TEA_SPOOL_PATH') or None
+DEFAULT_SPOOL_BYTES = int(os.environ.get('TEA_SPOOL_MB', '64')) * 1024 * 1024
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class SpoolReader:
+    """
+    Worker side of the spool channel.
+
+    The spool is a plain file (normally on /dev/shm) that the client writes
+    image records into. Each record is a 16-byte header (b'TEAI', uint32
+    sequence, uint64 length) followed by the image bytes. read() returns a
+    memoryview of the payload inside the mmap'd file, so the image is
+    decoded straight from shared memory without a copy or a temporary file.
+    Mappings are kept open per path and re-mapped when the file grows.
+    """
+
+    def __init__(self):
+        self._maps = {}
+        self._lock = threading.Lock()
+
+    def _mapping(self, path: str, needed: int) -> mmap.mmap:
+        with self._lock:
+            mapped = self._maps.get(path)
+            if mapped is None or len(mapped) < needed:
+                with open(path, 'rb') as f:
+                    size = os.fstat(f.fileno()).st_size
+                    if size < needed:
+                        raise ValueError(f"Spool record at {needed} is past the end of {path} ({size} bytes)")
+                    # Views handed out earlier keep the old mapping alive until they are released
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps[path] = mapped
+            return mapped
+
+    def read(self, path: str, offset: int, sequence: Optional[int] = None) -> memoryview:
+        """Payload of the record at offset, checked against the header (and sequence, when given)"""
+        offset = int(offset)
+        if offset < 0 or offset % ALIGNMENT:
+            raise ValueError(f"Spool offset must be a non-negative multiple of {ALIGNMENT}, got {offset}")
+        mapped = self._mapping(path, offset + HEADER.size)
+        magic, record_sequence, length = HEADER.unpack_from(mapped, offset)
+        if magic != MAGIC:
+            raise ValueError(f"No spool record at offset {offset} of {path}")
+        if sequence is not None and record_sequence != int(sequence):
+            # The client reused this slot before the worker got to it
+            raise ValueError(f"Spool record at offset {offset} was overwritten "
+                             f"(sequence {record_sequence}, expected {sequence})")
+        start = offset + HEADER.size
+        mapped = self._mapping(path, start + length)
+        return memoryview(mapped)[start:start + length]
+
+    def close(self) -> None:
+        with self._lock:
+            maps, self._maps = self._maps, {}
+        for mapped in maps.values():
+            try:
+                mapped.close()
+            except BufferError:
+                # Still referenced by a request in flight; freed with its last view
+                pass
+
+
+class SpoolWriter:
+    """
+    Client side of the spool channel: a fixed-size ring of records.
+
+    write() copies an image into the next free slot and returns the fields
+    for the worker request ({"spool", "offset", "sequence"}). A slot stays
+    reserved until release(offset) is called, which the client does once
+    the response for that request has arrived; write() raises BufferError
+    when the ring has no room for the record.
+
+    The spool file belongs to this writer alone: without a path a new one is
+    created in DEFAULT_SPOOL_DIR, and an explicit path must not exist yet.
+    Otherwise two clients would overwrite each other's records with matching
+    sequence numbers, and a worker would score the wrong image.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_SPOOL_PATH, capacity: int = DEFAULT_SPOOL_BYTES):
+        if path:
+            try:
+                fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+            except FileExistsError:
+                raise FileExistsError(f"Spool {path} already exists; another client may be using it")
+        else:
+            fd, path = tempfile.mkstemp(prefix='tea_spool_', dir=DEFAULT_SPOOL_DIR)
+        self.path = path
+        self.capacity = _align(capacity)
+        self._file = os.fdopen(fd, 'w+b')
+        self._file.truncate(self.capacity)
+        self._map = mmap.mmap(self._file.fileno(), self.capacity)
+        self._head = 0
+        self._sequence = 0
+        self._reserved = {}
+        self._lock = threading.Lock()
+
+    def _fits(self, start: int, end: int) -> bool:
+        return all(end <= used_start or start >= used_end for used_start, used_end in self._reserved.items())
+
+    def write(self, data) -> Dict:
+        size = _align(HEADER.size + len(data))
+        if size > self.capacity:
+            raise ValueError(f"Image of {len(data)} bytes does not fit in a {self.capacity}-byte spool")
+        with self._lock:
+            start = self._head if self._head + size <= self.capacity else 0
+            if not self._fits(start, start + size):
+                raise BufferError("Spool is full; release finished records first")
+            self._sequence = (self._sequence + 1) & 0xffffffff
+            payload = start + HEADER.size
+            self._map[payload:payload + len(data)] = data
+            # Header last, so a reader never sees a valid header over a partial payload
+            HEADER.pack_into(self._map, start, MAGIC, self._sequence, len(data))
+            self._reserved[start] = start + size
+            self._head = start + size
+            return {"spool": self.path, "offset": start, "sequence": self._sequence}
+
+    def release(self, offset: int) -> None:
+        with self._lock:
+            self._reserved.pop(offset, None)
+
+    def close(self, unlink: bool = True) -> None:
+        self._map.close()
+        self._file.close()
+        if unlink:
+            os.unlink(self.path)
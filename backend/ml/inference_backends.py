@@ -0,0 +1,269 @@
+import os
+import glob
+import logging
+import time
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from thread_config import THREAD_PROFILE, ThreadProfile, apply_tensorflow_threads
+
+logger = logging.getLogger(__name__)
+
+# keras, tflite, onnx, or auto to pick by model file extension
+DEFAULT_BACKEND = os.environ.get('TEA_INFERENCE_BACKEND', 'auto').lower()
+
+EXTENSIONS = {
+    'keras': ('.keras', '.h5', '.tf'),
+    'tflite': ('.tflite',),
+    'onnx': ('.onnx',)
+}
+
+
+def current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (Linux), or None where /proc is not available"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class InferenceBackend:
+    """
+    Common interface for running the tea disease model.
+
+    load() reads the model file, warmup() runs dummy batches so the first
+    request does not pay for graph building or tensor allocation, and
+    predict_batch() maps a float32 (N, H, W, C) batch to (N, classes)
+    probabilities. Instances are callable so they can be used anywhere a
+    predict function is expected (registry, micro-batcher).
+    """
+
+    name = 'base'
+
+    def __init__(self, path: str, threads: Optional[ThreadProfile] = None):
+        self.path = path
+        # Thread pool sizes (thread_config.py); the process-wide profile by default
+        self.threads = threads or THREAD_PROFILE
+        self.input_shape = None
+        self.load_seconds = None
+        self.load_rss_bytes = None
+        # Model file contents read by preload(), shared copy-on-write with forked workers
+        self.model_content = None
+
+    def preload(self) -> "InferenceBackend":
+        """
+        Read whatever can be shared with forked worker processes before the
+        runtime starts threads (see worker_pool.py). A no-op for runtimes that
+        must be loaded in the process that uses them.
+        """
+        return self
+
+    def load(self) -> "InferenceBackend":
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        self._load()
+        self.load_seconds = time.perf_counter() - start
+        rss_after = current_rss_bytes()
+        if rss_before is not None and rss_after is not None:
+            self.load_rss_bytes = rss_after - rss_before
+        logger.info(f"Loaded {self.path} with the {self.name} backend in {self.load_seconds:.2f}s")
+        return self
+
+    def _load(self) -> None:
+        raise NotImplementedError
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        height, width, channels = (d or 128 for d in self.input_shape[1:])
+        for batch_size in batch_sizes:
+            self.predict_batch(np.zeros((batch_size, height, width, channels), dtype=np.float32))
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        return self.predict_batch(batch)
+
+    def threading(self) -> Dict:
+        return {}
+
+    def describe(self) -> Dict:
+        """Backend name, threading settings and memory footprint"""
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "input_shape": list(self.input_shape) if self.input_shape else None,
+            "file_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else None,
+            "load_seconds": self.load_seconds,
+            # RSS growth while loading: weights plus runtime buffers
+            "load_rss_bytes": self.load_rss_bytes,
+            "process_rss_bytes": current_rss_bytes(),
+            "threading": self.threading(),
+            "thread_profile": self.threads.to_dict()
+        }
+
+
+class KerasBackend(InferenceBackend):
+    """
+    Keras model called through the traced tf.function in fast_inference.py.
+    Nothing is preloaded: TensorFlow is not fork-safe once initialized, so
+    every worker process loads its own copy.
+    """
+
+    name = 'keras'
+
+    def _load(self) -> None:
+        # Imported on first load so callers that never need the model never pay for TensorFlow
+        import tensorflow as tf
+        from fast_inference import compile_model
+
+        logger.info(f"TensorFlow version: {tf.__version__}")
+        apply_tensorflow_threads(tf, self.threads)
+        self.model = tf.keras.models.load_model(self.path)
+        self.input_shape = tuple(self.model.input_shape)
+        # compile_model traces and warms batch size 1
+        self._predict = compile_model(self.model)
+
+    def warmup(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        self._predict.warmup(batch_sizes)
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self._predict(batch)
+
+    def threading(self) -> Dict:
+        import tensorflow as tf
+        return {
+            "intra_op_threads": tf.config.threading.get_intra_op_parallelism_threads(),
+            "inter_op_threads": tf.config.threading.get_inter_op_parallelism_threads()
+        }
+
+    def describe(self) -> Dict:
+        info = super().describe()
+        info["parameter_bytes"] = int(sum(np.prod(w.shape) * np.dtype(w.dtype).itemsize for w in self.model.weights))
+        return info
+
+
+class TFLiteBackend(InferenceBackend):
+    """TFLite interpreter (see tflite_inference.py and export_tflite.py)"""
+
+    name = 'tflite'
+
+    def _load(self) -> None:
+        from tflite_inference import DEFAULT_NUM_THREADS, TFLitePredictor
+
+        # TEA_TFLITE_THREADS still wins, then the profile, then every core
+        if os.environ.get('TEA_TFLITE_THREADS') or not self.threads.intra_op_threads:
+            num_threads = DEFAULT_NUM_THREADS
+        else:
+            num_threads = self.threads.intra_op_threads
+        self._predictor = TFLitePredictor(self.path, num_threads=num_threads, model_content=self.model_content)
+        self.input_shape = self._predictor.input_shape
+
+    def preload(self) -> "InferenceBackend":
+        # The interpreter maps the flatbuffer in place, so forked workers share these pages
+        with open(self.path, 'rb') as f:
+            self.model_content = f.read()
+        return self
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self._predictor(batch)
+
+    def threading(self) -> Dict:
+        return {"num_threads": self._predictor.num_threads}
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX Runtime on the CPU execution provider (needs the optional onnxruntime package)"""
+
+    name = 'onnx'
+
+    def _load(self) -> None:
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise ValueError("The onnx backend needs onnxruntime (pip install onnxruntime)")
+
+        options = ort.SessionOptions()
+        threads = os.environ.get('TEA_ONNX_THREADS') or self.threads.intra_op_threads
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        if self.threads.inter_op_threads:
+            options.inter_op_num_threads = self.threads.inter_op_threads
+        self._options = options
+        self._session = ort.InferenceSession(self.model_content or self.path, sess_options=options,
+                                             providers=['CPUExecutionProvider'])
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        self.input_shape = (None,) + tuple(d if isinstance(d, int) else None for d in model_input.shape[1:])
+        self.warmup()
+
+    def preload(self) -> "InferenceBackend":
+        with open(self.path, 'rb') as f:
+            self.model_content = f.read()
+        return self
+
+    def predict_batch(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: np.asarray(batch, dtype=np.float32)})[0]
+
+    def threading(self) -> Dict:
+        return {
+            # 0 means ONNX Runtime picks (one thread per physical core)
+            "intra_op_threads": self._options.intra_op_num_threads,
+            "inter_op_threads": self._options.inter_op_num_threads
+        }
+
+
+BACKENDS = {
+    'keras': KerasBackend,
+    'tflite': TFLiteBackend,
+    'onnx': OnnxBackend
+}
+
+
+def backend_for_path(path: str) -> str:
+    lower = path.lower()
+    for name, extensions in EXTENSIONS.items():
+        if lower.endswith(extensions):
+            return name
+    return 'keras'
+
+
+def resolve_model_path(path: str, backend: str) -> str:
+    """
+    The file a backend should load for a configured model path.
+
+    If the path already has the backend's extension it is used as is.
+    Otherwise a sibling export of the same model is looked up, e.g.
+    trained_model.keras -> trained_model.tflite or trained_model.int8.tflite.
+    """
+    if backend_for_path(path) == backend:
+        return path
+    stem = os.path.splitext(path)[0]
+    for extension in EXTENSIONS[backend]:
+        candidates = [stem + extension] + sorted(glob.glob(glob.escape(stem) + '.*' + extension))
+        for candidate in candidates:
+            if os.path.exists(candidate):
+                return candidate
+    raise FileNotFoundError(f"No {backend} export of {path} found")
+
+
+def prepare_backend(path: str, backend: Optional[str] = None,
+                    threads: Optional[ThreadProfile] = None) -> InferenceBackend:
+    """
+    The backend for a model (argument, then TEA_INFERENCE_BACKEND, then by
+    file extension), not yet loaded. threads overrides the process-wide
+    thread profile.
+    """
+    name = (backend or DEFAULT_BACKEND).lower()
+    if name == 'auto':
+        name = backend_for_path(path)
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}' (choose from {', '.join(BACKENDS)} or auto)")
+    return BACKENDS[name](resolve_model_path(path, name), threads)
+
+
+def create_backend(path: str, backend: Optional[str] = None,
+                   threads: Optional[ThreadProfile] = None) -> InferenceBackend:
+    """Load a model with the selected backend (see prepare_backend) and return it warmed up"""
+    return prepare_backend(path, backend, threads).load()
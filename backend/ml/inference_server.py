@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from email.policy import HTTP
+from typing import Dict, Optional, Tuple, Union
+
+from metrics import metrics, span
+from prediction_api import MODEL_CONFIG, predictor
+from worker_pool import WorkerPool
+
+logger = logging.getLogger('inference_server')
+
+# Local-only by default: the Node backend talks to this over loopback
+DEFAULT_HOST = os.environ.get('TEA_SERVER_HOST', '127.0.0.1')
+DEFAULT_PORT = int(os.environ.get('TEA_SERVER_PORT', '8765'))
+
+# Threads running predictor.predict; with micro-batching on, this bounds how
+# many requests can share one forward pass
+DEFAULT_WORKERS = int(os.environ.get('TEA_SERVER_WORKERS', str(max(MODEL_CONFIG['max_batch_size'], 1))))
+
+# Worker processes to predict in (0 predicts in this process on the thread pool above)
+DEFAULT_POOL_SIZE = int(os.environ.get('TEA_SERVER_POOL', '0'))
+
+# Requests allowed to wait for a worker before new ones get 429
+DEFAULT_QUEUE_SIZE = int(os.environ.get('TEA_SERVER_QUEUE_SIZE', '32'))
+
+# Same limit as the multer upload in routes/teaDisease.js, plus room for multipart framing
+MAX_BODY_BYTES = int(os.environ.get('TEA_SERVER_MAX_BODY_BYTES', str(6 * 1024 * 1024)))
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    411: 'Length Required', 413: 'Payload Too Large', 429: 'Too Many Requests',
+    500: 'Internal Server Error', 503: 'Service Unavailable'
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def extract_image(content_type: str, body: bytes) -> bytes:
+    """
+    Pull the uploaded image out of a request body.
+
+    Accepts multipart/form-data (the 'image' field, as sent by the web
+    client, or else the first file part) and raw image/* bodies.
+    """
+    if content_type.startswith('image/') or content_type == 'application/octet-stream':
+        return body
+
+    if not content_type.startswith('multipart/form-data'):
+        raise HTTPError(400, f"Unsupported Content-Type: {content_type or 'missing'}")
+
+    message = BytesParser(policy=HTTP).parsebytes(
+        b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body
+    )
+    if not message.is_multipart():
+        raise HTTPError(400, "Malformed multipart body")
+
+    fallback = None
+    for part in message.iter_parts():
+        if part.get_param('name', header='content-disposition') == 'image':
+            return part.get_payload(decode=True)
+        if fallback is None and part.get_filename():
+            fallback = part.get_payload(decode=True)
+
+    if fallback is None:
+        raise HTTPError(400, "No image uploaded")
+    return fallback
+
+
+class InferenceServer:
+    """
+    Asyncio HTTP front end for ModelPredictor.
+
+    Predictions run in a fixed-size thread pool, or with pool_size > 0 in a
+    WorkerPool of that many processes. At most workers + queue_size
+    requests are admitted at once; beyond that the server answers 429 with a
+    Retry-After estimated from recent latency, so overload turns into fast
+    rejections instead of an ever-growing queue.
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 workers: int = DEFAULT_WORKERS, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 pool_size: int = DEFAULT_POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.pool = WorkerPool(pool_size) if pool_size > 0 else None
+        # With a process pool, admission is bounded by the number of processes
+        self.workers = self.pool.size if self.pool is not None else max(workers, 1)
+        self.queue_size = max(queue_size, 0)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='inference')
+
+        self.ready = False
+        self.load_error = None
+        self.in_flight = 0
+        self.started_at = time.time()
+        self.counters = {"requests": 0, "predictions": 0, "rejected": 0, "errors": 0}
+        # Exponential moving average of prediction latency, used for Retry-After
+        self.latency_ema = None
+
+    def warm_up(self) -> None:
+        """Load and warm the model; readiness is only reported after this succeeds"""
+        try:
+            if self.pool is not None:
+                self.pool.wait_ready()
+            else:
+                predictor.load_model()
+            self.ready = True
+            logger.info("Model warmed up, server is ready")
+        except Exception as e:
+            self.load_error = str(e)
+            logger.error(f"Model warmup failed: {str(e)}")
+
+    def retry_after(self) -> int:
+        latency = self.latency_ema or 1.0
+        queued = max(self.in_flight - self.workers, 1)
+        return max(1, math.ceil(latency * queued / self.workers))
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": time.time() - self.started_at,
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "in_flight": self.in_flight,
+            "latency_ema_ms": (self.latency_ema * 1000.0) if self.latency_ema is not None else None,
+            "counters": dict(self.counters),
+            "batching": predictor.get_stats(),
+            "backend": predictor.describe_backend(),
+            "pool": self.pool.get_stats() if self.pool is not None else None
+        }
+
+    async def predict(self, content_type: str, body: bytes) -> Tuple[int, Dict, Dict]:
+        if not self.ready:
+            return 503, {"success": False, "error": "Model is not ready"}, {"Retry-After": "5"}
+
+        if self.in_flight >= self.workers + self.queue_size:
+            self.counters["rejected"] += 1
+            return 429, {"success": False, "error": "Server is busy, try again later"}, {"Retry-After": str(self.retry_after())}
+
+        self.in_flight += 1
+        try:
+            # Parsing a multipart body of several MB is too slow for the event loop
+            loop = asyncio.get_running_loop()
+            image_data = await loop.run_in_executor(self.executor, extract_image, content_type, body)
+            if not image_data:
+                raise HTTPError(400, "Empty image")
+
+            start = time.perf_counter()
+            if self.pool is not None:
+                result = await asyncio.wrap_future(self.pool.submit(image_data))
+            else:
+                result = await loop.run_in_executor(self.executor, predictor.predict, image_data)
+        finally:
+            self.in_flight -= 1
+
+        elapsed = time.perf_counter() - start
+        self.latency_ema = elapsed if self.latency_ema is None else 0.8 * self.latency_ema + 0.2 * elapsed
+        self.counters["predictions"] += 1
+
+        if result.get("success"):
+            return 200, result, {}
+        self.counters["errors"] += 1
+        status = 400 if str(result.get("error", "")).startswith("Failed to process image") else 500
+        return status, result, {}
+
+    async def route(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Union[Dict, str], Dict]:
+        path, _, query = path.partition('?')
+        if path == '/healthz':
+            return 200, {"status": "ok"}, {}
+        if path == '/readyz':
+            if self.ready:
+                return 200, {"status": "ready"}, {}
+            return 503, {"status": "loading" if self.load_error is None else "failed", "error": self.load_error}, {}
+        if path == '/stats':
+            return 200, self.stats(), {}
+        if path == '/metrics':
+            # Prometheus text by default, JSON with ?format=json
+            return 200, metrics.dump('json' if 'format=json' in query else 'prometheus'), {}
+        if path == '/predict':
+            if method != 'POST':
+                raise HTTPError(405, "Use POST")
+            return await self.predict(headers.get('content-type', ''), body)
+        raise HTTPError(404, f"No route for {path}")
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        try:
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        body = b''
+        if method in ('POST', 'PUT'):
+            if 'content-length' not in headers:
+                raise HTTPError(411, "Content-Length required")
+            try:
+                length = int(headers['content-length'])
+            except ValueError:
+                length = -1
+            if length < 0:
+                raise HTTPError(400, "Invalid Content-Length")
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(413, f"Upload larger than {MAX_BODY_BYTES} bytes")
+            body = await reader.readexactly(length)
+        return method, path, headers, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                keep_alive = True
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get('connection', '').lower() != 'close'
+                    self.counters["requests"] += 1
+                    status, payload, extra_headers = await self.route(method, path, headers, body)
+                except HTTPError as e:
+                    status, payload, extra_headers = e.status, {"success": False, "error": str(e)}, {}
+                    # The rest of the request may still be unread, so do not reuse the connection
+                    keep_alive = False
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    logger.error(f"Request failed: {str(e)}", exc_info=True)
+                    status, payload, extra_headers = 500, {"success": False, "error": "Internal server error"}, {}
+
+                if isinstance(payload, str):
+                    data, content_type = payload.encode('utf-8'), "text/plain; version=0.0.4"
+                else:
+                    with span('serialize'):
+                        data, content_type = json.dumps(payload).encode('utf-8'), "application/json"
+                head = [
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                    f"Content-Type: {content_type}",
+                    f"Content-Length: {len(data)}",
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                ]
+                head += [f"{name}: {value}" for name, value in extra_headers.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        if self.pool is not None:
+            # Fork the first workers before the server and warmup threads start (the pool
+            # also pauses the log listener around the forks); replacements come from a
+            # fork server (see WorkerPool)
+            try:
+                self.pool.start(wait=False)
+            except Exception as e:
+                self.pool.load_error = str(e)
+                logger.error(f"Worker pool failed to start: {str(e)}")
+        server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        logger.info(f"Listening on http://{self.host}:{self.port} ({self.workers} workers, queue {self.queue_size})")
+        # Warm the model off the event loop so /healthz answers while loading
+        threading.Thread(target=self.warm_up, name='warmup', daemon=True).start()
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP server for tea disease predictions")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE)
+    parser.add_argument("--pool", type=int, default=DEFAULT_POOL_SIZE,
+                        help="Predict in this many worker processes (0: threads in this process)")
+    args = parser.parse_args()
+
+    server = InferenceServer(args.host, args.port, args.workers, args.queue_size, args.pool)
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        if server.pool is not None:
+            server.pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import contextlib
+import logging
+import logging.handlers
+from typing import Optional
+
+DEFAULT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Overrides the level each script asks for (DEBUG, INFO, WARNING, ...)
+LOG_LEVEL = os.environ.get('TEA_LOG_LEVEL')
+
+# Format and write log records on a background thread (set to 0 to log synchronously)
+LOG_ASYNC = os.environ.get('TEA_LOG_ASYNC', '1') != '0'
+
+# 'text' (default) or 'json' for one JSON object per line
+LOG_FORMAT = os.environ.get('TEA_LOG_FORMAT', 'text')
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log collectors"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    Enqueue records without formatting them.
+
+    The stock QueueHandler merges msg % args on the calling thread so records
+    can be pickled. This queue never leaves the process, so the message and
+    traceback are rendered by the listener thread instead. Log arguments
+    must therefore not be mutated after the logging call.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def configure_logging(level: int = logging.INFO, log_file: Optional[str] = None,
+                      stream=sys.stderr, fmt: str = DEFAULT_FORMAT) -> None:
+    """
+    Set up root logging for a script: stderr plus an optional log file.
+
+    Like logging.basicConfig this does nothing if the root logger already
+    has handlers, so the first entry point to configure logging wins. With
+    TEA_LOG_ASYNC on (the default) the calling thread only puts the record on
+    a queue; a QueueListener thread formats it and does the I/O. Records
+    below the level are dropped before any message is built.
+    """
+    global _listener
+    root = logging.getLogger()
+    if root.handlers:
+        return
+
+    if LOG_LEVEL:
+        level = getattr(logging, LOG_LEVEL.upper(), level)
+
+    formatter = JsonFormatter() if LOG_FORMAT == 'json' else logging.Formatter(fmt)
+    handlers = [logging.StreamHandler(stream)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    root.setLevel(level)
+    if not LOG_ASYNC:
+        for handler in handlers:
+            root.addHandler(handler)
+        return
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Drain the queue on exit so the last lines (often the error) are not lost
+    atexit.register(shutdown_logging)
+
+
+def _restart_after_fork() -> None:
+    """
+    A forked child inherits the queue handler but not the listener thread,
+    so records would pile up unwritten. Give it a fresh queue and listener.
+    """
+    global _listener
+    if _listener is None:
+        return
+    log_queue = queue.SimpleQueue()
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, _DeferredQueueHandler):
+            handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+@contextlib.contextmanager
+def listener_paused():
+    """
+    Stop the listener thread for the duration of the block and restart it
+    afterwards. Records logged meanwhile wait on the queue. Used around
+    fork() so the child is not copied while the listener holds a handler
+    or stream lock.
+    """
+    listener = _listener
+    if listener is None:
+        yield
+        return
+    listener.stop()
+    try:
+        yield
+    finally:
+        listener.start()
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,171 @@
+import os
+import time
+import random
+import threading
+from typing import Dict, Optional, Sequence
+
+# Fraction of spans that are timed and recorded: 1 records everything,
+# 0 turns every span into a no-op
+DEFAULT_SAMPLE_RATE = float(os.environ.get('TEA_METRICS_SAMPLE_RATE', '1'))
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond resizes to multi-second model loads
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram (cumulative counts, Prometheus style)"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile by linear interpolation inside the bucket that contains it"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if count and seen + count >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+            lower = upper
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            "count": self.count,
+            "sum_ms": self.total * 1000.0,
+            "mean_ms": (self.total / self.count * 1000.0) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50) * 1000.0,
+            "p95_ms": self.quantile(0.95) * 1000.0,
+            "p99_ms": self.quantile(0.99) * 1000.0,
+            "max_ms": self.max * 1000.0
+        }
+
+
+class _Span:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    Process-wide stage timings.
+
+    span(name) is a context manager that times its block with the monotonic
+    perf_counter clock and adds the duration to the stage's histogram. Only
+    sample_rate of the spans are recorded; unsampled spans cost one random()
+    call, and with a rate of 0 a span is a shared no-op object.
+    """
+
+    def __init__(self, sample_rate: float = DEFAULT_SAMPLE_RATE, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.started_at = time.time()
+
+    def span(self, name: str):
+        rate = self.sample_rate
+        if rate <= 0.0 or (rate < 1.0 and random.random() >= rate):
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms = {}
+            self.started_at = time.time()
+
+    def _after_fork(self) -> None:
+        # A forked worker starts with its own empty timings; the lock may have been held by another thread
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self.started_at = time.time()
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "sample_rate": self.sample_rate,
+                "since": self.started_at,
+                "stages": {name: h.to_dict() for name, h in sorted(self._histograms.items())}
+            }
+
+    def to_prometheus(self, prefix: str = 'tea') -> str:
+        """Prometheus text exposition format (one histogram labelled by stage)"""
+        name = f"{prefix}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Time spent in each prediction stage (sampled at rate {self.sample_rate}).",
+            f"# TYPE {name} histogram"
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, h.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {h.total}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, fmt: Optional[str] = 'json'):
+        """Metrics as a dict ('json') or Prometheus text ('prometheus')"""
+        return self.to_prometheus() if fmt == 'prometheus' else self.to_dict()
+
+
+# Shared by every module in the process
+metrics = Metrics()
+span = metrics.span
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._after_fork)
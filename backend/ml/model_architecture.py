@@ -0,0 +1,93 @@
+import tensorflow as tf
+from tensorflow.keras.models import Sequential
+from tensorflow.keras.layers import (Dense, Conv2D, MaxPooling2D, Flatten, Dropout, Input, BatchNormalization,
+                                     GlobalAveragePooling2D, ReLU, Rescaling, SeparableConv2D)
+
+# Matches the training setup in Teasikcnesmodel/Train_tea_disease.ipynb
+IMAGE_SIZE = (128, 128)
+NUM_CLASSES = 8
+
+# sequential: the notebook CNN; compact: separable convolutions with a global pooling head
+ARCHITECTURES = ('sequential', 'compact')
+
+
+def build_sequential_model(input_shape=(IMAGE_SIZE[0], IMAGE_SIZE[1], 3), num_classes=NUM_CLASSES,
+                           learning_rate=0.0001):
+    """
+    Build the Sequential CNN from Train_tea_disease.ipynb.
+
+    Used for training and as an untrained stand-in when benchmarking
+    without the real model file.
+    """
+    model = Sequential()
+    model.add(Input(shape=input_shape))
+
+    for filters in (32, 64, 128, 256, 512):
+        model.add(Conv2D(filters=filters, kernel_size=3, padding='same', activation='relu'))
+        model.add(Conv2D(filters=filters, kernel_size=3, activation='relu'))
+        model.add(MaxPooling2D(pool_size=2, strides=2))
+
+    model.add(Dropout(0.25))  # To avoid Overfitting
+    model.add(Flatten())
+    model.add(Dense(units=1700, activation='relu'))
+    model.add(Dropout(0.4))
+
+    # Output Layer
+    model.add(Dense(units=num_classes, activation='softmax'))
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+
+def build_compact_model(input_shape=(IMAGE_SIZE[0], IMAGE_SIZE[1], 3), num_classes=NUM_CLASSES,
+                        learning_rate=0.0001, width_multiplier=1.0):
+    """
+    Build a compact alternative to the notebook CNN.
+
+    A strided convolution stem is followed by depthwise-separable blocks
+    that downsample to 8x8, then global average pooling feeds the softmax
+    directly instead of Flatten -> Dense(1700), which holds most of the
+    notebook model's weights. width_multiplier scales every layer's filters.
+    Takes the same 0-255 input as the notebook model, so it is served with
+    the same preprocessing.
+    """
+    def width(filters):
+        return max(8, int(round(filters * width_multiplier / 8)) * 8)
+
+    model = Sequential(name=f"compact_w{width_multiplier:g}")
+    model.add(Input(shape=input_shape))
+    model.add(Rescaling(1.0 / 255))
+
+    model.add(Conv2D(filters=width(32), kernel_size=3, strides=2, padding='same', use_bias=False))
+    model.add(BatchNormalization())
+    model.add(ReLU())
+
+    for filters, strides in ((64, 1), (128, 2), (128, 1), (256, 2), (256, 1), (512, 2), (512, 1)):
+        model.add(SeparableConv2D(filters=width(filters), kernel_size=3, strides=strides, padding='same', use_bias=False))
+        model.add(BatchNormalization())
+        model.add(ReLU())
+
+    model.add(GlobalAveragePooling2D())
+    model.add(Dropout(0.3))
+    model.add(Dense(units=num_classes, activation='softmax'))
+
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy']
+    )
+    return model
+
+
+def build_model(architecture='sequential', input_shape=(IMAGE_SIZE[0], IMAGE_SIZE[1], 3), num_classes=NUM_CLASSES,
+                learning_rate=0.0001, width_multiplier=1.0):
+    """Build one of ARCHITECTURES (width_multiplier only applies to compact)"""
+    if architecture == 'sequential':
+        return build_sequential_model(input_shape, num_classes, learning_rate)
+    if architecture == 'compact':
+        return build_compact_model(input_shape, num_classes, learning_rate, width_multiplier)
+    raise ValueError(f"Unknown architecture '{architecture}', expected one of {list(ARCHITECTURES)}")
@@ -0,0 +1,322 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Tuple
+
+from inference_backends import BACKENDS, DEFAULT_BACKEND, EXTENSIONS, create_backend, resolve_model_path
+from metrics import span
+from preprocessing import PreprocessSpec, load_spec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_PATH = os.environ.get(
+    'TEA_MODEL_MANIFEST',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_manifest.json')
+)
+
+# Seconds between checks of the manifest and active model file for changes
+DEFAULT_CHECK_INTERVAL = float(os.environ.get('TEA_MODEL_RELOAD_INTERVAL', '2'))
+
+# Number of loaded model versions kept in memory (keyed by checksum)
+DEFAULT_CACHE_SIZE = int(os.environ.get('TEA_MODEL_CACHE_SIZE', '2'))
+
+
+def file_checksum(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def register_version(version: str, path: str, activate: bool = False,
+                     manifest_path: str = DEFAULT_MANIFEST_PATH) -> None:
+    """
+    Add a model file to the manifest (path stored relative to it) and
+    optionally make it the active version. The manifest is replaced
+    atomically so a running registry never reads a partial file.
+    """
+    with open(manifest_path) as f:
+        manifest = json.load(f, object_pairs_hook=OrderedDict)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    manifest.setdefault("models", OrderedDict())[version] = {"path": os.path.relpath(os.path.abspath(path), base_dir)}
+    if activate:
+        manifest["active"] = version
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, manifest_path)
+    logger.info(f"Registered {version} -> {path} in {manifest_path}{' (active)' if activate else ''}")
+
+
+def load_backend(path: str):
+    """
+    Default loader: the inference backend matching the file extension
+    (see inference_backends.py). The backend is both the model object and
+    the predict function.
+    """
+    backend = create_backend(path, 'auto')
+    return backend, backend
+
+
+class LoadedModel:
+    """
+    A fully loaded and warmed model version.
+
+    Instances are never modified after construction. Callers keep the
+    instance they received for the whole request, so a concurrent reload can
+    only ever replace the registry's reference, not the model in use.
+    """
+
+    def __init__(self, model, predict_fn: Callable, version: str, path: str, checksum: str,
+                 load_seconds: float, spec: PreprocessSpec):
+        self.model = model
+        self.predict_fn = predict_fn
+        self.spec = spec
+        self.version = version
+        self.path = path
+        self.checksum = checksum
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+    def describe(self) -> Dict:
+        info = {
+            "version": self.version,
+            "path": self.path,
+            "checksum": self.checksum,
+            "load_seconds": self.load_seconds,
+            "preprocessing": self.spec.to_dict(),
+            "loaded_at": self.loaded_at
+        }
+        if hasattr(self.predict_fn, 'describe'):
+            info["backend"] = self.predict_fn.describe()
+        return info
+
+
+class ModelRegistry:
+    """
+    Resolves the active model from a manifest and keeps it loaded.
+
+    The manifest names the active version and lists the known versions in
+    order of preference:
+
+        {"active": "trained_model",
+         "models": {"trained_model": {"path": "../../Teasikcnesmodel/trained_model.keras"}, ...}}
+
+    Paths are relative to the manifest. If the active file is missing or fails
+    to load, the other versions are tried in order, once, at resolution time.
+    After that the hot path only does a stat() of the manifest and the active
+    file every check_interval seconds. When either changes, the new version is
+    loaded and warmed off to the side and then swapped in with a single
+    reference assignment.
+    """
+
+    def __init__(self, manifest_path: str = DEFAULT_MANIFEST_PATH,
+                 check_interval: float = DEFAULT_CHECK_INTERVAL,
+                 cache_size: int = DEFAULT_CACHE_SIZE,
+                 loader: Callable = load_backend,
+                 backend: str = DEFAULT_BACKEND):
+        self.manifest_path = manifest_path
+        self.backend = backend.lower()
+        if self.backend != 'auto' and self.backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}'")
+        self.check_interval = check_interval
+        self.cache_size = max(cache_size, 1)
+        self.loader = loader
+
+        self._current = None
+        self._cache = OrderedDict()
+        self._signature = None
+        self._watch_paths = (manifest_path,)
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._checksums = {}
+        self.reloads = 0
+
+    def read_manifest(self) -> Tuple[str, "OrderedDict[str, str]"]:
+        """Return the active version name and an ordered {version: absolute path} map"""
+        with open(self.manifest_path) as f:
+            manifest = json.load(f, object_pairs_hook=OrderedDict)
+
+        base_dir = os.path.dirname(os.path.abspath(self.manifest_path))
+        versions = OrderedDict()
+        for version, entry in manifest.get("models", {}).items():
+            versions[version] = self._backend_path(os.path.normpath(os.path.join(base_dir, entry["path"])))
+
+        active = manifest.get("active")
+        if active not in versions:
+            raise ValueError(f"Active model '{active}' is not listed in {self.manifest_path}")
+        return active, versions
+
+    def _backend_path(self, path: str) -> str:
+        """
+        Map a manifest path to the file the selected backend loads, e.g. the
+        .tflite export next to a .keras file when TEA_INFERENCE_BACKEND=tflite.
+        A missing export maps to the path it would have, so that version is
+        skipped like any missing file and picked up once it appears.
+        """
+        if self.backend == 'auto':
+            return path
+        try:
+            return resolve_model_path(path, self.backend)
+        except FileNotFoundError:
+            return os.path.splitext(path)[0] + EXTENSIONS[self.backend][0]
+
+    def _stat_signature(self):
+        signature = []
+        for path in self._watch_paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _checksum(self, path: str) -> str:
+        """
+        file_checksum() memoized on (size, mtime), so the pre-load cache
+        lookup and the load that follows hash the model file only once
+        """
+        st = os.stat(path)
+        signature = (st.st_size, st.st_mtime_ns)
+        memo = self._checksums.get(path)
+        if memo is None or memo[0] != signature:
+            memo = (signature, file_checksum(path))
+            self._checksums[path] = memo
+        return memo[1]
+
+    def _load_version(self, version: str, path: str) -> LoadedModel:
+        checksum = self._checksum(path)
+        cached = self._cache.get(checksum)
+        if cached is not None:
+            self._cache.move_to_end(checksum)
+            logger.info(f"Model {version} ({checksum[:12]}) served from registry cache")
+            return cached
+
+        logger.info(f"Loading model {version} from {path}")
+        start = time.perf_counter()
+        with span('model_load'):
+            model, predict_fn = self.loader(path)
+        spec = load_spec(path, input_shape=getattr(model, 'input_shape', None))
+        loaded = LoadedModel(model, predict_fn, version, path, checksum, time.perf_counter() - start, spec)
+        logger.info(f"Loaded model {version} ({checksum[:12]}) in {loaded.load_seconds:.2f}s")
+
+        self._cache[checksum] = loaded
+        while len(self._cache) > self.cache_size:
+            evicted_checksum, _ = self._cache.popitem(last=False)
+            logger.info(f"Evicted model {evicted_checksum[:12]} from registry cache")
+        return loaded
+
+    def _resolve_and_load(self) -> LoadedModel:
+        active, versions = self.read_manifest()
+        # Watch the manifest, the active file (even if it is missing for now) and whatever gets loaded
+        self._watch_paths = (self.manifest_path, versions[active])
+        candidates = [active] + [v for v in versions if v != active]
+
+        load_error = None
+        for version in candidates:
+            path = versions[version]
+            if not os.path.exists(path):
+                logger.debug("Model %s not found at %s", version, path)
+                continue
+            try:
+                loaded = self._load_version(version, path)
+            except Exception as e:
+                logger.warning(f"Failed to load model {version} from {path}: {str(e)}")
+                load_error = e
+                continue
+            if version != active:
+                logger.warning(f"Active model {active} unavailable, using {version}")
+                self._watch_paths += (path,)
+            return loaded
+
+        if load_error is None:
+            raise ValueError(f"No model file found (checked: {', '.join(versions.values())})")
+        raise ValueError(f"Failed to load model from any available path. Last error: {str(load_error)}")
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Re-resolve the manifest and swap in the new model if anything changed.
+
+        Returns True when a different model version was swapped in. Load
+        failures keep the current model in place.
+        """
+        with self._reload_lock:
+            current = self._current
+            signature = self._stat_signature()
+            if not force and current is not None and signature == self._signature:
+                return False
+
+            try:
+                loaded = self._resolve_and_load()
+            except Exception:
+                if current is None:
+                    raise
+                logger.error("Model reload failed, keeping current model", exc_info=True)
+                self._signature = signature
+                return False
+
+            self._signature = self._stat_signature()
+            if current is not None and loaded.checksum == current.checksum and loaded.path == current.path:
+                return False
+
+            self._current = loaded
+            if current is not None:
+                self.reloads += 1
+                logger.info(f"Swapped model {current.version} -> {loaded.version}")
+            return True
+
+    def get(self) -> LoadedModel:
+        """Return the current model, loading it on first use and picking up changes"""
+        current = self._current
+        if current is None:
+            self.reload()
+            self._next_check = time.monotonic() + self.check_interval
+            return self._current
+
+        now = time.monotonic()
+        if self.check_interval >= 0 and now >= self._next_check:
+            self._next_check = now + self.check_interval
+            # Only one thread checks at a time; everyone else keeps the current model
+            if not self._reload_lock.locked():
+                self.reload()
+        return self._current
+
+    def current_checksum(self) -> str:
+        """
+        Checksum of the model that serves the next request.
+
+        Once a model is loaded this is free; before that, the active file is
+        resolved from the manifest and hashed without loading it, so callers
+        such as the prediction cache can answer without touching TensorFlow.
+        The hash is remembered, so loading that file afterwards does not
+        read it again.
+        """
+        if self._current is not None:
+            return self.get().checksum
+
+        active, versions = self.read_manifest()
+        for version in [active] + [v for v in versions if v != active]:
+            if os.path.exists(versions[version]):
+                return self._checksum(versions[version])
+        raise ValueError("No model file available")
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a model version is already in memory"""
+        return self._current is not None
+
+    def describe(self) -> Dict:
+        current = self._current
+        return {
+            "manifest": self.manifest_path,
+            "active": current.describe() if current else None,
+            "cached_checksums": list(self._cache.keys()),
+            "reloads": self.reloads
+        }
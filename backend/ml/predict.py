@@ -2,10 +2,8 @@
 import sys
 import os
 import json
-import numpy as np
 from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.applications.mobilenet_v2 import preprocess_input
+from preprocessing import load_image, load_spec
 
 # Exit if no input image is provided
 if len(sys.argv) != 2:
@@ -37,11 +35,11 @@ try:
     model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tea_disease_model.h5')
     model = load_model(model_path)
     
-    # Preprocess the image
-    img = image.load_img(img_path, target_size=(224, 224))
-    img_array = image.img_to_array(img)
-    img_array = np.expand_dims(img_array, axis=0)
-    img_array = preprocess_input(img_array)
+    # Preprocess the image as described by the model's spec. This script was written for a
+    # MobileNetV2 transfer model; tea_disease_model.preprocess.json records that transform
+    # (224x224, load_img's default nearest resize, preprocess_input scaling)
+    spec = load_spec(model_path, input_shape=model.input_shape)
+    img_array, _ = load_image(img_path, spec)
     
     # Make prediction
     predictions = model.predict(img_array)
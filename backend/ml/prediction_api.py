@@ -1,58 +1,91 @@
 import os
-import tensorflow as tf
 import numpy as np
-from PIL import Image
-import io
 import logging
+import threading
 from typing import Dict, List, Union, Optional
 import json
+from batching import create_batcher
+from inference_backends import create_backend
+from preprocessing import FALLBACK_SPEC, load_image, load_spec, validate_image
+from disease_classes import CLASS_LABELS as DISEASE_CLASS_LABELS
+from metrics import span
+from log_config import configure_logging
+from thread_config import THREAD_PROFILE
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued, see log_config.py)
+configure_logging(logging.INFO, fmt='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('model_prediction')
 
-# Update these according to your model's requirements
+# Update these according to your model's requirements. Input size, color
+# mode and scaling are read from the model's <name>.preprocess.json spec.
 MODEL_CONFIG = {
-    'input_size': (224, 224),  # Model's expected input size
-    'input_channels': 3,       # RGB=3, Grayscale=1
-    'normalize_input': True,   # Whether to divide pixel values by 255
     'model_filename': 'model.keras',  # Your model filename
+    'max_batch_size': int(os.environ.get('TEA_MAX_BATCH_SIZE', '8')),  # 1 disables micro-batching
+    'max_batch_wait_ms': float(os.environ.get('TEA_MAX_BATCH_WAIT_MS', '5')),
+    'backend': os.environ.get('TEA_INFERENCE_BACKEND', 'auto'),  # keras, tflite, onnx or auto (by extension)
+    'threads': THREAD_PROFILE,  # intra/inter-op threads and worker count, see thread_config.py
 }
 
-# Update these with your model's classes
-CLASS_LABELS = [
-    'class_1',
-    'class_2',
-    # Add your classes here
-]
+# Classes of the tea disease model (same order as test_model.py)
+CLASS_LABELS = list(DISEASE_CLASS_LABELS)
+
+def model_path() -> str:
+    """Location of the configured model file"""
+    return os.path.join(
+        os.path.dirname(__file__), 
+        'models', 
+        MODEL_CONFIG['model_filename']
+    )
 
 class ModelPredictor:
     def __init__(self):
         self.model = None
+        self.backend = None
+        self.predict_fn = None
+        self.spec = FALLBACK_SPEC
+        self.batcher = None
+        self._load_lock = threading.Lock()
         
     def load_model(self) -> None:
         """Load the pre-trained model"""
         try:
-            if self.model is None:
-                model_path = os.path.join(
-                    os.path.dirname(__file__), 
-                    'models', 
-                    MODEL_CONFIG['model_filename']
-                )
-                logger.info(f"Loading model from {model_path}")
-                self.model = tf.keras.models.load_model(model_path)
-                logger.info("Model loaded successfully")
+            if self.model is not None:
+                return
+            with self._load_lock:
+                if self.model is not None:
+                    return
+                path = model_path()
+                logger.info(f"Loading model from {path}")
+                self.attach_backend(create_backend(path, MODEL_CONFIG['backend'], MODEL_CONFIG['threads']))
         except Exception as e:
             logger.error(f"Error loading model: {str(e)}")
             raise Exception(f"Failed to load model: {str(e)}")
 
+    def attach_backend(self, backend, max_batch_size: Optional[int] = None) -> None:
+        """
+        Serve predictions from an already loaded backend (e.g. one prepared
+        before forking in worker_pool.py)
+        """
+        # The backend may load a sibling export (e.g. model.int8.tflite), which carries its own spec
+        self.spec = load_spec(backend.path, input_shape=backend.input_shape)
+        self.backend = backend
+        self.predict_fn = backend.predict_batch
+        self.batcher = create_batcher(
+            self.predict_fn,
+            max_batch_size=MODEL_CONFIG['max_batch_size'] if max_batch_size is None else max_batch_size,
+            max_wait_ms=MODEL_CONFIG['max_batch_wait_ms'],
+            name='prediction_api'
+        )
+        self.model = backend
+        logger.info(f"Model loaded successfully ({backend.name} backend)")
+
     def preprocess_image(self, image_data: bytes) -> np.ndarray:
         """
         Preprocess the image for prediction
         
+        The transform (size, color mode, interpolation, scaling) comes from the
+        preprocessing spec stored next to the model file.
+        
         Args:
             image_data: Raw image bytes
             
@@ -60,26 +93,7 @@ class ModelPredictor:
             Preprocessed image array ready for prediction
         """
         try:
-            # Open image from binary data
-            img = Image.open(io.BytesIO(image_data))
-            
-            # Convert to RGB if needed
-            if img.mode != 'RGB' and MODEL_CONFIG['input_channels'] == 3:
-                img = img.convert('RGB')
-            
-            # Resize to expected input size
-            img = img.resize(MODEL_CONFIG['input_size'])
-            
-            # Convert to numpy array
-            img_array = np.array(img)
-            
-            # Normalize if required
-            if MODEL_CONFIG['normalize_input']:
-                img_array = img_array / 255.0
-            
-            # Add batch dimension
-            img_array = np.expand_dims(img_array, axis=0)
-            
+            img_array, _ = load_image(image_data, self.spec)
             return img_array
             
         except Exception as e:
@@ -97,8 +111,12 @@ class ModelPredictor:
             Dictionary containing prediction results
         """
         try:
+            # Reject non-images before the model (and TensorFlow) is loaded
+            validate_image(image_data)
+            
             # Ensure model is loaded
-            self.load_model()
+            with span('model_resolve'):
+                self.load_model()
             
             # Preprocess the image
             logger.info("Preprocessing image")
@@ -106,25 +124,30 @@ class ModelPredictor:
             
             # Make prediction
             logger.info("Running prediction")
-            predictions = self.model.predict(processed_image)
+            with span('forward'):
+                if self.batcher is not None:
+                    predictions = self.batcher.predict(processed_image)
+                else:
+                    predictions = self.predict_fn(processed_image)
             
             # Format results
-            results = []
-            for i, confidence in enumerate(predictions[0]):
-                results.append({
-                    "class": CLASS_LABELS[i],
-                    "confidence": float(confidence)
-                })
-            
-            # Sort by confidence (descending)
-            results.sort(key=lambda x: x["confidence"], reverse=True)
-            
-            response = {
-                "success": True,
-                "prediction": results[0]["class"],
-                "confidence": float(results[0]["confidence"]),
-                "all_predictions": results
-            }
+            with span('postprocess'):
+                results = []
+                for i, confidence in enumerate(predictions[0]):
+                    results.append({
+                        "class": CLASS_LABELS[i],
+                        "confidence": float(confidence)
+                    })
+                
+                # Sort by confidence (descending)
+                results.sort(key=lambda x: x["confidence"], reverse=True)
+                
+                response = {
+                    "success": True,
+                    "prediction": results[0]["class"],
+                    "confidence": float(results[0]["confidence"]),
+                    "all_predictions": results
+                }
             
             return response
             
@@ -135,6 +158,14 @@ class ModelPredictor:
                 "error": str(e)
             }
 
+    def get_stats(self) -> Optional[Dict]:
+        """Micro-batching statistics, or None when batching is disabled"""
+        return self.batcher.get_stats() if self.batcher is not None else None
+
+    def describe_backend(self) -> Optional[Dict]:
+        """Backend name, threading settings and memory footprint, or None before loading"""
+        return self.backend.describe() if self.backend is not None else None
+
 # Create a global predictor instance
 predictor = ModelPredictor()
 
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# In-memory entries kept per process (0 disables the memory tier)
+DEFAULT_MAX_ENTRIES = int(os.environ.get('TEA_CACHE_MAX_ENTRIES', '1024'))
+
+# Optional SQLite file shared between processes and restarts
+DEFAULT_DB_PATH = os.environ.get('TEA_CACHE_DB') or None
+
+# Size budget for the on-disk tier; least recently used rows are evicted beyond it
+DEFAULT_MAX_DB_BYTES = int(float(os.environ.get('TEA_CACHE_DB_MAX_MB', '64')) * 1024 * 1024)
+
+
+def make_key(image_bytes: bytes, model_version: str) -> str:
+    """Cache key: SHA-256 of the image bytes, scoped to the model version that produced the result"""
+    return f"{hashlib.sha256(image_bytes).hexdigest()}:{model_version}"
+
+
+class PredictionCache:
+    """
+    Two-tier cache of prediction responses.
+
+    The memory tier is an LRU of serialized responses. The optional disk tier
+    is a SQLite table with a byte budget: rows carry their size and last
+    access time, and the least recently used rows are deleted once the total
+    goes over max_db_bytes. Responses are stored as JSON so callers always get
+    their own copy and can add fields (such as a request id) freely.
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 db_path: Optional[str] = DEFAULT_DB_PATH,
+                 max_db_bytes: int = DEFAULT_MAX_DB_BYTES):
+        self.max_entries = max(max_entries, 0)
+        self.db_path = db_path
+        self.max_db_bytes = max_db_bytes
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._db = None
+        self._db_bytes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS predictions_last_access ON predictions (last_access)")
+        self._db_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM predictions").fetchone()[0]
+        logger.info(f"Prediction cache database at {db_path} ({self._db_bytes / 1024:.1f} KB used)")
+
+    def _remember(self, key: str, value: str) -> None:
+        if self.max_entries == 0:
+            return
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    @property
+    def persistent(self) -> bool:
+        """Whether entries outlive this process (the disk tier is open)"""
+        return self._db is not None
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached response, or None on a miss"""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(value)
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+                    if row is not None:
+                        self._db.execute("UPDATE predictions SET last_access = ? WHERE key = ?", (time.time(), key))
+                        self._remember(key, row[0])
+                        self.disk_hits += 1
+                        return json.loads(row[0])
+                except sqlite3.Error as e:
+                    logger.warning(f"Prediction cache lookup failed: {str(e)}")
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, response: Dict) -> None:
+        """Store a successful response in both tiers"""
+        value = json.dumps(response)
+        with self._lock:
+            self._remember(key, value)
+            if self._db is None:
+                return
+            try:
+                # Other processes write to the same file, so the total is re-read inside
+                # the write transaction instead of being tracked per process
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO predictions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                        (key, value, len(key) + len(value), time.time())
+                    )
+                    self._db_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM predictions").fetchone()[0]
+                    if self._db_bytes > self.max_db_bytes:
+                        self._evict()
+                    self._db.execute("COMMIT")
+                except sqlite3.Error:
+                    self._db.execute("ROLLBACK")
+                    raise
+            except sqlite3.Error as e:
+                logger.warning(f"Prediction cache write failed: {str(e)}")
+
+    def _evict(self) -> None:
+        # Runs inside put()'s transaction. Trim to 90% of the budget so eviction
+        # does not run on every insert
+        target = int(self.max_db_bytes * 0.9)
+        rows = self._db.execute("SELECT key, size FROM predictions ORDER BY last_access").fetchall()
+        removed = []
+        for key, size in rows:
+            if self._db_bytes <= target:
+                break
+            removed.append((key,))
+            self._db_bytes -= size
+        if removed:
+            self._db.executemany("DELETE FROM predictions WHERE key = ?", removed)
+            self.evictions += len(removed)
+            logger.info(f"Evicted {len(removed)} prediction cache entries ({self._db_bytes / 1024:.1f} KB used)")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "hits": hits,
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (hits / lookups) if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "db_path": self.db_path,
+                "db_bytes": self._db_bytes if self._db is not None else None,
+                "max_db_bytes": self.max_db_bytes if self._db is not None else None,
+                "evictions": self.evictions
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def create_cache(max_entries: Optional[int] = None, db_path: Optional[str] = None) -> Optional[PredictionCache]:
+    """
+    Build a PredictionCache from explicit settings or the TEA_CACHE_* environment.
+
+    Returns None when both tiers are disabled.
+    """
+    max_entries = DEFAULT_MAX_ENTRIES if max_entries is None else max_entries
+    db_path = DEFAULT_DB_PATH if db_path is None else db_path
+    if max_entries <= 0 and not db_path:
+        return None
+    return PredictionCache(max_entries=max_entries, db_path=db_path)
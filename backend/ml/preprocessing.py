@@ -0,0 +1,367 @@
+import io
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+# JPEG draft mode lets libjpeg decode at 1/2, 1/4 or 1/8 scale, which is much
+# cheaper for large photos but is not bit-identical to a full decode followed
+# by a BILINEAR resize. Off by default so results match the trained pipeline.
+USE_JPEG_DRAFT = os.environ.get('TEA_JPEG_DRAFT', '0') == '1'
+
+# JPEGs with at least this many pixels are always decoded in draft mode: a
+# 48 MP photo then decodes at 1/8 scale instead of allocating ~150 MB of
+# pixels for a 128x128 input. Smaller photos keep the exact transform. 0 disables.
+DRAFT_MIN_PIXELS = int(float(os.environ.get('TEA_JPEG_DRAFT_MIN_MEGAPIXELS', '16')) * 1000000)
+
+# Images larger than this are rejected from their header, before any decoding
+# (decompression bomb guard); PIL's own limit is aligned with it
+MAX_IMAGE_PIXELS = int(float(os.environ.get('TEA_MAX_IMAGE_MEGAPIXELS', '64')) * 1000000)
+MAX_IMAGE_SIDE = int(os.environ.get('TEA_MAX_IMAGE_SIDE', '16384'))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# Upload formats accepted (PIL format names; MPO is what many phones write for JPEG)
+ALLOWED_FORMATS = tuple(
+    f.strip().upper() for f in os.environ.get('TEA_ALLOWED_FORMATS', 'JPEG,MPO,PNG,WEBP,BMP,GIF').split(',') if f.strip()
+)
+
+# PIL modes that convert cleanly to RGB or L
+SUPPORTED_MODES = ('1', 'L', 'LA', 'P', 'PA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr')
+
+# Threads used by load_batch to decode files in parallel (PIL releases the GIL)
+DECODE_THREADS = int(os.environ.get('TEA_DECODE_THREADS', str(min(8, os.cpu_count() or 1))))
+
+# Suffix of the spec file stored next to each model:
+# trained_model.keras -> trained_model.preprocess.json
+SPEC_SUFFIX = '.preprocess.json'
+
+INTERPOLATIONS = {
+    'nearest': Image.NEAREST,
+    'bilinear': Image.BILINEAR,
+    'bicubic': Image.BICUBIC,
+    'lanczos': Image.LANCZOS
+}
+
+COLOR_MODES = {
+    'rgb': ('RGB', 3),
+    'grayscale': ('L', 1)
+}
+
+# none: keep 0-255 (the notebook model rescales nothing)
+# rescale: divide by 255 to 0-1
+# mobilenet_v2: scale to -1..1 like keras.applications.mobilenet_v2.preprocess_input
+SCALE_MODES = ('none', 'rescale', 'mobilenet_v2')
+
+
+class PreprocessSpec:
+    """
+    Declarative description of the input transform a model was trained with.
+
+    Stored as JSON next to the model file so every entry point feeds the model
+    the same thing, whatever script happens to load it.
+    """
+
+    def __init__(self, image_size=(128, 128), color_mode: str = 'rgb',
+                 interpolation: str = 'bilinear', scale: str = 'none'):
+        if color_mode not in COLOR_MODES:
+            raise ValueError(f"Unsupported color_mode '{color_mode}', expected one of {sorted(COLOR_MODES)}")
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f"Unsupported interpolation '{interpolation}', expected one of {sorted(INTERPOLATIONS)}")
+        if scale not in SCALE_MODES:
+            raise ValueError(f"Unsupported scale '{scale}', expected one of {list(SCALE_MODES)}")
+        # image_size is (height, width), as in image_dataset_from_directory
+        self.image_size = (int(image_size[0]), int(image_size[1]))
+        self.color_mode = color_mode
+        self.interpolation = interpolation
+        self.scale = scale
+
+    @property
+    def target_size(self) -> Tuple[int, int]:
+        """(width, height) as PIL expects it"""
+        return (self.image_size[1], self.image_size[0])
+
+    @property
+    def channels(self) -> int:
+        return COLOR_MODES[self.color_mode][1]
+
+    @property
+    def input_shape(self) -> Tuple[int, int, int]:
+        return (self.image_size[0], self.image_size[1], self.channels)
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "PreprocessSpec":
+        return cls(
+            image_size=data.get("image_size", (128, 128)),
+            color_mode=data.get("color_mode", 'rgb'),
+            interpolation=data.get("interpolation", 'bilinear'),
+            scale=data.get("scale", 'none')
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "image_size": list(self.image_size),
+            "color_mode": self.color_mode,
+            "interpolation": self.interpolation,
+            "scale": self.scale
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, PreprocessSpec) and self.to_dict() == other.to_dict()
+
+    def __repr__(self):
+        return f"PreprocessSpec({self.to_dict()})"
+
+
+# What Train_tea_disease.ipynb used: image_dataset_from_directory with
+# image_size=(128, 128), color_mode="rgb", interpolation="bilinear" and no rescaling
+NOTEBOOK_SPEC = PreprocessSpec()
+
+# Transform assumed for a model without a spec file, by every entry point
+FALLBACK_SPEC = NOTEBOOK_SPEC
+
+# Kept for callers that only need the notebook input size
+TARGET_SIZE = NOTEBOOK_SPEC.target_size
+
+
+def spec_path_for(model_path: str) -> str:
+    """Location of the spec file that belongs to a model file"""
+    return os.path.splitext(model_path)[0] + SPEC_SUFFIX
+
+
+def load_spec(model_path: str, input_shape=None) -> PreprocessSpec:
+    """
+    Read the spec stored next to model_path.
+
+    Without a spec file every entry point falls back to the same transform,
+    FALLBACK_SPEC, and logs a warning. When the model's input_shape is known
+    and has a fixed size that differs from it, the size is taken from the
+    model so a mismatch cannot slip through.
+    """
+    path = spec_path_for(model_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            spec = PreprocessSpec.from_dict(json.load(f))
+        logger.info(f"Loaded preprocessing spec from {path}: {spec.to_dict()}")
+        return spec
+
+    spec = FALLBACK_SPEC
+    if input_shape is not None and len(input_shape) == 4 and input_shape[1] and input_shape[2]:
+        model_size = (int(input_shape[1]), int(input_shape[2]))
+        if model_size != spec.image_size:
+            spec = PreprocessSpec(model_size, spec.color_mode, spec.interpolation, spec.scale)
+    logger.warning(f"No preprocessing spec at {path}; assuming {spec.to_dict()}. "
+                   f"Write one with preprocessing.save_spec if the model was trained differently")
+    return spec
+
+
+def save_spec(model_path: str, spec: PreprocessSpec) -> str:
+    """Write the spec next to model_path and return the spec file path"""
+    path = spec_path_for(model_path)
+    with open(path, 'w') as f:
+        json.dump(spec.to_dict(), f, indent=2)
+    return path
+
+
+def allocate_batch(batch_size: int, spec: PreprocessSpec = NOTEBOOK_SPEC) -> np.ndarray:
+    """Preallocate a float32 NHWC batch buffer that decode_into can fill in place"""
+    return np.empty((batch_size,) + spec.input_shape, dtype=np.float32)
+
+
+class MemoryReader(io.RawIOBase):
+    """
+    Read-only file object over a buffer without copying it.
+
+    io.BytesIO copies a memoryview on construction; this lets PIL read an
+    image straight out of a shared-memory or mmap'd region (see image_channel.py).
+    Only the chunks PIL asks for are copied.
+    """
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast('B')
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._pos = max(offset, 0)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def readinto(self, b):
+        chunk = self._view[self._pos:self._pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(end, self._pos)
+        return data
+
+
+def _open(source):
+    if isinstance(source, memoryview):
+        return Image.open(MemoryReader(source))
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def check_header(img: Image.Image) -> Dict:
+    """
+    Validate an opened (not yet decoded) image against the format, mode and
+    size limits. Raises ValueError; returns the header info otherwise.
+    """
+    width, height = img.size
+    if img.format not in ALLOWED_FORMATS:
+        raise ValueError(f"unsupported image format {img.format} (allowed: {', '.join(ALLOWED_FORMATS)})")
+    if img.mode not in SUPPORTED_MODES:
+        raise ValueError(f"unsupported image mode {img.mode}")
+    if width < 1 or height < 1 or max(width, height) > MAX_IMAGE_SIDE or width * height > MAX_IMAGE_PIXELS:
+        raise ValueError(f"image is {width}x{height} ({width * height / 1e6:.1f} MP), "
+                         f"limit is {MAX_IMAGE_PIXELS / 1e6:.0f} MP and {MAX_IMAGE_SIDE} px per side")
+    return {"format": img.format, "size": img.size, "mode": img.mode}
+
+
+def validate_image(source) -> Dict:
+    """
+    Check that source is a supported image of acceptable size, reading only its header.
+
+    Cheap enough to run before the model is loaded, so bad uploads and
+    decompression bombs fail fast. Raises ValueError with a
+    "Failed to process image" message.
+    """
+    try:
+        with _open(source) as img:
+            return check_header(img)
+    except (ValueError, Image.DecompressionBombError) as e:
+        raise ValueError(f"Failed to process image: {str(e)}") from e
+    except (OSError, SyntaxError) as e:
+        raise ValueError("Failed to process image: not a supported image file") from e
+
+
+def apply_scale(out: np.ndarray, scale: str) -> np.ndarray:
+    """Apply the spec's value scaling in place"""
+    if scale == 'rescale':
+        np.divide(out, 255.0, out=out)
+    elif scale == 'mobilenet_v2':
+        np.divide(out, 127.5, out=out)
+        np.subtract(out, 1.0, out=out)
+    return out
+
+
+def decode_into(source, out: np.ndarray, spec: PreprocessSpec = NOTEBOOK_SPEC,
+                use_draft: bool = USE_JPEG_DRAFT) -> Dict:
+    """
+    Decode one image straight into a preallocated (H, W, C) float32 slot.
+
+    source can be a path, a file object or raw bytes. The file is opened
+    once and transformed as described by spec; with the notebook spec the
+    values are identical to the original convert('RGB') -> resize(BILINEAR)
+    -> float32 pipeline. Returns the original format, size and mode for logging.
+
+    The header is validated first (see check_header). JPEGs of at least
+    DRAFT_MIN_PIXELS, or any JPEG when use_draft is set, are decoded at reduced
+    scale so memory and time stay bounded for very large photos.
+    """
+    pil_mode = COLOR_MODES[spec.color_mode][0]
+
+    with _open(source) as img:
+        with span('decode'):
+            info = check_header(img)
+            large = DRAFT_MIN_PIXELS > 0 and img.size[0] * img.size[1] >= DRAFT_MIN_PIXELS
+
+            if (use_draft or large) and img.format in ('JPEG', 'MPO'):
+                # Ask libjpeg for the smallest DCT scale that is still >= target_size
+                img.draft(pil_mode, spec.target_size)
+                info["draft_size"] = img.size
+
+            # Decode now so the decode and resize spans measure separate work
+            img.load()
+            if img.mode != pil_mode:
+                img = img.convert(pil_mode)
+
+        with span('resize'):
+            if img.size != spec.target_size:
+                img = img.resize(spec.target_size, INTERPOLATIONS[spec.interpolation])
+
+            # Single uint8 -> float32 copy into the caller's buffer
+            out[...] = np.asarray(img).reshape(out.shape)
+            apply_scale(out, spec.scale)
+
+    return info
+
+
+def load_image(source, spec: PreprocessSpec = NOTEBOOK_SPEC,
+               use_draft: bool = USE_JPEG_DRAFT) -> Tuple[np.ndarray, Dict]:
+    """Decode a single image into a new (1, H, W, C) float32 batch"""
+    batch = allocate_batch(1, spec)
+    info = decode_into(source, batch[0], spec, use_draft)
+    return batch, info
+
+
+def load_batch(sources: Sequence, spec: PreprocessSpec = NOTEBOOK_SPEC,
+               use_draft: bool = USE_JPEG_DRAFT, out: Optional[np.ndarray] = None,
+               num_threads: int = DECODE_THREADS) -> Tuple[np.ndarray, List[Optional[str]]]:
+    """
+    Decode many images into one float32 batch using a thread pool.
+
+    Returns the batch and a list with an error message for each source that
+    could not be decoded (None for the ones that worked). Failed slots are
+    zero-filled so the rest of the batch can still be used.
+    """
+    if out is None:
+        out = allocate_batch(len(sources), spec)
+    elif out.shape[0] < len(sources):
+        raise ValueError(f"Batch buffer holds {out.shape[0]} images, got {len(sources)}")
+
+    def decode(index):
+        try:
+            decode_into(sources[index], out[index], spec, use_draft)
+            return None
+        except Exception as e:
+            out[index].fill(0)
+            logger.warning(f"Failed to decode image {sources[index] if isinstance(sources[index], str) else index}: {str(e)}")
+            return str(e)
+
+    if num_threads <= 1 or len(sources) <= 1:
+        errors = [decode(i) for i in range(len(sources))]
+    else:
+        with ThreadPoolExecutor(max_workers=min(num_threads, len(sources))) as executor:
+            errors = list(executor.map(decode, range(len(sources))))
+
+    return out[:len(sources)], errors
+
+
+def reference_preprocess(source, target_size: Tuple[int, int] = TARGET_SIZE) -> np.ndarray:
+    """
+    The original test_model.py transform, kept as the parity reference for
+    check_preprocessing.py. Not used on the request path.
+    """
+    with _open(source) as img:
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img = img.resize(target_size, Image.BILINEAR)
+        img_array = np.array(img)
+        img_array = np.expand_dims(img_array, axis=0)
+        return img_array.astype('float32')
@@ -0,0 +1,119 @@
+import os
+import json
+import struct
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from disease_classes import (CLASS_LABELS, DEFAULT_TREATMENT, HEALTHY_MESSAGE, MESSAGE_TEMPLATE,
+                             TREATMENTS, build_response)
+
+# json (default) or binary, for worker and batch output
+RESPONSE_FORMAT = os.environ.get('TEA_RESPONSE_FORMAT', 'json').lower()
+FORMATS = ('json', 'binary')
+
+VERSION = 1
+
+# Frame: uint32 length of everything after it, uint8 kind, uint8 flags,
+# uint16 key length, the key (request id or image path, UTF-8), then the body
+FRAME_HEADER = struct.Struct('<IBBH')
+LENGTH = struct.Struct('<I')
+
+HELLO = 0   # body: JSON with the label and treatment tables (sent once)
+RESULT = 1  # body: uint16 top class index, uint16 class count, float32 probabilities
+ERROR = 2   # body: UTF-8 error message
+JSON = 3    # body: any other response (stats, metrics) as JSON
+
+RESULT_HEADER = struct.Struct('<HH')
+
+
+def handshake(**extra) -> Dict:
+    """Everything a client needs to rebuild full responses from RESULT frames"""
+    hello = {
+        "format": "binary",
+        "version": VERSION,
+        "labels": list(CLASS_LABELS),
+        "treatments": {label: TREATMENTS.get(label, DEFAULT_TREATMENT) for label in CLASS_LABELS},
+        "message_template": MESSAGE_TEMPLATE,
+        "healthy_message": HEALTHY_MESSAGE
+    }
+    hello.update(extra)
+    return hello
+
+
+def _frame(kind: int, key, body: bytes) -> bytes:
+    key_bytes = b'' if key is None else str(key).encode('utf-8')
+    return FRAME_HEADER.pack(FRAME_HEADER.size - LENGTH.size + len(key_bytes) + len(body),
+                             kind, 0, len(key_bytes)) + key_bytes + body
+
+
+def encode_hello(**extra) -> bytes:
+    return _frame(HELLO, None, json.dumps(handshake(**extra)).encode('utf-8'))
+
+
+def probabilities_of(response: Dict) -> np.ndarray:
+    """Class probability vector of a build_response result (also works for cached responses)"""
+    probabilities = np.zeros(len(CLASS_LABELS), dtype=np.float32)
+    for item in response.get("all_predictions", []):
+        probabilities[CLASS_LABELS.index(item["disease"])] = item["confidence"]
+    return probabilities
+
+
+def encode_response(response: Dict, key=None) -> bytes:
+    """
+    One response as a frame: RESULT for predictions, ERROR for failures and
+    JSON for anything else (stats, metrics)
+    """
+    if response.get("success") and "all_predictions" in response:
+        probabilities = probabilities_of(response)
+        body = RESULT_HEADER.pack(CLASS_LABELS.index(response["prediction"]), len(probabilities)) + probabilities.tobytes()
+        return _frame(RESULT, key, body)
+    if not response.get("success") and "error" in response:
+        return _frame(ERROR, key, str(response["error"]).encode('utf-8'))
+    return _frame(JSON, key, json.dumps(response).encode('utf-8'))
+
+
+def decode_frame(data, offset: int = 0) -> Tuple[int, Optional[str], memoryview, int]:
+    """
+    (kind, key, body, next offset) of the frame at offset. Raises ValueError
+    if data ends before the frame does.
+    """
+    view = memoryview(data)
+    if len(view) - offset < FRAME_HEADER.size:
+        raise ValueError("Incomplete frame header")
+    length, kind, _, key_length = FRAME_HEADER.unpack_from(view, offset)
+    end = offset + LENGTH.size + length
+    if end > len(view):
+        raise ValueError("Incomplete frame")
+    start = offset + FRAME_HEADER.size
+    key = bytes(view[start:start + key_length]).decode('utf-8') if key_length else None
+    return kind, key, view[start + key_length:end], end
+
+
+def decode_result(body) -> Tuple[int, np.ndarray]:
+    """Top class index and float32 probabilities of a RESULT body"""
+    top, count = RESULT_HEADER.unpack_from(body, 0)
+    return top, np.frombuffer(body, dtype=np.float32, count=count, offset=RESULT_HEADER.size)
+
+
+def to_response(kind: int, body) -> Dict:
+    """Rebuild the JSON-mode response dict from a decoded frame"""
+    if kind == RESULT:
+        return build_response(decode_result(body)[1].astype(np.float64))
+    if kind == ERROR:
+        return {"success": False, "error": bytes(body).decode('utf-8')}
+    return json.loads(bytes(body))
+
+
+def iter_frames(stream: BinaryIO) -> Iterator[Tuple[int, Optional[str], bytes]]:
+    """(kind, key, body) for each complete frame read from a binary stream"""
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        length = LENGTH.unpack_from(header)[0]
+        rest = stream.read(length - (FRAME_HEADER.size - LENGTH.size))
+        if len(rest) < length - (FRAME_HEADER.size - LENGTH.size):
+            return
+        kind, key, body, _ = decode_frame(header + rest)
+        yield kind, key, bytes(body)
@@ -3,87 +3,88 @@ import os
 import sys
 import json
 import numpy as np
-import tensorflow as tf
-from tensorflow.keras.models import load_model
 import logging
-from PIL import Image
-
-# Configure logging with more detail
-logging.basicConfig(
-    level=logging.DEBUG,  # Changed to DEBUG for more detail
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stderr),  # Log to stderr for Node.js to capture
-        logging.FileHandler(os.path.join(os.path.dirname(__file__), 'disease_detection.log'))
-    ]
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from batching import create_batcher
+from model_registry import ModelRegistry
+from preprocessing import NOTEBOOK_SPEC, load_image, validate_image
+from prediction_cache import create_cache, make_key
+from image_channel import SpoolReader
+from response_codec import FORMATS, RESPONSE_FORMAT, encode_hello, encode_response
+from metrics import metrics, span
+from log_config import configure_logging
+from thread_config import THREAD_PROFILE
+# CLASS_LABELS and TREATMENTS stay importable from here for existing callers
+from disease_classes import CLASS_LABELS, TREATMENTS, build_response
+
+# Configure logging with more detail: stderr for Node.js to capture, plus a log file.
+# Records are formatted and written on a background thread (TEA_LOG_ASYNC, TEA_LOG_LEVEL)
+configure_logging(
+    logging.DEBUG,
+    log_file=os.path.join(os.path.dirname(__file__), 'disease_detection.log')
 )
 logger = logging.getLogger(__name__)
 
-# Log startup information
+# Log startup information. TensorFlow is not imported here: it is loaded by the
+# inference backend only once a prediction actually needs the model, so usage
+# errors, missing or invalid images and cache hits are answered without it
 logger.info("Script started")
 logger.info(f"Python version: {sys.version}")
-logger.info(f"TensorFlow version: {tf.__version__}")
 logger.info(f"NumPy version: {np.__version__}")
 logger.info(f"Working directory: {os.getcwd()}")
+# Thread pool sizes and worker count (thread_profile.json, TEA_INTRA_OP_THREADS, TEA_INTER_OP_THREADS, TEA_WORKERS)
+logger.info(f"Thread profile: {THREAD_PROFILE.to_dict()}")
+
+def load_and_preprocess_image(image_source, spec=NOTEBOOK_SPEC):
+    """
+    Load and preprocess an image for model inference.
 
-# Define class labels - MUST match the ones in Teasikcnesmodel/predict.py
-CLASS_LABELS = [
-    'Anthracnose',
-    'algal leaf',
-    'bird eye spot', 
-    'brown blight',
-    'gray light',
-    'healthy',
-    'red leaf spot',
-    'white spot'
-]
-
-# Treatment recommendations
-TREATMENTS = {
-    "Anthracnose": "Prune affected branches and apply fungicides containing copper or mancozeb. Ensure proper spacing between plants for good air circulation.",
-    "algal leaf": "Remove affected leaves and apply copper oxychloride. Improve drainage and reduce humidity around plants.",
-    "bird eye spot": "Apply fungicides containing carbendazim or copper. Enhance soil nutrition with balanced fertilizers.",
-    "brown blight": "Prune affected areas and apply triazole fungicides. Avoid overhead irrigation.",
-    "gray light": "Apply sulfur-based fungicides and ensure good air circulation by proper spacing and pruning.",
-    "healthy": "Continue with regular maintenance and preventive practices to keep plants healthy.",
-    "red leaf spot": "Remove infected leaves and apply fungicides containing chlorothalonil. Improve soil drainage.",
-    "white spot": "Use copper-based fungicides and maintain proper spacing. Avoid excessive nitrogen fertilization."
-}
-
-def load_and_preprocess_image(image_path, target_size=(128, 128)):
-    """
-    Load and preprocess an image for model inference
+    image_source is a file path or the raw image bytes. Returns a
+    (1, H, W, C) float32 batch transformed as described by the model's
+    preprocessing spec, and the original image format, size and mode.
     """
     try:
-        # Open and validate the image
-        try:
-            with Image.open(image_path) as img:
-                # Convert to RGB if needed
-                if img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Resize image using BILINEAR interpolation (same as training)
-                img = img.resize(target_size, Image.BILINEAR)
-                
-                # Convert to numpy array WITHOUT normalization (same as training)
-                img_array = np.array(img)
-                
-                # Add batch dimension
-                img_array = np.expand_dims(img_array, axis=0)
-                
-                # Convert to float32 but keep 0-255 range (same as training)
-                img_array = img_array.astype('float32')
-                
-                logger.info(f"Image preprocessed - Shape: {img_array.shape}, Range: [{img_array.min()}, {img_array.max()}]")
-                return img_array
-                
-        except Exception as e:
-            logger.error(f"Error processing image {image_path}: {str(e)}")
-            raise ValueError(f"Invalid image file: {str(e)}")
-    
+        return load_image(image_source, spec)
     except Exception as e:
-        logger.error(f"Error in load_and_preprocess_image: {str(e)}")
-        raise
+        logger.error(f"Error processing image: {str(e)}")
+        raise ValueError(f"Invalid image file: {str(e)}")
+
+# Resolves the active model from model_manifest.json once, keeps it loaded
+# and swaps in a new version when the model file changes
+registry = ModelRegistry()
+
+# Cache of responses keyed by image content and model checksum
+# (TEA_CACHE_MAX_ENTRIES for the memory tier, TEA_CACHE_DB for the disk tier)
+prediction_cache = create_cache()
+
+# Shared-memory spool mappings, kept open between worker requests
+spool_reader = SpoolReader()
+
+# Optional micro-batcher shared by concurrent requests in worker mode
+_batcher = None
+
+# Number of requests the worker processes concurrently (feeds the batcher)
+SERVE_CONCURRENCY = int(os.environ.get('TEA_SERVE_CONCURRENCY', os.environ.get('TEA_MAX_BATCH_SIZE', '8')))
+
+def get_model():
+    """
+    Return the active model version (Keras model, compiled predict function,
+    version name and checksum), loading it on first use
+    """
+    return registry.get()
+
+def run_inference(img_array, loaded=None):
+    """
+    Run a forward pass through the compiled predict function, going through
+    the micro-batcher when one is active
+    """
+    loaded = loaded or registry.get()
+    if _batcher is not None:
+        # Batch only with requests preprocessed for the same model version
+        return _batcher.predict(img_array, loaded.predict_fn)
+    return loaded.predict_fn(img_array)
 
 def predict_disease(image_path):
     """
@@ -92,58 +93,49 @@ def predict_disease(image_path):
     try:
         logger.info(f"Starting prediction for image: {image_path}")
         
-        # Path to the model - try several variations
-        model_paths = [
-            # Try models in Teasikcnesmodel first (they might be more reliable)
-            os.path.join(os.path.dirname(__file__), '..', '..', 'Teasikcnesmodel', 'trained_model.keras'),
-            os.path.join(os.path.dirname(__file__), '..', '..', 'Teasikcnesmodel', 'trained_model_v20250412_035536.keras'),
-            os.path.join(os.path.dirname(__file__), '..', '..', 'Teasikcnesmodel', 'trained_model_v20250327_044552.keras'),
-            os.path.join(os.path.dirname(__file__), '..', '..', 'Teasikcnesmodel', 'trained_model.h5'),
-            # Then try models in backend/ml/models
-            os.path.join(os.path.dirname(__file__), 'models', 'tea_disease_model.keras'),
-            os.path.join(os.path.dirname(__file__), 'models', 'tea_disease_model.h5')
-        ]
-        
-        # Log all potential model paths
-        for path in model_paths:
-            logger.debug(f"Checking model path: {path} (exists: {os.path.exists(path)})")
-        
-        # Try each model path until one works
-        model = None
-        load_error = None
-        
-        for path in model_paths:
-            if os.path.exists(path):
-                try:
-                    logger.info(f"Attempting to load model from {path}")
-                    model = load_model(path)
-                    logger.info(f"Successfully loaded model from {path}")
-                    break
-                except Exception as e:
-                    logger.warning(f"Failed to load model from {path}: {str(e)}")
-                    load_error = e
-                    continue
-        
-        if model is None:
-            raise ValueError(f"Failed to load model from any available path. Last error: {str(load_error)}")
-        
         # Validate image path
         if not os.path.exists(image_path):
             logger.error(f"Image not found: {image_path}")
             raise FileNotFoundError(f"Image file not found: {image_path}")
         
-        # Log image details
-        try:
-            with Image.open(image_path) as img:
-                logger.info(f"Image details - Format: {img.format}, Size: {img.size}, Mode: {img.mode}")
-        except Exception as e:
-            logger.error(f"Error reading image metadata: {str(e)}")
+        # Read the file once: the bytes are both the cache key and the decode input
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+    except Exception as e:
+        logger.error(f"Prediction failed with error: {str(e)}", exc_info=True)
+        return {
+            "success": False,
+            "error": str(e)
+        }
+    
+    return predict_image(image_bytes, image_path)
+
+def predict_image(image_bytes, source="<buffer>"):
+    """
+    Run inference on encoded image bytes (bytes or a memoryview, e.g. a
+    spool record) and return the prediction results
+    """
+    try:
+        # Fail fast on files that are not images, before the model is loaded
+        validate_image(image_bytes)
         
-        # Load and preprocess the image
-        logger.info(f"Processing image from {image_path}")
+        # Serve repeated uploads from the cache without loading or running the model.
+        # Before a model is loaded this needs the model file's checksum, which only
+        # pays off when the disk tier can hold entries from earlier processes
+        if prediction_cache is not None and (registry.loaded or prediction_cache.persistent):
+            cached = prediction_cache.get(make_key(image_bytes, registry.current_checksum()))
+            if cached is not None:
+                logger.info(f"Prediction served from cache: {cached.get('prediction')}")
+                return cached
+        
+        with span('model_resolve'):
+            loaded = get_model()
+        
+        # Load and preprocess the image (decoded once, metadata comes from the same open)
+        logger.info(f"Processing image from {source}")
         try:
-            img_array = load_and_preprocess_image(image_path)
-            logger.info(f"Image preprocessed successfully - Shape: {img_array.shape}, Range: [{img_array.min()}, {img_array.max()}]")
+            img_array, image_info = load_and_preprocess_image(image_bytes, loaded.spec)
+            logger.info(f"Image details - Format: {image_info['format']}, Size: {image_info['size']}, Mode: {image_info['mode']}")
         except Exception as e:
             logger.error(f"Image preprocessing failed: {str(e)}")
             raise ValueError(f"Failed to process image: {str(e)}")
@@ -151,54 +143,20 @@ def predict_disease(image_path):
         # Make prediction with error handling
         try:
             logger.info("Running inference")
-            predictions = model.predict(img_array, verbose=0)
+            with span('forward'):
+                predictions = run_inference(img_array, loaded)
             logger.info(f"Prediction completed successfully - Shape: {predictions.shape}")
         except Exception as e:
             logger.error(f"Prediction failed: {str(e)}")
             raise ValueError(f"Failed to run prediction: {str(e)}")
         
-        # Get the predicted class index
-        result_index = np.argmax(predictions[0])
-        
         # Format results
-        all_predictions = []
-        for i, confidence in enumerate(predictions[0]):
-            all_predictions.append({
-                "disease": CLASS_LABELS[i],
-                "confidence": float(confidence)
-            })
-            logger.debug(f"Class {CLASS_LABELS[i]}: {confidence:.4f}")
-        
-        # Sort by confidence
-        all_predictions.sort(key=lambda x: x["confidence"], reverse=True)
-        
-        # Get top prediction
-        top_disease = CLASS_LABELS[result_index]
-        top_confidence = float(predictions[0][result_index])
+        with span('postprocess'):
+            response = build_response(predictions[0])
+        logger.info(f"Top prediction: {response['prediction']} ({response['confidence']*100:.1f}%)")
         
-        logger.info(f"Top prediction: {top_disease} ({top_confidence*100:.1f}%)")
-        
-        # Get treatment recommendation
-        treatment = TREATMENTS.get(top_disease, "No specific treatment recommendation available.")
-        
-        # Determine if healthy
-        is_healthy = top_disease.lower() == "healthy"
-        
-        # Prepare response
-        response = {
-            "success": True,
-            "prediction": top_disease,
-            "disease": top_disease,
-            "confidence": top_confidence,
-            "treatment": treatment,
-            "all_predictions": all_predictions,
-            "healthy": is_healthy,
-            "is_healthy": is_healthy,
-            "message": f"The analysis detected {top_disease} with {top_confidence*100:.1f}% confidence."
-        }
-        
-        if is_healthy:
-            response["message"] = "Good news! The tea leaves appear to be healthy."
+        if prediction_cache is not None:
+            prediction_cache.put(make_key(image_bytes, loaded.checksum), response)
         
         logger.info("Prediction completed successfully")
         return response
@@ -210,13 +168,169 @@ def predict_disease(image_path):
             "error": str(e)
         }
 
+def predict_spool(request):
+    """
+    Predict on an image record in the shared-memory spool, decoding straight
+    from the mapped buffer (see image_channel.py)
+    """
+    try:
+        with span('receive'):
+            view = spool_reader.read(request["spool"], request.get("offset", 0), request.get("sequence"))
+    except (OSError, ValueError, struct.error) as e:
+        logger.error(f"Spool read failed: {str(e)}")
+        return {"success": False, "error": f"Invalid spool record: {str(e)}"}
+    try:
+        return predict_image(view, f"{request['spool']}@{request.get('offset', 0)}")
+    finally:
+        view.release()
+
+def handle_request(line):
+    """
+    Answer a single worker request line and return the response dict
+    """
+    request_id = None
+    try:
+        request = json.loads(line)
+        request_id = request.get("id")
+        if request.get("command") == "stats":
+            result = {
+                "success": True,
+                "batching": _batcher.get_stats() if _batcher is not None else None,
+                "cache": prediction_cache.get_stats() if prediction_cache is not None else None,
+                "model": registry.describe()
+            }
+        elif request.get("command") == "metrics":
+            result = {"success": True, "metrics": metrics.dump(request.get("format", "json"))}
+        elif "spool" in request:
+            result = predict_spool(request)
+        else:
+            result = predict_disease(request["image_path"])
+    except (ValueError, KeyError, AttributeError) as e:
+        result = {"success": False, "error": f"Invalid request: {str(e)}"}
+
+    result["id"] = request_id
+    return result
+
+def serve(input_stream=None, output_stream=None, response_format=RESPONSE_FORMAT):
+    """
+    Long-lived worker mode: load the model once and answer predictions
+    over newline-delimited JSON.
+
+    Each request line is {"id": ..., "image_path": ...}, or
+    {"id": ..., "spool": ..., "offset": ..., "sequence": ...} to read the
+    image from a shared-memory spool record instead of a file
+    (image_channel.py). Each response line
+    is the predict_disease result with the request id echoed back. A
+    {"ready": true} line is written once the model is loaded. Requests are
+    handled concurrently, so responses may arrive out of order; match them
+    by id. {"command": "stats"} returns the micro-batching statistics and
+    {"command": "metrics", "format": "json" | "prometheus"} the stage timings.
+
+    With response_format 'binary' (TEA_RESPONSE_FORMAT) responses are
+    length-prefixed frames instead (response_codec.py): the ready line
+    becomes a HELLO frame carrying the label and treatment tables, and each
+    prediction is a class index plus float32 probabilities keyed by request id.
+    """
+    global _batcher
+    input_stream = sys.stdin if input_stream is None else input_stream
+    output_stream = sys.stdout if output_stream is None else output_stream
+    if response_format not in FORMATS:
+        # Checked before anything is loaded; reported as JSON since no binary stream was agreed on
+        error = f"Unknown response format '{response_format}' (TEA_RESPONSE_FORMAT: choose from {', '.join(FORMATS)})"
+        logger.error(error)
+        output_stream.write(json.dumps({"ready": False, "success": False, "error": error}) + "\n")
+        output_stream.flush()
+        return 1
+    binary = response_format == 'binary'
+    if binary:
+        output_stream = getattr(output_stream, 'buffer', output_stream)
+    write_lock = threading.Lock()
+
+    def emit(data):
+        with write_lock:
+            output_stream.write(data)
+            output_stream.flush()
+
+    try:
+        loaded = get_model()
+    except Exception as e:
+        logger.error(f"Worker failed to load model: {str(e)}", exc_info=True)
+        status = {"ready": False, "success": False, "error": str(e)}
+        emit(encode_hello(**status) if binary else json.dumps(status) + "\n")
+        return 1
+
+    _batcher = create_batcher(lambda batch: registry.get().predict_fn(batch), name='test_model')
+
+    status = {
+        "ready": True,
+        "model_path": loaded.path,
+        "model_version": loaded.version,
+        "backend": getattr(loaded.predict_fn, 'name', None),
+        "threads": THREAD_PROFILE.to_dict()
+    }
+    emit(encode_hello(**status) if binary else json.dumps(status) + "\n")
+    logger.info(f"Worker ready ({response_format} responses), waiting for requests")
+
+    def respond(line):
+        result = handle_request(line)
+        with span('serialize'):
+            if binary:
+                data = encode_response(result, key=result.pop("id"))
+            else:
+                data = json.dumps(result) + "\n"
+        emit(data)
+
+    def report_failure(future, line):
+        # Anything respond() did not turn into a result still gets an answer for its id
+        error = future.exception()
+        if error is None:
+            return
+        logger.error(f"Failed to answer request: {str(error)}", exc_info=error)
+        try:
+            request_id = json.loads(line).get("id")
+        except (ValueError, AttributeError):
+            request_id = None
+        result = {"success": False, "error": f"Failed to answer request: {str(error)}"}
+        try:
+            emit(encode_response(result, key=request_id) if binary else json.dumps(dict(result, id=request_id)) + "\n")
+        except Exception as e:
+            logger.error(f"Failed to report error for request {request_id}: {str(e)}")
+
+    with ThreadPoolExecutor(max_workers=max(SERVE_CONCURRENCY, 1)) as executor:
+        for line in input_stream:
+            line = line.strip()
+            if line:
+                future = executor.submit(respond, line)
+                future.add_done_callback(lambda future, line=line: report_failure(future, line))
+
+    if _batcher is not None:
+        logger.info(f"Batching stats: {json.dumps(_batcher.get_stats())}")
+        _batcher.close()
+        _batcher = None
+    spool_reader.close()
+
+    logger.info("Input closed, worker exiting")
+    return 0
+
 def main():
     """
     Main function to process command line arguments and run prediction
     """
+    # Long-lived worker mode, optionally with compact binary responses
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        if len(sys.argv) == 2:
+            return serve()
+        if len(sys.argv) == 4 and sys.argv[2] == "--format" and sys.argv[3] in FORMATS:
+            return serve(response_format=sys.argv[3])
+
+    # Offline scoring of a directory or glob
+    if len(sys.argv) >= 3 and sys.argv[1] == "--batch":
+        import batch_predict
+        return batch_predict.main(sys.argv[2:])
+
     # Check if image path is provided
     if len(sys.argv) != 2:
-        result = {"success": False, "error": "Usage: python test_model.py <image_path>"}
+        result = {"success": False, "error": "Usage: python test_model.py <image_path> | --serve [--format json|binary] | --batch <dir|glob> [options]"}
         print(json.dumps(result))
         return 1
     
@@ -227,7 +341,9 @@ def main():
         result = predict_disease(image_path)
         
         # Print result as JSON
-        print(json.dumps(result))
+        with span('serialize'):
+            output = json.dumps(result)
+        print(output)
         return 0 if result.get("success", False) else 1
         
     except Exception as e:
@@ -236,4 +352,4 @@ def main():
         return 1
 
 if __name__ == "__main__":
-    sys.exit(main()) 
\ No newline at end of file
+    sys.exit(main())
@@ -0,0 +1,99 @@
+import os
+import logging
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Threads used by the TFLite interpreter (XNNPACK) per model
+DEFAULT_NUM_THREADS = int(os.environ.get('TEA_TFLITE_THREADS', str(os.cpu_count() or 1)))
+
+
+def load_interpreter_class():
+    """
+    The TFLite Interpreter class from the lightest package that is installed:
+    ai_edge_litert, then tflite_runtime, then full TensorFlow
+    """
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+class TFLitePredictor:
+    """
+    Callable wrapper around a TFLite interpreter with the same contract as
+    CompiledPredictor: float32 (N, H, W, C) batch in, numpy probabilities out.
+
+    The interpreter is not thread-safe and resizing its input reallocates
+    tensors, so calls are serialized and the tensors are only resized when
+    the batch size changes.
+    """
+
+    def __init__(self, path: str, num_threads: int = DEFAULT_NUM_THREADS, model_content: Optional[bytes] = None):
+        self.path = path
+        self.num_threads = max(num_threads, 1)
+        interpreter_class = load_interpreter_class()
+        if model_content is not None:
+            # Already read (e.g. before forking workers); the interpreter uses the buffer without copying
+            self._interpreter = interpreter_class(model_content=model_content, num_threads=self.num_threads)
+        else:
+            self._interpreter = interpreter_class(model_path=path, num_threads=self.num_threads)
+        self._input = self._interpreter.get_input_details()[0]
+        self._output = self._interpreter.get_output_details()[0]
+        self._lock = threading.Lock()
+        self._batch_size = None
+
+        shape = [int(d) for d in self._input['shape_signature']]
+        # Keras-style shape so load_spec and warmup treat this like a Keras model
+        self.input_shape = (None,) + tuple(d if d > 0 else None for d in shape[1:])
+        self.warmup()
+
+    def _quantize(self, batch: np.ndarray) -> np.ndarray:
+        dtype = self._input['dtype']
+        if dtype == np.float32:
+            return batch.astype(np.float32, copy=False)
+        # Fully integer models take quantized input
+        scale, zero_point = self._input['quantization']
+        info = np.iinfo(dtype)
+        return np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+
+    def _dequantize(self, output: np.ndarray) -> np.ndarray:
+        if output.dtype == np.float32:
+            return output
+        scale, zero_point = self._output['quantization']
+        return ((output.astype(np.float32) - zero_point) * scale).astype(np.float32)
+
+    def warmup(self, batch_size: int = 1) -> None:
+        height, width, channels = (d or 128 for d in self.input_shape[1:])
+        self(np.zeros((batch_size, height, width, channels), dtype=np.float32))
+        logger.info(f"TFLite model {os.path.basename(self.path)} warmed up ({self.num_threads} threads)")
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.asarray(batch)
+        with self._lock:
+            if batch.shape[0] != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input['index'], list(batch.shape))
+                self._interpreter.allocate_tensors()
+                self._batch_size = batch.shape[0]
+            self._interpreter.set_tensor(self._input['index'], self._quantize(batch))
+            self._interpreter.invoke()
+            return self._dequantize(self._interpreter.get_tensor(self._output['index'])).copy()
+
+    def describe(self) -> Dict:
+        return {
+            "path": self.path,
+            "num_threads": self.num_threads,
+            "input_dtype": np.dtype(self._input['dtype']).name,
+            "file_bytes": os.path.getsize(self.path)
+        }
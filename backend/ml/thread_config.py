@@ -0,0 +1,131 @@
+import os
+import json
+import logging
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Profile written by tune_threads.py; TEA_THREAD_PROFILE points elsewhere
+DEFAULT_PROFILE_PATH = os.environ.get(
+    'TEA_THREAD_PROFILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'thread_profile.json')
+)
+
+# Environment variables that override the profile file, per field
+ENV_OVERRIDES = {
+    'intra_op_threads': 'TEA_INTRA_OP_THREADS',
+    'inter_op_threads': 'TEA_INTER_OP_THREADS',
+    'workers': 'TEA_WORKERS'
+}
+
+
+class ThreadProfile:
+    """
+    How many CPU threads one inference process may use, and how many such
+    processes should run side by side on the host.
+
+    intra_op_threads sizes the pool a single op (a convolution) is split
+    across and is also used for the TFLite and ONNX backends; inter_op_threads
+    bounds how many independent ops run at once. 0 leaves the choice to the
+    runtime, which sizes both pools to every core: fine for one process,
+    oversubscribed as soon as several run at once. workers * intra_op_threads
+    should not exceed the core count.
+    """
+
+    def __init__(self, intra_op_threads: int = 0, inter_op_threads: int = 0, workers: int = 1,
+                 host: Optional[Dict] = None):
+        for name, value in (("intra_op_threads", intra_op_threads), ("inter_op_threads", inter_op_threads)):
+            if int(value) < 0:
+                raise ValueError(f"{name} must be 0 (runtime default) or positive, got {value}")
+        if int(workers) < 1:
+            raise ValueError(f"workers must be at least 1, got {workers}")
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        self.workers = int(workers)
+        # The machine the profile was tuned on (cpu_count, platform)
+        self.host = host or {}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ThreadProfile":
+        return cls(
+            intra_op_threads=data.get("intra_op_threads", 0),
+            inter_op_threads=data.get("inter_op_threads", 0),
+            workers=data.get("workers", 1),
+            host=data.get("host")
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "intra_op_threads": self.intra_op_threads,
+            "inter_op_threads": self.inter_op_threads,
+            "workers": self.workers,
+            "host": self.host
+        }
+
+    def __repr__(self):
+        return f"ThreadProfile({self.to_dict()})"
+
+
+def load_profile(path: Optional[str] = None) -> ThreadProfile:
+    """
+    The thread profile for this process: the profile file (when it exists and
+    was tuned on a host with the same core count), then TEA_INTRA_OP_THREADS,
+    TEA_INTER_OP_THREADS and TEA_WORKERS on top. A setting that cannot be
+    read is logged and skipped, so a bad profile never stops a script.
+    """
+    path = path or DEFAULT_PROFILE_PATH
+    data = {}
+    if path and os.path.exists(path):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            tuned_cpus = (data.get("host") or {}).get("cpu_count")
+        except (ValueError, OSError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable thread profile {path}: {str(e)}")
+            data, tuned_cpus = {}, None
+        if tuned_cpus is not None and tuned_cpus != os.cpu_count():
+            logger.warning(f"Ignoring thread profile {path}: tuned for {tuned_cpus} CPUs, "
+                           f"this host has {os.cpu_count()}. Re-run tune_threads.py")
+            data = {}
+
+    for field, variable in ENV_OVERRIDES.items():
+        value = os.environ.get(variable)
+        if value:
+            try:
+                data[field] = int(value)
+            except ValueError:
+                logger.warning(f"Ignoring {variable}={value!r}: not an integer")
+
+    try:
+        return ThreadProfile.from_dict(data)
+    except (ValueError, TypeError) as e:
+        logger.warning(f"Invalid thread profile {data}, using runtime defaults: {str(e)}")
+        return ThreadProfile()
+
+
+def save_profile(profile: ThreadProfile, path: Optional[str] = None) -> str:
+    """Write the profile atomically, so processes starting meanwhile never read a partial file"""
+    path = path or DEFAULT_PROFILE_PATH
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(profile.to_dict(), f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def apply_tensorflow_threads(tf, profile: ThreadProfile) -> None:
+    """
+    Size TensorFlow's thread pools. Must run before TensorFlow executes its
+    first op; later calls are ignored with a warning.
+    """
+    try:
+        if profile.intra_op_threads:
+            tf.config.threading.set_intra_op_parallelism_threads(profile.intra_op_threads)
+        if profile.inter_op_threads:
+            tf.config.threading.set_inter_op_parallelism_threads(profile.inter_op_threads)
+    except RuntimeError as e:
+        logger.warning(f"TensorFlow threads already initialized, keeping them: {str(e)}")
+
+
+# Loaded once per process, like the other TEA_* settings
+THREAD_PROFILE = load_profile()
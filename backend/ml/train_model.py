@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import datetime
+import itertools
+import logging
+
+import numpy as np
+import tensorflow as tf
+
+from dataset_shards import ShardedDataset, list_images
+from model_architecture import ARCHITECTURES, IMAGE_SIZE, build_model
+from model_registry import register_version
+from preprocessing import PreprocessSpec, decode_into, save_spec
+
+logger = logging.getLogger(__name__)
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+# Where the notebook saved its models and where model_manifest.json points
+DEFAULT_OUTPUT_DIR = os.path.normpath(os.path.join(ML_DIR, '..', '..', 'Teasikcnesmodel'))
+
+AUTOTUNE = tf.data.AUTOTUNE
+
+# What image_dataset_from_directory fed the notebook model: bilinear resize, 0-255 floats
+TRAINING_SPEC = PreprocessSpec(IMAGE_SIZE, 'rgb', 'bilinear', 'none')
+
+
+def build_dataset(paths, labels, num_classes, batch_size, training, cache='memory', shuffle_buffer=1000, seed=None):
+    """
+    tf.data pipeline: parallel decode and resize, cache of the decoded
+    images (in memory, or in a file when cache is a path), per-epoch shuffle
+    of the cached images, batching and prefetch. Only the first epoch decodes
+    JPEGs; later epochs read from the cache while the model trains. Images
+    go through preprocessing.decode_into, the resize used by the compiled
+    shards and at serving time, so the saved spec describes what was trained on.
+    """
+    dataset = tf.data.Dataset.from_tensor_slices((paths, labels))
+    if training:
+        # Randomize the order the cache is filled in; shuffling after the cache reorders every epoch
+        dataset = dataset.shuffle(len(paths), seed=seed, reshuffle_each_iteration=False)
+
+    def decode_file(path):
+        image = np.empty(TRAINING_SPEC.input_shape, dtype=np.float32)
+        decode_into(path.decode(), image, TRAINING_SPEC, use_draft=False)
+        return image
+
+    def decode(path, label):
+        # Same PIL decode and resize as the compiled shards and the serving path
+        image = tf.numpy_function(decode_file, [path], tf.float32, stateful=False)
+        image.set_shape(TRAINING_SPEC.input_shape)
+        return image, tf.one_hot(label, num_classes)
+
+    dataset = dataset.map(decode, num_parallel_calls=AUTOTUNE, deterministic=not training)
+    if cache:
+        dataset = dataset.cache('' if cache == 'memory' else cache)
+    if training:
+        dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+    return dataset.batch(batch_size).prefetch(AUTOTUNE)
+
+
+def build_shard_dataset(shards, num_classes, batch_size, training, seed=None):
+    """
+    Pipeline over a compiled split (see dataset_shards.py): batches come
+    straight from the memory-mapped uint8 shards, reshuffled every epoch,
+    so no epoch decodes a JPEG.
+    """
+    epochs = itertools.count()
+
+    def batches():
+        epoch_seed = None if seed is None else seed + next(epochs)
+        for images, labels, _ in shards.iter_batches(batch_size, shuffle=training, seed=epoch_seed):
+            yield images, labels
+
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((None,) + shards.spec.input_shape, tf.uint8),
+        tf.TensorSpec((None,), tf.int64)
+    ))
+    dataset = dataset.map(lambda images, labels: (tf.cast(images, tf.float32), tf.one_hot(labels, num_classes)),
+                          num_parallel_calls=AUTOTUNE)
+    return dataset.prefetch(AUTOTUNE)
+
+
+def load_shards(directory, split):
+    shards = ShardedDataset(directory, split)
+    # The whole spec must match (interpolation included): export_model saves TRAINING_SPEC for serving
+    if shards.spec != TRAINING_SPEC:
+        raise ValueError(f"Split '{split}' in {directory} was compiled with {shards.spec}, training needs {TRAINING_SPEC}")
+    return shards
+
+
+def make_steps(model):
+    """Compiled train and evaluation steps returning (mean loss, correct predictions) per batch"""
+    loss_fn = tf.keras.losses.CategoricalCrossentropy()
+
+    def correct(labels, probabilities):
+        return tf.reduce_sum(tf.cast(tf.equal(tf.argmax(probabilities, 1), tf.argmax(labels, 1)), tf.float32))
+
+    @tf.function
+    def train_step(images, labels):
+        with tf.GradientTape() as tape:
+            probabilities = model(images, training=True)
+            loss = loss_fn(labels, probabilities)
+        gradients = tape.gradient(loss, model.trainable_variables)
+        model.optimizer.apply_gradients(zip(gradients, model.trainable_variables))
+        return loss, correct(labels, probabilities)
+
+    @tf.function
+    def eval_step(images, labels):
+        probabilities = model(images, training=False)
+        return loss_fn(labels, probabilities), correct(labels, probabilities)
+
+    return train_step, eval_step
+
+
+def run_epoch(step, dataset):
+    """
+    One pass over dataset. Stall time is the time spent waiting for the
+    input pipeline to produce the next batch, i.e. when the model was idle.
+    """
+    start = time.perf_counter()
+    stall = 0.0
+    loss_sum = correct = 0.0
+    seen = 0
+    iterator = iter(dataset)
+    while True:
+        wait_start = time.perf_counter()
+        try:
+            images, labels = next(iterator)
+        except StopIteration:
+            break
+        stall += time.perf_counter() - wait_start
+        loss, batch_correct = step(images, labels)
+        count = int(labels.shape[0])
+        loss_sum += float(loss) * count
+        correct += float(batch_correct)
+        seen += count
+    wall = time.perf_counter() - start
+    return {
+        "loss": loss_sum / seen if seen else None,
+        "accuracy": correct / seen if seen else None,
+        "images": seen,
+        "wall_seconds": wall,
+        "stall_seconds": stall,
+        "images_per_second": seen / wall if wall > 0 else 0.0
+    }
+
+
+def latest_checkpoint(checkpoint_dir):
+    """(state, model path) of the last completed epoch, or (None, None)"""
+    state_path = os.path.join(checkpoint_dir, 'state.json')
+    if not os.path.exists(state_path):
+        return None, None
+    with open(state_path) as f:
+        state = json.load(f)
+    path = os.path.join(checkpoint_dir, state["checkpoint"])
+    if not os.path.exists(path):
+        raise ValueError(f"Checkpoint {path} named in {state_path} is missing")
+    return state, path
+
+
+def save_checkpoint(model, checkpoint_dir, epoch, history, keep, architecture):
+    """Save the model with its optimizer state, then record it as the resume point"""
+    name = f"epoch_{epoch:03d}.keras"
+    model.save(os.path.join(checkpoint_dir, name))
+    tmp_path = os.path.join(checkpoint_dir, 'state.json.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({"epoch": epoch, "checkpoint": name, "architecture": architecture, "history": history}, f, indent=2)
+    os.replace(tmp_path, os.path.join(checkpoint_dir, 'state.json'))
+    for old in sorted(glob.glob(os.path.join(glob.escape(checkpoint_dir), 'epoch_*.keras')))[:-keep]:
+        os.remove(old)
+
+
+def export_model(model, model_path, history):
+    """
+    Save the model the API loads, with its preprocessing spec and a
+    .history.json (history plus the parameter count); returns the history path
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(model_path)), exist_ok=True)
+    # Rebuilt from its config so it is saved uncompiled, without the optimizer
+    # state: Adam's moment estimates would triple the file the API loads
+    export = model.__class__.from_config(model.get_config())
+    export.set_weights(model.get_weights())
+    export.save(model_path)
+    save_spec(model_path, TRAINING_SPEC)
+    history_path = os.path.splitext(model_path)[0] + '.history.json'
+    with open(history_path, 'w') as f:
+        json.dump(dict(history, parameters=model.count_params()), f, indent=2)
+    logger.info(f"Model saved at {model_path}")
+    return history_path
+
+
+def train(args):
+    if args.dataset:
+        train_shards = load_shards(args.dataset, 'train')
+        class_names = train_shards.class_names
+        num_classes = len(class_names)
+        train_set = build_shard_dataset(train_shards, num_classes, args.batch_size, training=True, seed=args.seed)
+        train_count = len(train_shards)
+        valid_set = None
+        if args.valid_split:
+            valid_shards = load_shards(args.dataset, args.valid_split)
+            if valid_shards.class_names != class_names:
+                raise ValueError(f"Validation classes {valid_shards.class_names} differ from training classes {class_names}")
+            valid_set = build_shard_dataset(valid_shards, num_classes, args.batch_size, training=False)
+            valid_count = len(valid_shards)
+    else:
+        train_paths, train_labels, class_names = list_images(args.train_dir)
+        num_classes = len(class_names)
+        train_set = build_dataset(train_paths, train_labels, num_classes, args.batch_size, training=True,
+                                  cache=args.cache, shuffle_buffer=args.shuffle_buffer, seed=args.seed)
+        train_count = len(train_paths)
+        valid_set = None
+        if args.valid_dir:
+            valid_paths, valid_labels, valid_classes = list_images(args.valid_dir)
+            if valid_classes != class_names:
+                raise ValueError(f"Validation classes {valid_classes} differ from training classes {class_names}")
+            valid_cache = args.cache if args.cache in (None, 'memory') else args.cache + '.valid'
+            valid_set = build_dataset(valid_paths, valid_labels, num_classes, args.batch_size, training=False,
+                                      cache=valid_cache)
+            valid_count = len(valid_paths)
+    logger.info(f"{train_count} training images in {num_classes} classes"
+                f"{f', {valid_count} validation images' if valid_set is not None else ''}")
+
+    os.makedirs(args.checkpoint_dir, exist_ok=True)
+    state, checkpoint = latest_checkpoint(args.checkpoint_dir) if args.resume else (None, None)
+    if state is not None:
+        logger.info(f"Resuming from {checkpoint} (epoch {state['epoch']} of {args.epochs})")
+        model = tf.keras.models.load_model(checkpoint)
+        history = state["history"]
+        initial_epoch = state["epoch"]
+        # The checkpoint decides the architecture, whatever the command line says
+        architecture = state.get("architecture", {"name": "sequential", "width_multiplier": 1.0})
+        args.architecture, args.width_multiplier = architecture["name"], architecture["width_multiplier"]
+    else:
+        model = build_model(args.architecture, num_classes=num_classes, learning_rate=args.learning_rate,
+                            width_multiplier=args.width_multiplier)
+        logger.info(f"Built {args.architecture} model with {model.count_params():,} parameters")
+        history = []
+        initial_epoch = 0
+
+    train_step, eval_step = make_steps(model)
+    for epoch in range(initial_epoch + 1, args.epochs + 1):
+        record = {"epoch": epoch, "train": run_epoch(train_step, train_set)}
+        if valid_set is not None:
+            record["validation"] = run_epoch(eval_step, valid_set)
+        history.append(record)
+
+        stats = record["train"]
+        message = (f"Epoch {epoch}/{args.epochs}: {stats['wall_seconds']:.1f}s "
+                   f"(input stall {stats['stall_seconds']:.1f}s, {stats['stall_seconds'] / stats['wall_seconds'] * 100:.0f}%), "
+                   f"{stats['images_per_second']:.1f} img/s, loss {stats['loss']:.4f}, accuracy {stats['accuracy']:.4f}")
+        if valid_set is not None:
+            message += f", val_loss {record['validation']['loss']:.4f}, val_accuracy {record['validation']['accuracy']:.4f}"
+        logger.info(message)
+        save_checkpoint(model, args.checkpoint_dir, epoch, history, args.keep_checkpoints,
+                        {"name": args.architecture, "width_multiplier": args.width_multiplier})
+
+    # Same naming as the notebook: trained_model_v<YYYYmmdd_HHMMSS>.keras (compact models are tagged)
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    tag = '' if args.architecture == 'sequential' else f"{args.architecture}_w{args.width_multiplier:g}_"
+    model_path = os.path.join(args.output_dir, f"trained_model_{tag}v{timestamp}.keras")
+    history_path = export_model(model, model_path, {
+        "class_names": class_names, "architecture": args.architecture,
+        "width_multiplier": args.width_multiplier, "epochs": history
+    })
+    if args.register or args.activate:
+        register_version(f"{tag}v{timestamp}", model_path, activate=args.activate)
+
+    return {
+        "success": True,
+        "model": os.path.abspath(model_path),
+        "history": os.path.abspath(history_path),
+        "epochs_trained": max(args.epochs - initial_epoch, 0),
+        "total_wall_seconds": sum(r["train"]["wall_seconds"] for r in history),
+        "total_stall_seconds": sum(r["train"]["stall_seconds"] for r in history),
+        "final": history[-1] if history else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the tea disease CNN from class-named image folders")
+    parser.add_argument("--train-dir", help="Training images in one subfolder per class (the notebook's 'train')")
+    parser.add_argument("--valid-dir", help="Validation images laid out the same way (the notebook's 'valid')")
+    parser.add_argument("--dataset", help="Compiled dataset from dataset_shards.py to train on instead of --train-dir")
+    parser.add_argument("--valid-split", default="valid",
+                        help="Split of --dataset to validate on ('' to skip validation)")
+    parser.add_argument("--architecture", choices=ARCHITECTURES, default="sequential",
+                        help="sequential (the notebook CNN) or compact (separable convolutions, global pooling head)")
+    parser.add_argument("--width-multiplier", type=float, default=1.0, help="Filter count scale for --architecture compact")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=0.0001, help="Adam learning rate (the notebook's default)")
+    parser.add_argument("--cache", default="memory",
+                        help="'memory', a file path for an on-disk cache of decoded images, or 'none'")
+    parser.add_argument("--shuffle-buffer", type=int, default=1000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--checkpoint-dir", help="Per-epoch checkpoints (default: <output-dir>/checkpoints)")
+    parser.add_argument("--keep-checkpoints", type=int, default=2)
+    parser.add_argument("--resume", action="store_true", help="Continue from the last checkpoint in --checkpoint-dir")
+    parser.add_argument("--register", action="store_true", help="Add the trained model to model_manifest.json")
+    parser.add_argument("--activate", action="store_true", help="Register the trained model and make it active")
+    args = parser.parse_args()
+    if not args.train_dir and not args.dataset:
+        parser.error("one of --train-dir or --dataset is required")
+    args.cache = None if args.cache == 'none' else args.cache
+    args.checkpoint_dir = args.checkpoint_dir or os.path.join(args.output_dir, 'checkpoints')
+    args.keep_checkpoints = max(args.keep_checkpoints, 1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    try:
+        result = train(args)
+    except Exception as e:
+        logger.error(f"Training failed: {str(e)}", exc_info=True)
+        print(json.dumps({"success": False, "error": str(e)}))
+        return 1
+
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
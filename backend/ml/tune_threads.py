@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmark_channel import Worker
+from benchmark_suite import latency_stats, make_leaf_images, build_standin_model
+from thread_config import DEFAULT_PROFILE_PATH, ThreadProfile, save_profile
+
+logger = logging.getLogger('tune_threads')
+
+# Throughputs within this fraction of the best count as a tie, broken by p95 latency
+TIE_TOLERANCE = 0.03
+
+
+def powers_of_two(limit):
+    values = []
+    value = 1
+    while value <= limit:
+        values.append(value)
+        value *= 2
+    if values[-1] != limit:
+        values.append(limit)
+    return values
+
+
+def candidate_profiles(cpu_count, max_workers=None):
+    """
+    Worker counts and intra/inter-op thread counts that do not oversubscribe
+    the host (workers * intra_op_threads <= cores), plus the runtime default
+    of one process using every core
+    """
+    candidates = [ThreadProfile(0, 0, 1)]
+    for workers in powers_of_two(min(max_workers or cpu_count, cpu_count)):
+        for intra in powers_of_two(cpu_count // workers):
+            for inter in (1, 2):
+                candidates.append(ThreadProfile(intra, inter, workers))
+    return candidates
+
+
+def measure_profile(profile, manifest_path, images, duration):
+    """
+    Run profile.workers test_model.py workers with the profile's thread
+    settings and keep each busy with one client for `duration` seconds
+    """
+    env = dict(
+        os.environ,
+        TEA_MODEL_MANIFEST=manifest_path,
+        # The profile under test comes from the environment, not a saved file
+        TEA_THREAD_PROFILE='',
+        TEA_INTRA_OP_THREADS=str(profile.intra_op_threads),
+        TEA_INTER_OP_THREADS=str(profile.inter_op_threads),
+        TEA_WORKERS=str(profile.workers),
+        TEA_MAX_BATCH_SIZE='1',
+        TEA_CACHE_MAX_ENTRIES='0',
+        TEA_LOG_LEVEL='WARNING'
+    )
+    env.pop('TEA_CACHE_DB', None)
+
+    with ThreadPoolExecutor(max_workers=profile.workers) as pool:
+        workers = list(pool.map(lambda _: Worker(env), range(profile.workers)))
+    samples = []
+    samples_lock = threading.Lock()
+
+    def drive(worker, offset):
+        worker.request({"image_path": images[offset % len(images)]})
+        deadline = time.perf_counter() + duration
+        local = []
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            worker.request({"image_path": images[i % len(images)]})
+            local.append(time.perf_counter() - start)
+            i += 1
+        with samples_lock:
+            samples.extend(local)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=profile.workers) as pool:
+            list(pool.map(drive, workers, range(profile.workers)))
+        elapsed = time.perf_counter() - start
+    finally:
+        for worker in workers:
+            worker.close()
+
+    stats = latency_stats(samples)
+    # Aggregate over all workers, not per-request
+    stats["throughput_per_sec"] = len(samples) / elapsed
+    return stats
+
+
+def pick_best(results):
+    """Highest throughput; near-ties go to the lower p95 latency"""
+    top = max(r["stats"]["throughput_per_sec"] for r in results)
+    contenders = [r for r in results if r["stats"]["throughput_per_sec"] >= top * (1 - TIE_TOLERANCE)]
+    return min(contenders, key=lambda r: r["stats"]["p95_ms"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep thread and worker settings against the stand-in model and save the best profile for this host")
+    parser.add_argument("--model", help="Model file to tune with (default: an untrained stand-in with the notebook architecture)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per setting")
+    parser.add_argument("--max-workers", type=int, help="Largest worker count to try (default: core count)")
+    parser.add_argument("--images", type=int, default=8, help="Synthetic leaf images to cycle through")
+    parser.add_argument("--output", default=DEFAULT_PROFILE_PATH, help="Where to write the chosen profile")
+    parser.add_argument("--report", help="Write every measured setting here as JSON")
+    parser.add_argument("--dry-run", action="store_true", help="Measure and report without writing the profile")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cpu_count = os.cpu_count() or 1
+    candidates = candidate_profiles(cpu_count, args.max_workers)
+    logger.info(f"{cpu_count} CPUs, {len(candidates)} settings, {args.duration:.0f}s each")
+
+    with tempfile.TemporaryDirectory(prefix='tea_tune_') as workdir:
+        if args.model:
+            manifest_path = os.path.join(workdir, 'manifest.json')
+            with open(manifest_path, 'w') as f:
+                json.dump({"active": "model", "models": {"model": {"path": os.path.abspath(args.model)}}}, f)
+        else:
+            _, manifest_path = build_standin_model(workdir)
+        images = make_leaf_images(workdir, args.images)
+
+        results = []
+        for profile in candidates:
+            try:
+                stats = measure_profile(profile, manifest_path, images, args.duration)
+            except Exception as e:
+                logger.warning(f"Skipping {profile.to_dict()}: {str(e)}")
+                continue
+            results.append({"profile": profile.to_dict(), "stats": stats})
+            logger.info(f"workers={profile.workers} intra={profile.intra_op_threads} inter={profile.inter_op_threads}: "
+                        f"{stats['throughput_per_sec']:.1f} img/s, p95 {stats['p95_ms']:.1f} ms")
+
+    if not results:
+        print(json.dumps({"success": False, "error": "No setting could be measured"}))
+        return 1
+
+    best = pick_best(results)
+    profile = ThreadProfile.from_dict(best["profile"])
+    profile.host = {
+        "cpu_count": cpu_count,
+        "platform": platform.platform(),
+        "tuned_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "throughput_per_sec": best["stats"]["throughput_per_sec"],
+        "p95_ms": best["stats"]["p95_ms"]
+    }
+    report = {"success": True, "best": profile.to_dict(), "results": results}
+    if not args.dry_run:
+        report["profile_path"] = os.path.abspath(save_profile(profile, args.output))
+        logger.info(f"Profile written to {report['profile_path']}")
+
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+import multiprocessing.forkserver
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from inference_backends import current_rss_bytes, prepare_backend
+from log_config import listener_paused, shutdown_logging
+from prediction_api import MODEL_CONFIG, ModelPredictor, model_path
+from thread_config import THREAD_PROFILE
+
+logger = logging.getLogger(__name__)
+
+# Worker processes in the pool (defaults to the thread profile's worker count)
+DEFAULT_POOL_SIZE = int(os.environ.get('TEA_POOL_SIZE', str(THREAD_PROFILE.workers)))
+
+# Restart a worker after this many requests (0 never recycles)
+DEFAULT_MAX_REQUESTS = int(os.environ.get('TEA_POOL_MAX_REQUESTS', '0'))
+
+# Restart a worker whose resident memory grows past this (0 disables the check)
+DEFAULT_MAX_RSS_MB = float(os.environ.get('TEA_POOL_MAX_RSS_MB', '0'))
+
+_READY = '__ready__'
+
+
+def _worker_main(conn, backend) -> None:
+    """
+    Body of a worker process: finish loading the backend prepared by the
+    parent, then answer (request_id, image bytes) messages until told to stop
+    """
+    try:
+        predictor = ModelPredictor()
+        # One request at a time per worker, so micro-batching would only add its wait
+        predictor.attach_backend(backend.load(), max_batch_size=1)
+        conn.send((_READY, None, current_rss_bytes()))
+    except Exception as e:
+        logger.error(f"Worker {os.getpid()} failed to load the model: {str(e)}", exc_info=True)
+        conn.send((_READY, {"success": False, "error": f"Failed to load model: {str(e)}"}, current_rss_bytes()))
+        shutdown_logging()
+        return
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+        request_id, image_data = message
+        result = predictor.predict(image_data)
+        conn.send((request_id, result, current_rss_bytes()))
+    shutdown_logging()
+
+
+class _Worker:
+    """Parent-side handle of one worker process"""
+
+    def __init__(self, slot: int, process, conn):
+        self.slot = slot
+        self.process = process
+        self.conn = conn
+        self.started_at = time.time()
+        self.ready = threading.Event()
+        self.load_error = None
+        self.pending = {}
+        self.requests = 0
+        self.busy_seconds = 0.0
+        self.rss_bytes = None
+        # No new requests are routed to a draining worker; it stops once idle
+        self.draining = False
+        self.stopping = False
+        self.send_lock = threading.Lock()
+
+    def describe(self) -> Dict:
+        uptime = time.time() - self.started_at
+        return {
+            "slot": self.slot,
+            "pid": self.process.pid,
+            "state": "draining" if self.draining else ("ready" if self.ready.is_set() else "starting"),
+            "uptime_seconds": uptime,
+            "in_flight": len(self.pending),
+            "requests": self.requests,
+            "throughput_per_sec": self.requests / uptime if uptime > 0 else 0.0,
+            "mean_latency_ms": (self.busy_seconds / self.requests * 1000.0) if self.requests else None,
+            "rss_mb": self.rss_bytes / (1024 * 1024) if self.rss_bytes is not None else None
+        }
+
+
+class WorkerPool:
+    """
+    Pre-forked pool of inference processes, each running a ModelPredictor.
+
+    The parent prepares the backend once before forking. For TFLite and ONNX
+    that includes reading the model file, so every worker shares one copy of
+    the weights copy-on-write; Keras workers load the model themselves since
+    TensorFlow cannot be forked once initialized. Requests go to the worker
+    with the fewest in flight. A worker that dies fails only the requests it
+    held and is replaced; workers are also replaced after max_requests
+    requests or when their RSS passes max_rss_mb, once they are idle.
+    The initial workers are all forked before any pool thread starts, with
+    the log listener paused; replacements start from a fork server rather
+    than the (by then multi-threaded) parent, so they get their own copy of
+    the weights.
+    """
+
+    def __init__(self, size: int = DEFAULT_POOL_SIZE, max_requests: int = DEFAULT_MAX_REQUESTS,
+                 max_rss_mb: float = DEFAULT_MAX_RSS_MB, path: Optional[str] = None,
+                 backend: Optional[str] = None):
+        self.size = max(size, 1)
+        self.max_requests = max(max_requests, 0)
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024 if max_rss_mb > 0 else None
+        self.path = path or model_path()
+        self.backend_name = backend or MODEL_CONFIG['backend']
+        self.backend = None
+        self.load_error = None
+        # The first workers are forked all at once, before the reader threads start and with
+        # the log listener paused. Replacements are started while those threads (and a server's)
+        # run, so they come from a fork server (or a fresh interpreter) instead: forking a
+        # threaded process can leave the child stuck on a lock another thread held at fork time
+        self._context = multiprocessing.get_context('fork')
+        self._respawn_context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+        self._lock = threading.Lock()
+        self._workers = {}
+        self._next_id = 0
+        self._closed = False
+        self.completed = 0
+        self.restarts = {slot: {"crashed": 0, "recycled": 0, "memory": 0} for slot in range(self.size)}
+
+    def start(self, wait: bool = True) -> "WorkerPool":
+        self.backend = prepare_backend(self.path, self.backend_name, MODEL_CONFIG['threads']).preload()
+        logger.info(f"Starting {self.size} {self.backend.name} workers for {self.backend.path}"
+                    f"{' (weights shared)' if self.backend.model_content is not None else ''}")
+        # Fork every initial worker before starting any thread or logging a record
+        with listener_paused():
+            workers = [self._fork(slot, self._context) for slot in range(self.size)]
+        for worker in workers:
+            self._attach(worker)
+        if self._respawn_context.get_start_method() == 'forkserver':
+            # Start the fork server now, so the first replacement does not wait for it
+            multiprocessing.forkserver.ensure_running()
+        if wait:
+            self.wait_ready()
+        return self
+
+    def wait_ready(self, timeout: Optional[float] = None) -> None:
+        """Block until every worker has loaded the model; raise if one could not"""
+        if self.backend is None:
+            raise RuntimeError(self.load_error or "Worker pool has not been started")
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.ready.wait(timeout)
+            if worker.load_error:
+                raise RuntimeError(worker.load_error)
+
+    def _fork(self, slot: int, context) -> _Worker:
+        """Start one worker process; nothing else (no threads, no logging)"""
+        parent_conn, child_conn = context.Pipe()
+        process = context.Process(target=_worker_main, args=(child_conn, self.backend),
+                                  name=f"tea-worker-{slot}", daemon=True)
+        process.start()
+        child_conn.close()
+        return _Worker(slot, process, parent_conn)
+
+    def _spawn(self, slot: int) -> None:
+        """Start a replacement worker for slot"""
+        self._attach(self._fork(slot, self._respawn_context))
+
+    def _attach(self, worker: _Worker) -> None:
+        """Put a started worker in its slot and begin reading its responses"""
+        slot, process = worker.slot, worker.process
+        with self._lock:
+            self._workers[slot] = worker
+        threading.Thread(target=self._read, args=(worker,), name=f"tea-worker-{slot}-reader", daemon=True).start()
+        logger.info(f"Worker {slot} started (pid {process.pid})")
+
+    def _read(self, worker: _Worker) -> None:
+        """Collect one worker's responses; on exit, fail its pending requests and replace it"""
+        while True:
+            try:
+                request_id, result, rss_bytes = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            worker.rss_bytes = rss_bytes
+            if request_id == _READY:
+                if result is not None:
+                    worker.load_error = result["error"]
+                    self.load_error = worker.load_error
+                worker.ready.set()
+                continue
+
+            with self._lock:
+                future, started = worker.pending.pop(request_id, (None, None))
+                if future is not None:
+                    worker.requests += 1
+                    self.completed += 1
+                    worker.busy_seconds += time.perf_counter() - started
+                self._check_recycle(worker)
+                stop = worker.draining and not worker.pending and not worker.stopping
+                if stop:
+                    worker.stopping = True
+            if future is not None:
+                future.set_result(result)
+            if stop:
+                self._stop(worker)
+
+        worker.process.join()
+        worker.conn.close()
+        worker.ready.set()
+        with self._lock:
+            failed = list(worker.pending.values())
+            worker.pending.clear()
+            # A recycled worker has already been replaced in its slot
+            replaced = self._workers.get(worker.slot) is not worker
+            if not replaced:
+                del self._workers[worker.slot]
+            expected = worker.stopping or self._closed
+            if not expected and worker.load_error is None:
+                self.restarts[worker.slot]["crashed"] += 1
+        if failed:
+            error = f"Worker process exited unexpectedly (exit code {worker.process.exitcode})"
+            for future, _ in failed:
+                future.set_result({"success": False, "error": error})
+        if expected or self._closed or worker.load_error is not None:
+            return
+        logger.error(f"Worker {worker.slot} (pid {worker.process.pid}) exited with code "
+                     f"{worker.process.exitcode}{'' if replaced else ', restarting'}")
+        if not replaced:
+            self._spawn(worker.slot)
+
+    def _check_recycle(self, worker: _Worker) -> None:
+        """Mark a worker for replacement once it hits the request or memory limit (lock held)"""
+        if worker.draining:
+            return
+        reason = None
+        if self.max_requests and worker.requests >= self.max_requests:
+            reason = "recycled"
+        elif self.max_rss_bytes and worker.rss_bytes and worker.rss_bytes > self.max_rss_bytes:
+            reason = "memory"
+        if reason is None:
+            return
+        worker.draining = True
+        self.restarts[worker.slot][reason] += 1
+        logger.info(f"Replacing worker {worker.slot} (pid {worker.process.pid}): {reason} after {worker.requests} requests")
+        # The replacement takes the slot now; the old process finishes what it holds first
+        threading.Thread(target=self._spawn, args=(worker.slot,), daemon=True).start()
+
+    def _stop(self, worker: _Worker) -> None:
+        try:
+            with worker.send_lock:
+                worker.conn.send(None)
+        except (OSError, ValueError):
+            pass
+
+    def _pick(self) -> Optional[_Worker]:
+        """Least-loaded worker that takes new requests, preferring ones that are ready"""
+        candidates = [w for w in self._workers.values() if not w.draining and w.load_error is None]
+        if not candidates:
+            # Every slot is being replaced: a draining worker still answers until it is stopped
+            candidates = [w for w in self._workers.values() if not w.stopping and w.load_error is None]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda w: (not w.ready.is_set(), len(w.pending), w.requests))
+
+    def submit(self, image_data: bytes) -> Future:
+        """Queue one prediction; the future resolves to the ModelPredictor.predict result"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Worker pool is closed")
+            worker = self._pick()
+            if worker is None:
+                future.set_result({"success": False, "error": self.load_error or "No inference worker available"})
+                return future
+            self._next_id += 1
+            request_id = self._next_id
+            worker.pending[request_id] = (future, time.perf_counter())
+        try:
+            with worker.send_lock:
+                worker.conn.send((request_id, image_data))
+        except (OSError, ValueError):
+            # The reader thread fails the request when it sees the worker go away
+            pass
+        return future
+
+    def predict(self, image_data: bytes) -> Dict:
+        return self.submit(image_data).result()
+
+    def get_stats(self) -> Dict:
+        """Per-worker throughput, latency and memory, plus restart counts per slot"""
+        with self._lock:
+            workers = sorted((w for w in self._workers.values() if not w.stopping), key=lambda w: w.slot)
+            described = [w.describe() for w in workers]
+            for info in described:
+                info["restarts"] = dict(self.restarts[info["slot"]])
+            restarts = {reason: sum(r[reason] for r in self.restarts.values()) for reason in ("crashed", "recycled", "memory")}
+        return {
+            "size": self.size,
+            "backend": self.backend.name if self.backend is not None else None,
+            "weights_shared": self.backend is not None and self.backend.model_content is not None,
+            "max_requests": self.max_requests,
+            "max_rss_mb": self.max_rss_bytes / (1024 * 1024) if self.max_rss_bytes else None,
+            "requests": self.completed,
+            "restarts": restarts,
+            "workers": described
+        }
+
+    def close(self, timeout: float = 10.0) -> None:
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers.values())
+        for worker in workers:
+            self._stop(worker)
+        for worker in workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.terminate()